@@ -1,24 +1,47 @@
 # backendSong/app.py
 
-from flask import Flask, jsonify, session, redirect, render_template
+import importlib.util
+import time
+
+from flask import Blueprint, Flask, Response, g, jsonify, session, redirect, render_template, request, send_file, url_for
 from flask_cors import CORS
 
-from config import FLASK_SECRET_KEY, FRONTEND_URL, ALLOWED_ORIGINS as CONFIG_ALLOWED_ORIGINS
-from spotify_auth import spotify_login, spotify_callback
-from spotify_client import (
-    spotify_get,
-    get_user_top_tracks,
-    get_playlist_tracks,
-    search_playlists,
+from config import (
+    FLASK_SECRET_KEY,
+    FRONTEND_URL,
+    ALLOWED_ORIGINS as CONFIG_ALLOWED_ORIGINS,
+    ASYNC_ROUTES,
+    PREVIEW_PROXY_MAX_AGE,
+    DAILY_QUIZ_QUESTIONS,
+    TOP_ARTISTS_LIMIT,
+    ROOM_QUESTIONS,
 )
-from quiz_generator import generate_quiz_from_tracks
-
-app = Flask(__name__)
-app.secret_key = FLASK_SECRET_KEY
-app.config.update(
-    SESSION_COOKIE_SAMESITE="None",
-    SESSION_COOKIE_SECURE=True,
+from spotify_auth import spotify_login, spotify_callback, forget_session_tokens, token_stats
+from spotify_client import (
+    get_current_user,
+    get_user_top_artist_ids,
+    get_user_top_track_records,
+    get_user_top_track_records_async,
+    invalidate_user_cache,
+    user_cache_stats,
 )
+from quiz_generator import generate_quiz_from_tracks, generate_quiz_from_tracks_async, iter_quiz_questions
+from itunes_client import preview_cache_stats
+from circuit_breaker import breaker_stats
+from rate_limiter import limiter_stats
+from global_hits import catalogue as global_hits_catalogue
+from quiz_pool import pool as quiz_pool
+import async_http
+from preview_proxy import store as preview_store, proxy_quiz_audio, proxy_question_audio
+from artist_tracks import store as artist_tracks
+from daily_quiz import store as daily_store, seconds_until_tomorrow, DATED_MAX_AGE
+from rooms import registry as rooms
+import responses
+from responses import revalidated
+import metrics
+from logs import get_logger
+
+log = get_logger("app")
 
 # Allow both Vercel domain spellings plus any env override.
 ALLOWED_ORIGINS = [
@@ -29,49 +52,113 @@ ALLOWED_ORIGINS = [
     *CONFIG_ALLOWED_ORIGINS,
 ]
 
-CORS(
-    app,
-    supports_credentials=True,
-    origins=[o for o in ALLOWED_ORIGINS if o],
+# Every route lives on this blueprint; create_app() puts it on an app.
+routes = Blueprint("routes", __name__)
+
+# Quizzes that are the same for everyone are pre-built in the background,
+# with their previews already downloaded when the preview proxy is on.
+# They are dropped once the catalogue changes (refresh, preview backfill).
+quiz_pool.register(
+    "global-hits",
+    lambda: proxy_quiz_audio(
+        global_hits_catalogue.build_quiz(num_questions=5, options_per_q=4), prefetch=True
+    ),
+    version=lambda: global_hits_catalogue.generation,
 )
+quiz_pool.register(
+    "global-hits-hard",
+    lambda: proxy_quiz_audio(
+        global_hits_catalogue.build_quiz(num_questions=5, options_per_q=4, hard=True), prefetch=True
+    ),
+    version=lambda: global_hits_catalogue.generation,
+)
+# The daily challenge is built once per day, from the same catalogue
+daily_store.register(
+    lambda date, rng: proxy_quiz_audio(
+        global_hits_catalogue.build_quiz(num_questions=DAILY_QUIZ_QUESTIONS, options_per_q=4, rng=rng),
+        prefetch=True,
+    )
+)
+
 
-@app.route("/")
+@metrics.add_collector
+def _collect_gauges():
+    for source, stats in quiz_pool.stats().items():
+        metrics.QUIZ_POOL_DEPTH.set(stats["depth"], source=source)
+    for name, stats in breaker_stats().items():
+        metrics.CIRCUIT_OPEN.set(int(stats["state"] == "open"), upstream=name)
+    room_stats = rooms.stats()
+    for state, count in room_stats["by_state"].items():
+        metrics.ROOMS_OPEN.set(count, state=state)
+    metrics.ROOM_LISTENERS.set(room_stats["listeners"])
+
+
+@routes.before_app_request
+def _start_timer():
+    metrics.ensure_flushing()
+    g.request_started = time.perf_counter()
+
+
+@routes.after_app_request
+def _record_timing(response):
+    # Streamed responses are timed until the response object is returned
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            route=route,
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+def _hard_mode():
+    """?difficulty=hard -> distractors by the same artist / with similar titles."""
+    return request.args.get("difficulty") == "hard"
+
+@routes.route("/")
 def root():
     return render_template("index.html")
 
 
-@app.route("/login")
+@routes.route("/login")
 def login_route():
     return spotify_login()
 
 
-@app.route("/callback")
+@routes.route("/callback")
 def callback_route():
     return spotify_callback()
 
 
-@app.route("/logout")
+@routes.route("/logout")
 def logout_route():
+    invalidate_user_cache(session.get("spotify_user_id"))
+    forget_session_tokens()
     session.clear()
     return redirect(FRONTEND_URL)
 
 
-@app.route("/api/me")
+@routes.route("/api/me")
+@revalidated
 def api_me_route():
-    data = spotify_get("me")
+    data = get_current_user()
     if isinstance(data, tuple):
         body, status = data
         return jsonify(body), status
     return jsonify(data)
 
 
-@app.route("/auth/status")
+@routes.route("/auth/status")
+@revalidated
 def auth_status():
     """
     Used by frontend to show 'Welcome, username' + avatar.
     Never throws, always returns logged_in flag.
     """
-    data = spotify_get("me")
+    data = get_current_user()
 
     if isinstance(data, tuple):
         body, status = data
@@ -93,9 +180,90 @@ def auth_status():
     })
 
 
+@routes.route("/api/status")
+def status_route():
+    """
+    Operational counters (cache sizes, hit/miss ratios, ...) for dashboards.
+    """
+    return jsonify({
+        "preview_cache": preview_cache_stats(),
+        "global_hits": global_hits_catalogue.stats(),
+        "quiz_pool": quiz_pool.stats(),
+        "user_cache": user_cache_stats(),
+        "tokens": token_stats(),
+        "circuit_breakers": breaker_stats(),
+        "rate_limiters": limiter_stats(),
+        "async_io": async_http.stats(),
+        "preview_proxy": preview_store.stats(),
+        "daily_quiz": daily_store.stats(),
+        "artist_tracks": artist_tracks.stats(),
+        "rooms": rooms.stats(),
+    })
+
+
+@routes.route("/metrics")
+def metrics_route():
+    """Request / upstream latencies and cache counters, all workers, Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ---------- AUDIO PREVIEWS ----------
+
+@routes.route("/api/preview/<preview_id>")
+def preview_route(preview_id):
+    """
+    A preview MP3 from the local disk cache (downloaded on first request).
+    Supports Range / If-None-Match; files never change for a given id, so
+    browsers may cache them for good.
+    """
+    path, etag = preview_store.fetch(preview_id)
+    if path is None:
+        error = "preview_not_found" if etag == 404 else "preview_unavailable"
+        return jsonify({"error": error}), etag
+
+    preview_store.served += 1
+    response = send_file(
+        path,
+        mimetype="audio/mpeg",
+        conditional=True,
+        etag=etag,
+        max_age=PREVIEW_PROXY_MAX_AGE,
+    )
+    response.cache_control.immutable = True
+    return response
+
+
 # ---------- QUIZ: YOUR TOP TRACKS ----------
 
-@app.route("/api/quiz/top-tracks")
+def _load_top_tracks():
+    """
+    Fetch the current user's top tracks as Track records.
+    Returns (tracks, None) or (None, error) where error goes into the response.
+    """
+    return _check_top_tracks(get_user_top_track_records(limit=50))
+
+
+async def _load_top_tracks_async():
+    """_load_top_tracks for the async route."""
+    return _check_top_tracks(await get_user_top_track_records_async(limit=50))
+
+
+def _check_top_tracks(tracks):
+    # Error case: spotify_get returned (body, status)
+    if isinstance(tracks, tuple):
+        body, status = tracks
+        log.warning("top_tracks_error", status=status, error=body)
+        return None, body
+
+    if tracks is None:
+        log.warning("top_tracks_unexpected_response")
+        return None, "unexpected_response"
+
+    log.debug("top_tracks_loaded", tracks=len(tracks))
+    return tracks, None
+
+
+@routes.route("/api/quiz/top-tracks")
 def quiz_top_tracks():
     """
     Build a quiz from the current user's top tracks.
@@ -104,113 +272,390 @@ def quiz_top_tracks():
     we return: {"questions": [], "source": "top-tracks", "error": {...optional...}}
     with HTTP 200 so the frontend never breaks.
     """
-    data = get_user_top_tracks(limit=50)
-
-    # Error case: spotify_get returned (body, status)
-    if isinstance(data, tuple):
-        body, status = data
-        print("TOP_TRACKS error:", body)
+    tracks, error = _load_top_tracks()
+    if error is not None:
         return jsonify({
             "questions": [],
             "source": "top-tracks",
-            "error": body
+            "error": error
         }), 200
 
-    if not isinstance(data, dict):
-        print("TOP_TRACKS non-dict response:", data)
+    quiz = generate_quiz_from_tracks(
+        tracks, num_questions=5, options_per_q=4, hard=_hard_mode()
+    )
+    return jsonify(proxy_quiz_audio(quiz))
+
+
+async def quiz_top_tracks_async():
+    """
+    /api/quiz/top-tracks on the async clients (ASYNC_ROUTES=1): the
+    Spotify call and every iTunes fallback share the worker's async
+    connection pool instead of each holding a lookup thread.
+    """
+    tracks, error = await _load_top_tracks_async()
+    if error is not None:
         return jsonify({
             "questions": [],
             "source": "top-tracks",
-            "error": "unexpected_response"
+            "error": error
         }), 200
 
-    items = data.get("items") or []
-    print("TOP_TRACKS items:", len(items))
+    quiz = await generate_quiz_from_tracks_async(
+        tracks, num_questions=5, options_per_q=4, hard=_hard_mode()
+    )
+    return jsonify(proxy_quiz_audio(quiz))
 
-    # Clean tracks: only proper dicts with a name
-    tracks = [
-        t for t in items
-        if isinstance(t, dict) and t.get("name")
-    ]
 
-    quiz = generate_quiz_from_tracks(tracks, num_questions=5, options_per_q=4)
-    return jsonify(quiz)
+@routes.route("/api/quiz/top-tracks/stream")
+def quiz_top_tracks_stream():
+    """
+    Same quiz as /api/quiz/top-tracks, streamed as NDJSON: one
+    {"type": "question", ...} line per question as soon as its audio is
+    settled, then {"type": "done"} (or a single {"type": "error"} line).
+    """
+    tracks, error = _load_top_tracks()
+    if error is not None:
+        return _ndjson_response(iter([{"type": "error", "source": "top-tracks", "error": error}]))
 
+    questions = iter_quiz_questions(
+        tracks, num_questions=5, options_per_q=4, hard=_hard_mode()
+    )
+    return _ndjson_response(_question_events(questions, "top-tracks"))
 
-# ---------- QUIZ: GLOBAL HITS (playlist-based, safe) ----------
 
-@app.route("/api/quiz/global-hits")
-def quiz_global_hits():
-    """
-    Build a quiz from a global/popular playlist.
+def _question_events(questions, source):
+    count = 0
+    for index, question in questions:
+        count += 1
+        yield {"type": "question", "index": index, "question": proxy_question_audio(question)}
+    yield {"type": "done", "source": source, "count": count}
 
-    For any Spotify error, we return {"questions": []} with HTTP 200.
-    """
-    search_terms = ["Top 50 Global", "Today's Top Hits", "Global Top 50"]
-    playlist_id = None
 
-    for term in search_terms:
-        search_data = search_playlists(term, limit=5)
+def _ndjson_response(events):
+    def generate():
+        for event in events:
+            yield responses.dumps(event) + "\n"
 
-        if isinstance(search_data, tuple):
-            body, status = search_data
-            print(f"GLOBAL_HITS search '{term}' error:", body)
-            continue
+    return Response(
+        generate(),
+        mimetype="application/x-ndjson",
+        # Stop proxies (e.g. nginx) from buffering the stream
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
 
-        raw_playlists = (search_data.get("playlists") or {}).get("items") or []
-        print(f"GLOBAL_HITS search '{term}' found {len(raw_playlists)} playlists (raw)")
 
-        playlists = [
-            p for p in raw_playlists
-            if isinstance(p, dict) and p.get("id")
-        ]
-        print(f"GLOBAL_HITS usable playlists for '{term}': {len(playlists)}")
+# ---------- QUIZ: YOUR TOP ARTISTS ----------
 
-        if playlists:
-            playlist_id = playlists[0]["id"]
-            print("GLOBAL_HITS using playlist:", term, "->", playlist_id)
-            break
+def _load_top_artist_tracks():
+    """
+    The top tracks of the current user's top artists, merged into one
+    pool. Artist top tracks come from the shared store (artist_tracks.py),
+    so this is one cached /me/top/artists call plus at most one round of
+    parallel fetches for artists nobody has asked about recently.
+    Returns (tracks, None) or (None, error) like _load_top_tracks.
+    """
+    artist_ids = get_user_top_artist_ids(limit=TOP_ARTISTS_LIMIT)
+    if isinstance(artist_ids, tuple):
+        body, status = artist_ids
+        log.warning("top_artists_error", status=status, error=body)
+        return None, body
 
-    if not playlist_id:
-        print("GLOBAL_HITS: no suitable playlist found from search.")
-        return jsonify({
-            "questions": [],
-            "source": "global-hits",
-            "error": "no_playlist_found"
-        }), 200
+    if artist_ids is None:
+        log.warning("top_artists_unexpected_response")
+        return None, "unexpected_response"
+    if not artist_ids:
+        return None, "no_top_artists"
 
-    # Fetch tracks from the chosen playlist
-    data = get_playlist_tracks(playlist_id, limit=50)
+    tracks = artist_tracks.get_pool(artist_ids)
+    if not tracks:
+        return None, "no_artist_tracks"
 
-    if isinstance(data, tuple):
-        body, status = data
-        print("GLOBAL_HITS playlist error:", body)
+    log.debug("top_artist_tracks_loaded", artists=len(artist_ids), tracks=len(tracks))
+    return tracks, None
+
+
+@routes.route("/api/quiz/top-artists")
+def quiz_top_artists():
+    """
+    Build a quiz from the top tracks of the current user's top artists.
+    Errors are reported like /api/quiz/top-tracks (HTTP 200, no questions).
+    """
+    tracks, error = _load_top_artist_tracks()
+    if error is not None:
         return jsonify({
             "questions": [],
-            "source": "global-hits",
-            "error": body
+            "source": "top-artists",
+            "error": error
         }), 200
 
-    if not isinstance(data, dict):
-        print("GLOBAL_HITS non-dict playlist response:", data)
+    quiz = generate_quiz_from_tracks(
+        tracks, num_questions=5, options_per_q=4, hard=_hard_mode()
+    )
+    return jsonify(proxy_quiz_audio(quiz))
+
+
+@routes.route("/api/quiz/top-artists/stream")
+def quiz_top_artists_stream():
+    """NDJSON variant of /api/quiz/top-artists (see /api/quiz/top-tracks/stream)."""
+    tracks, error = _load_top_artist_tracks()
+    if error is not None:
+        return _ndjson_response(iter([{"type": "error", "source": "top-artists", "error": error}]))
+
+    questions = iter_quiz_questions(
+        tracks, num_questions=5, options_per_q=4, hard=_hard_mode()
+    )
+    return _ndjson_response(_question_events(questions, "top-artists"))
+
+
+# ---------- QUIZ: GLOBAL HITS (playlist-based, safe) ----------
+
+def _global_hits_error():
+    """
+    Why there is no global-hits quiz: the last refresh's error, or
+    "warming_up" while the catalogue is still loading.
+    """
+    return global_hits_catalogue.last_error or "warming_up"
+
+
+@routes.route("/api/quiz/global-hits")
+def quiz_global_hits():
+    """
+    Build a quiz from a global/popular playlist.
+
+    The playlist and its previews come from the shared, background-refreshed
+    catalogue (see global_hits.py), and ready quizzes are popped from the
+    quiz pool (see quiz_pool.py), so this normally does no work at all.
+    For any Spotify error, we return {"questions": []} with HTTP 200.
+    """
+    quiz = quiz_pool.get("global-hits-hard" if _hard_mode() else "global-hits")
+
+    if quiz is None:
         return jsonify({
             "questions": [],
             "source": "global-hits",
-            "error": "unexpected_playlist_response"
+            "error": _global_hits_error(),
         }), 200
 
-    items = (data.get("items") or [])
-    print("GLOBAL_HITS items:", len(items))
+    return jsonify(proxy_quiz_audio(quiz))
 
-    tracks = [
-        it.get("track")
-        for it in items
-        if isinstance(it, dict) and it.get("track")
-    ]
 
-    quiz = generate_quiz_from_tracks(tracks, num_questions=5, options_per_q=4)
-    return jsonify(quiz)
+@routes.route("/api/quiz/global-hits/stream")
+def quiz_global_hits_stream():
+    """
+    NDJSON variant of /api/quiz/global-hits for clients that use the
+    streaming protocol. Pooled quizzes are already complete, so every
+    question is sent at once.
+    """
+    quiz = quiz_pool.get("global-hits-hard" if _hard_mode() else "global-hits")
+
+    if quiz is None:
+        error = _global_hits_error()
+        return _ndjson_response(iter([{"type": "error", "source": "global-hits", "error": error}]))
+
+    return _ndjson_response(_question_events(enumerate(quiz["questions"]), "global-hits"))
+
+
+# ---------- QUIZ: DAILY CHALLENGE ----------
+
+@routes.route("/api/quiz/daily")
+@routes.route("/api/quiz/daily/<date>")
+def quiz_daily(date=None):
+    """
+    The same quiz for everyone for a whole (UTC) day, served from a static
+    file with an ETag, so browsers and CDNs can cache it: /api/quiz/daily
+    until midnight, /api/quiz/daily/<YYYY-MM-DD> for good.
+    """
+    path, etag = daily_store.get(date)
+    if path is None:
+        error = "daily_quiz_not_found" if etag == 404 else "daily_quiz_unavailable"
+        return jsonify({"questions": [], "source": "daily", "error": error}), etag
+
+    response = send_file(
+        path,
+        mimetype="application/json",
+        conditional=True,
+        etag=etag,
+        max_age=seconds_until_tomorrow() if date is None else DATED_MAX_AGE,
+    )
+    if date is not None:
+        response.cache_control.immutable = True
+    return response
+
+
+# ---------- MULTIPLAYER ROOMS ----------
+
+def _room_option(name):
+    """A room option from the JSON body or the query string."""
+    body = request.get_json(silent=True)
+    value = body.get(name) if isinstance(body, dict) else None
+    return value if value is not None else request.args.get(name)
+
+
+def _build_room_quiz(source, hard):
+    """
+    The one quiz a room plays, built by the host's request.
+    Returns (quiz, None) or (None, error) like _load_top_tracks.
+    """
+    if source == "top-tracks":
+        tracks, error = _load_top_tracks()
+        if error is not None:
+            return None, error
+        quiz = generate_quiz_from_tracks(
+            tracks, num_questions=ROOM_QUESTIONS, options_per_q=4, hard=hard
+        )
+    elif source == "global-hits":
+        quiz = global_hits_catalogue.build_quiz(
+            num_questions=ROOM_QUESTIONS, options_per_q=4, hard=hard
+        )
+        if quiz is None:
+            return None, _global_hits_error()
+    else:
+        return None, "unknown_source"
+
+    if not quiz or not quiz.get("questions"):
+        return None, "no_questions"
+    return proxy_quiz_audio(quiz, prefetch=True), None
+
+
+@routes.route("/api/rooms", methods=["POST"])
+def create_room():
+    """
+    Host a multiplayer room: {"source": "top-tracks" | "global-hits",
+    "difficulty": "hard"?}. The quiz is built here, once, for every player.
+    Returns the room and the host token that /start needs.
+    """
+    source = _room_option("source") or "global-hits"
+    quiz, error = _build_room_quiz(source, _room_option("difficulty") == "hard")
+    if error is not None:
+        status = 400 if error == "unknown_source" else 503
+        return jsonify({"source": source, "error": error}), status
+
+    room, host_token = rooms.create(source, quiz)
+    if room is None:
+        return jsonify({"source": source, "error": "too_many_rooms"}), 503
+    return jsonify({"room": room.info(), "host_token": host_token}), 201
+
+
+@routes.route("/api/rooms/<room_id>")
+def room_info(room_id):
+    room = rooms.get(room_id)
+    if room is None:
+        return jsonify({"error": "room_not_found"}), 404
+    return jsonify(room.info())
+
+
+@routes.route("/api/rooms/<room_id>/start", methods=["POST"])
+def start_room(room_id):
+    """Start the countdown (host only: X-Room-Token header or "host_token")."""
+    room = rooms.get(room_id)
+    if room is None:
+        return jsonify({"error": "room_not_found"}), 404
+    if not room.is_host(request.headers.get("X-Room-Token") or _room_option("host_token")):
+        return jsonify({"error": "not_room_host"}), 403
+    if not room.start():
+        return jsonify({"error": "room_already_started"}), 409
+    return jsonify(room.info())
+
+
+@routes.route("/api/rooms/<room_id>/events")
+def room_events(room_id):
+    """
+    The room as Server-Sent Events (for EventSource): "room" on connect,
+    then "start", "question" / "reveal" per question, and "end", each
+    sent when it is due. Reconnects resume after Last-Event-ID; once a
+    client has seen "end" it gets 204, which stops EventSource retrying.
+    When this worker has no stream to spare (thread workers), 503 with
+    "poll": the client should follow the room from that URL instead.
+    """
+    room = rooms.get(room_id)
+    if room is None:
+        return jsonify({"error": "room_not_found"}), 404
+
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0)
+    except ValueError:
+        last_id = 0
+    if room.finished_for(last_id):
+        return "", 204
+
+    stream, error = rooms.open_stream(room, last_id)
+    if error == "streams_busy":
+        poll = url_for("routes.room_poll", room_id=room.id, after=last_id)
+        return jsonify({"error": error, "poll": poll}), 503, {"Retry-After": "5"}
+    if error is not None:
+        return jsonify({"error": error}), 503
+
+    return Response(
+        stream,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@routes.route("/api/rooms/<room_id>/poll")
+def room_poll(room_id):
+    """
+    The room's events after ?after=N (the last id seen) that are due now,
+    and "next_in": seconds until the next one may be (null after "end").
+    For clients that cannot, or are asked not to, keep a stream open.
+    """
+    room = rooms.get(room_id)
+    if room is None:
+        return jsonify({"error": "room_not_found"}), 404
+    after = request.args.get("after", default=0, type=int)
+    response = jsonify(rooms.poll(room, after))
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+# ---------- APP FACTORY ----------
+
+def create_app():
+    """
+    Build the Flask app. Caches, pools and the global-hits catalogue are
+    module-level singletons shared by every app in the process, so under
+    gunicorn's preload_app (gunicorn.conf.py) the master sets them up, and
+    loads the warm-start snapshot into them, once for all workers.
+    """
+    app = Flask(__name__)
+    app.secret_key = FLASK_SECRET_KEY
+    app.config.update(
+        SESSION_COOKIE_SAMESITE="None",
+        SESSION_COOKIE_SECURE=True,
+    )
+    app.json = responses.FastJSONProvider(app)
+    # Registered first, so it runs after every other after_request hook
+    app.after_request(responses.compress_response)
+
+    CORS(
+        app,
+        supports_credentials=True,
+        origins=[o for o in ALLOWED_ORIGINS if o],
+        # The frontend revalidates with If-None-Match, so it needs to read
+        # ETags; cache the preflight that header triggers
+        expose_headers=["ETag"],
+        max_age=86400,
+    )
+
+    app.register_blueprint(routes)
+
+    if ASYNC_ROUTES:
+        # Flask needs asgiref (flask[async]) for async views, we need httpx
+        if async_http.available() and importlib.util.find_spec("asgiref") is not None:
+            app.view_functions["routes.quiz_top_tracks"] = quiz_top_tracks_async
+        else:
+            log.warning("async_routes_unavailable", reason="httpx / flask[async] not installed")
+
+    return app
+
+
+def __getattr__(name):
+    # `gunicorn app:app` and `python app.py` still work: built on first use
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
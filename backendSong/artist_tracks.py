@@ -0,0 +1,160 @@
+# backendSong/artist_tracks.py
+
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from config import (
+    ARTIST_TRACKS_TTL,
+    ARTIST_TRACKS_EMPTY_TTL,
+    ARTIST_TRACKS_CACHE_PATH,
+    ARTIST_TRACKS_SHARED_SIZE,
+    ARTIST_TRACKS_CACHE_SIZE,
+    ARTIST_FANOUT_CONCURRENCY,
+    ARTIST_FANOUT_DEADLINE,
+)
+from preview_cache import MISS, MemoryLRUCache, SQLiteCache, TieredCache
+from singleflight import SingleFlight
+from spotify_auth import get_app_token
+from spotify_client import get_artist_top_track_records
+from track import Track
+from logs import get_logger
+
+log = get_logger("artist_tracks")
+
+
+def _fetch_with_app_token(artist_id):
+    # Artist top tracks are the same for everyone: use the app token, so
+    # fetches can run outside the request and be shared by all users.
+    token = get_app_token()
+    if not token:
+        return {"error": "app_token_unavailable"}, 503
+    return get_artist_top_track_records(artist_id, token=token)
+
+
+class ArtistTracksStore:
+    """
+    Artist id -> that artist's top tracks, shared by every user.
+
+    Entries are stored as Track rows (Track.to_row), in an in-process LRU
+    in front of a host-wide SQLite file. Missing artists are fetched on a
+    small per-process pool, so a quiz costs at most one round of parallel
+    Spotify calls no matter how many artists it needs, and concurrent
+    quizzes wanting the same artist share one fetch.
+    """
+
+    def __init__(self, backend, fetch=_fetch_with_app_token, ttl=ARTIST_TRACKS_TTL,
+                 empty_ttl=ARTIST_TRACKS_EMPTY_TTL, concurrency=ARTIST_FANOUT_CONCURRENCY):
+        self.backend = backend
+        self.fetch = fetch
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="artist-tracks")
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.fetched = 0
+        self.failures = 0
+        self.late = 0
+
+    @staticmethod
+    def _key(artist_id):
+        return f"artist-top:{artist_id}"
+
+    def get_many(self, artist_ids, deadline=ARTIST_FANOUT_DEADLINE):
+        """
+        {artist_id: [Track]} for the given artists. Cached artists are
+        returned as-is; the rest are fetched in parallel, waiting at most
+        `deadline` seconds. Artists that fail or are still in flight are
+        left out (late results are still cached for the next quiz).
+        """
+        found, missing = {}, []
+        for artist_id in dict.fromkeys(artist_ids):
+            rows = self.backend.get(self._key(artist_id))
+            if rows is MISS:
+                missing.append(artist_id)
+            else:
+                found[artist_id] = [Track.from_row(row) for row in rows]
+        with self._lock:
+            self.hits += len(found)
+
+        if missing:
+            futures = {
+                self._executor.submit(self._flight.do, artist_id, self._fetch_one, artist_id): artist_id
+                for artist_id in missing
+            }
+            done, not_done = wait(futures, timeout=deadline)
+            for future in done:
+                try:
+                    tracks = future.result()
+                except Exception:
+                    log.exception("artist_tracks_fetch_failed", artist=futures[future])
+                    continue
+                if tracks is not None:
+                    found[futures[future]] = tracks
+            if not_done:
+                with self._lock:
+                    self.late += len(not_done)
+                log.info("artist_tracks_deadline", waiting=len(not_done), deadline=deadline)
+
+        return found
+
+    def get_pool(self, artist_ids, deadline=ARTIST_FANOUT_DEADLINE):
+        """All top tracks of the given artists, in artist order, without duplicates."""
+        by_artist = self.get_many(artist_ids, deadline)
+        pool, seen = [], set()
+        for artist_id in artist_ids:
+            for track in by_artist.get(artist_id, ()):
+                if track.id not in seen:
+                    seen.add(track.id)
+                    pool.append(track)
+        return pool
+
+    def _fetch_one(self, artist_id):
+        tracks = self.fetch(artist_id)
+        if tracks is None or isinstance(tracks, tuple):
+            # Errors are not cached: the next quiz tries again
+            with self._lock:
+                self.failures += 1
+            return None
+        self.backend.set(
+            self._key(artist_id),
+            [t.to_row() for t in tracks],
+            self.ttl if tracks else self.empty_ttl,
+        )
+        with self._lock:
+            self.fetched += 1
+        return tracks
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "fetched": self.fetched,
+            "failures": self.failures,
+            "late": self.late,
+            "coalesced": self._flight.coalesced,
+            "backend": self.backend.stats(),
+        }
+
+
+def build_artist_tracks_store():
+    """
+    Build the store from config: always an in-process LRU, backed by a
+    host-wide SQLite file when ARTIST_TRACKS_CACHE_PATH is set.
+    """
+    local = MemoryLRUCache(maxsize=ARTIST_TRACKS_CACHE_SIZE)
+    if not ARTIST_TRACKS_CACHE_PATH:
+        return ArtistTracksStore(local)
+
+    try:
+        shared = SQLiteCache(ARTIST_TRACKS_CACHE_PATH, max_rows=ARTIST_TRACKS_SHARED_SIZE or None)
+    except (sqlite3.Error, OSError) as e:
+        log.warning("artist_tracks_sqlite_unavailable", error=str(e))
+        return ArtistTracksStore(local)
+
+    return ArtistTracksStore(TieredCache(local, shared))
+
+
+# Shared by every request in this worker process
+store = build_artist_tracks_store()
@@ -0,0 +1,222 @@
+# backendSong/async_http.py
+
+import asyncio
+import importlib.util
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# Optional (only the async clients need it) and slow to import, so it is
+# only imported once the first async request is made.
+httpx = None
+_HTTPX_INSTALLED = importlib.util.find_spec("httpx") is not None
+
+from config import (
+    HTTP_POOL_MAXSIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_MAX_RETRY_AFTER,
+    ASYNC_SPOTIFY_CONCURRENCY,
+    ASYNC_ITUNES_CONCURRENCY,
+    SPOTIFY_API_BASE,
+    ITUNES_SEARCH_URL,
+)
+
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# host -> max concurrent requests from this worker (others: HTTP_POOL_MAXSIZE)
+_HOST_LIMITS = {
+    urlsplit(SPOTIFY_API_BASE).hostname: ASYNC_SPOTIFY_CONCURRENCY,
+    urlsplit(ITUNES_SEARCH_URL).hostname: ASYNC_ITUNES_CONCURRENCY,
+}
+
+
+def available():
+    """True if httpx is installed, i.e. the async clients can be used."""
+    return _HTTPX_INSTALLED
+
+
+def _import_httpx():
+    global httpx
+    if httpx is None:
+        import httpx as module
+        httpx = module
+    return httpx
+
+
+def __getattr__(name):
+    # HTTPError: what get() raises when no response could be had at all
+    if name == "HTTPError":
+        return _import_httpx().HTTPError if _HTTPX_INSTALLED else OSError
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _IOLoop:
+    """
+    One event loop per worker process, on its own daemon thread, owning the
+    shared httpx client and the per-host semaphores.
+
+    Callers on any thread or event loop (Flask runs each async view in a
+    fresh loop) hand coroutines to it with run(), so every request in the
+    worker shares one connection pool and one set of host limits.
+    Started lazily, and again after a fork.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._client = None
+        self._semaphores = {}
+
+    def loop(self):
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="async-io", daemon=True
+                )
+                thread.start()
+                self._loop, self._pid = loop, os.getpid()
+                self._client = None
+                self._semaphores = {}
+        return self._loop
+
+    def client(self):
+        # Only called on the I/O loop, so no locking needed
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=sum(_HOST_LIMITS.values()) + HTTP_POOL_MAXSIZE,
+                    max_keepalive_connections=HTTP_POOL_MAXSIZE,
+                ),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def semaphore(self, host):
+        sem = self._semaphores.get(host)
+        if sem is None:
+            sem = self._semaphores[host] = asyncio.Semaphore(
+                _HOST_LIMITS.get(host, HTTP_POOL_MAXSIZE)
+            )
+        return sem
+
+    def stats(self):
+        return {
+            "running": self._loop is not None and self._pid == os.getpid(),
+            "hosts": {
+                host: {"limit": _HOST_LIMITS.get(host, HTTP_POOL_MAXSIZE), "available": sem._value}
+                for host, sem in self._semaphores.items()
+            },
+        }
+
+
+_IO = _IOLoop()
+
+
+def on_io_loop():
+    """True when called from a coroutine running on the shared I/O loop."""
+    try:
+        return asyncio.get_running_loop() is _IO._loop
+    except RuntimeError:
+        return False
+
+
+async def run(coro):
+    """
+    Await `coro` on the shared I/O loop from any event loop. If the caller
+    stops waiting (e.g. a deadline passed), the coroutine keeps running
+    there, so late results still land in the caches.
+    """
+    if on_io_loop():
+        return await coro
+
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+
+    def relay(fut):
+        def copy():
+            if waiter.done():
+                return  # the caller gave up
+            if fut.cancelled():
+                waiter.cancel()
+            elif fut.exception() is not None:
+                waiter.set_exception(fut.exception())
+            else:
+                waiter.set_result(fut.result())
+        try:
+            loop.call_soon_threadsafe(copy)
+        except RuntimeError:
+            pass  # the caller's loop is already closed
+
+    asyncio.run_coroutine_threadsafe(coro, _IO.loop()).add_done_callback(relay)
+    return await waiter
+
+
+def _retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+async def get(host, url, params=None, headers=None, read_timeout=5, retries=HTTP_MAX_RETRIES):
+    """
+    GET through the shared async client, at most the host's concurrency
+    limit at a time. Same retry policy as http_session: connection errors,
+    429 and 5xx are retried with jittered backoff, honouring Retry-After up
+    to HTTP_MAX_RETRY_AFTER; the last response is returned as-is.
+
+    Raises httpx.HTTPError when every attempt failed without a response.
+    """
+    if not _HTTPX_INSTALLED:
+        raise RuntimeError("httpx is not installed")
+    _import_httpx()
+    return await run(_get(host, url, params, headers, read_timeout, retries))
+
+
+async def _get(host, url, params, headers, read_timeout, retries):
+    client = _IO.client()
+    request_timeout = httpx.Timeout(read_timeout, connect=HTTP_CONNECT_TIMEOUT)
+
+    attempt = 0
+    while True:
+        async with _IO.semaphore(host):
+            try:
+                response = await client.get(url, params=params, headers=headers, timeout=request_timeout)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+                response = None
+
+        if response is not None and (response.status_code not in _RETRY_STATUSES or attempt >= retries):
+            return response
+
+        delay = HTTP_BACKOFF_FACTOR * (2 ** attempt) + random.uniform(0, HTTP_BACKOFF_FACTOR)
+        if response is not None:
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                if retry_after > HTTP_MAX_RETRY_AFTER:
+                    # Too long to wait inline: let the caller see the 429
+                    return response
+                delay = retry_after
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def stats():
+    return dict(_IO.stats(), httpx=available())
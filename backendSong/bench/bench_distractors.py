@@ -0,0 +1,73 @@
+# backendSong/bench/bench_distractors.py
+#
+# Microbenchmark: distractor selection cost vs. track pool size.
+#
+#   python bench/bench_distractors.py            (from backendSong/)
+#
+# "copy+shuffle" is the old per-question approach (filter the whole title
+# list, shuffle it, take k); "sampler" is DistractorSampler.sample(), with
+# its one-off build cost reported separately.
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from distractors import DistractorSampler  # noqa: E402
+from track import Track  # noqa: E402
+
+POOL_SIZES = [50, 500, 5000, 50000]
+K = 3
+QUESTIONS = 200
+
+
+def make_tracks(n, rng):
+    return [
+        Track(f"id{i}", f"Song {i} {rng.choice(['love', 'night', 'fire', 'home'])}", (f"Artist {i % 97}",))
+        for i in range(n)
+    ]
+
+
+def old_distractors(all_titles, name, k):
+    other_titles = [t for t in all_titles if t != name]
+    random.shuffle(other_titles)
+    return other_titles[:k]
+
+
+def measure(n, rng):
+    """Per-question (us) and per-pool build (ms) timings for one pool size."""
+    tracks = make_tracks(n, rng)
+    titles = [t.name for t in tracks]
+    names = [rng.choice(titles) for _ in range(QUESTIONS)]
+
+    reps = max(1, 2000 // n)
+    old = timeit.timeit(lambda: [old_distractors(titles, x, K) for x in names], number=reps)
+    build = timeit.timeit(lambda: DistractorSampler(tracks), number=reps)
+    sampler = DistractorSampler(tracks)
+    new = timeit.timeit(lambda: [sampler.sample(x, K, rng) for x in names], number=reps * 10)
+    hard = timeit.timeit(lambda: [sampler.sample(x, K, rng, hard=True) for x in names], number=reps * 10)
+
+    per_q = QUESTIONS * reps
+    return {
+        "copy_shuffle_us": old / per_q * 1e6,
+        "sampler_us": new / (per_q * 10) * 1e6,
+        "sampler_hard_us": hard / (per_q * 10) * 1e6,
+        "build_ms": build / reps * 1e3,
+    }
+
+
+def main():
+    rng = random.Random(1234)
+    print(f"{'pool':>7} {'copy+shuffle':>14} {'sampler':>10} {'hard':>10} {'build':>10}   (per question / per pool)")
+    for n in POOL_SIZES:
+        r = measure(n, rng)
+        print(
+            f"{n:>7} {r['copy_shuffle_us']:>12.1f}us {r['sampler_us']:>8.1f}us "
+            f"{r['sampler_hard_us']:>8.1f}us {r['build_ms']:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# backendSong/bench/coldstart.py
+#
+# Startup cost, with and without a warm-start snapshot (snapshot.py):
+#
+#   python bench/coldstart.py --out bench/results/coldstart.json --latency 80
+#
+# - import/app: time for `import app; app.create_app()` in a fresh
+#   interpreter
+# - <scenario>: gunicorn with gunicorn.conf.py (preloading master) from an
+#   empty CACHE_DIR; boot_ms is spawn -> first answered request, then the
+#   latency and upstream calls of each worker's first global-hits quiz and
+#   of a user's first top-tracks quiz. "cold" has nothing else, "snapshot"
+#   loads a snapshot saved from a warmed-up instance beforehand.
+#
+# Every scenario is run --runs times; numbers are medians.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import BACKEND_DIR, write_results  # noqa: E402
+from fake_upstreams import FakeServer, add_fault_arguments, upstreams_from_args  # noqa: E402
+from load import AppServer  # noqa: E402
+
+CONFIG = ["-c", "gunicorn.conf.py"]
+
+
+def _log_path(name):
+    return os.path.join(tempfile.gettempdir(), f"trackguessr-coldstart-{name}.log")
+
+
+def measure_import(runs):
+    code = "import time; t = time.perf_counter(); import app; app.create_app(); print(time.perf_counter() - t)"
+    times = []
+    for _ in range(runs):
+        env = dict(os.environ, CACHE_DIR=tempfile.mkdtemp(prefix="trackguessr-coldstart-"))
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return {"import_ms": round(1000 * statistics.median(times), 1)}
+
+
+def make_snapshot(fake, args, path):
+    """Warm an instance up like real traffic would, then save its caches."""
+    app = AppServer(args.worker_class, 1, args.threads, fake.env(), _log_path("warmup"), CONFIG)
+    try:
+        app.wait_ready()
+        cookies = [app.login(f"coldstart-user-{i}") for i in range(args.users)]
+        state = os.path.join(app.cache_dir, "global-hits.json")
+        deadline = time.time() + 60
+        while not os.path.exists(state):
+            if time.time() > deadline:
+                raise RuntimeError("global-hits pool never loaded during warm-up")
+            requests.get(app.base + "/api/quiz/global-hits", timeout=60)
+        for cookie in cookies:
+            requests.get(app.base + "/api/quiz/top-tracks", headers={"Cookie": cookie}, timeout=60)
+
+        env = dict(os.environ, CACHE_DIR=app.cache_dir)
+        subprocess.run(
+            [sys.executable, "snapshot.py", "save", "--path", path], cwd=BACKEND_DIR, env=env, check=True
+        )
+    finally:
+        app.stop()
+
+
+def run_once(fake, args, snapshot_path):
+    extra_env = {"WARM_SNAPSHOT_PATH": snapshot_path} if snapshot_path else None
+    started = time.perf_counter()
+    app = AppServer(args.worker_class, args.workers, args.threads, fake.env(),
+                    _log_path("run"), CONFIG, extra_env)
+    try:
+        app.wait_ready()
+        result = {"boot_ms": 1000 * (time.perf_counter() - started)}
+
+        # One request per worker; each worker is a separate cold process
+        fake.upstreams.reset_counts()
+        first = []
+        for _ in range(args.workers):
+            t0 = time.perf_counter()
+            requests.get(app.base + "/api/quiz/global-hits", timeout=60)
+            first.append(time.perf_counter() - t0)
+        result["first_global_hits_ms"] = 1000 * max(first)
+        result["global_hits_upstream_calls"] = sum(fake.upstreams.reset_counts().values())
+
+        cookie = app.login("coldstart-user-0")
+        fake.upstreams.reset_counts()
+        t0 = time.perf_counter()
+        requests.get(app.base + "/api/quiz/top-tracks", headers={"Cookie": cookie}, timeout=60)
+        result["first_top_tracks_ms"] = 1000 * (time.perf_counter() - t0)
+        result["top_tracks_upstream_calls"] = sum(fake.upstreams.reset_counts().values())
+        return result
+    finally:
+        app.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrackGuessr cold-start benchmark")
+    parser.add_argument("--out", default="-", help="result file (default: stdout)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--worker-class", default="gthread", choices=("sync", "gthread"))
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gthread worker")
+    parser.add_argument("--users", type=int, default=5, help="users whose quizzes warm the snapshot")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    results = {"import/app": measure_import(args.runs)}
+    fake = FakeServer(upstreams_from_args(args)).start()
+    try:
+        snapshot_path = os.path.join(tempfile.mkdtemp(prefix="trackguessr-coldstart-"), "warm.json.gz")
+        make_snapshot(fake, args, snapshot_path)
+
+        for scenario, path in (("cold", None), ("snapshot", snapshot_path)):
+            runs = [run_once(fake, args, path) for _ in range(args.runs)]
+            results[scenario] = {
+                field: round(statistics.median(r[field] for r in runs), 1) for field in runs[0]
+            }
+            print(f"{scenario:>8} {results[scenario]}")
+    finally:
+        fake.stop()
+
+    params = {k: v for k, v in vars(args).items() if k != "out"}
+    write_results(args.out, "coldstart", params, results)
+
+
+if __name__ == "__main__":
+    main()
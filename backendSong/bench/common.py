@@ -0,0 +1,82 @@
+# backendSong/bench/common.py
+#
+# Helpers shared by the benchmark scripts: latency summaries and the JSON
+# result files that bench/compare.py diffs between commits.
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def use_backend_modules():
+    """Make the backend's flat modules importable (scripts run from anywhere)."""
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list (p in 0..100)."""
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values), max(1, math.ceil(p / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(seconds):
+    """p50 / p95 / p99 / max in milliseconds for a list of durations."""
+    values = sorted(seconds)
+    summary = {"count": len(values)}
+    for name, p in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99), ("max_ms", 100)):
+        value = percentile(values, p)
+        summary[name] = round(value * 1000, 3) if value is not None else None
+    return summary
+
+
+def _git(*args):
+    try:
+        out = subprocess.run(
+            ["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() if out.returncode == 0 else None
+
+
+def environment():
+    """What a result was measured on, so runs can be compared fairly."""
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def write_results(path, suite, params, results):
+    """
+    Write {"suite", "environment", "params", "results"} to `path` (or
+    stdout for "-"). `results` maps a case name to a flat dict of numbers.
+    """
+    doc = {
+        "suite": suite,
+        "environment": environment(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(doc, indent=2, sort_keys=True)
+    if path == "-":
+        print(text)
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text + "\n")
+    print(f"results written to {path}")
@@ -0,0 +1,64 @@
+# backendSong/bench/compare.py
+#
+# Diff two result files from microbench.py / load.py (e.g. from two
+# commits) and flag regressions:
+#
+#   python bench/compare.py before.json after.json --threshold 0.10 --fail
+#
+# Lower is better for times, errors and upstream calls; higher is better
+# for throughput. Only cases and numeric fields present in both files are
+# compared.
+
+import argparse
+import json
+import sys
+
+# Fields where a bigger number is an improvement
+HIGHER_IS_BETTER = ("throughput_rps", "requests")
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(old, new, threshold):
+    """[(case, field, old, new, relative change, verdict)] for shared numeric fields."""
+    rows = []
+    for case in sorted(set(old["results"]) & set(new["results"])):
+        before, after = old["results"][case], new["results"][case]
+        for field in sorted(set(before) & set(after)):
+            a, b = before[field], after[field]
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+                continue
+            change = (b - a) / a if a else (0.0 if b == a else float("inf"))
+            worse = -change if field in HIGHER_IS_BETTER else change
+            verdict = "REGRESSION" if worse > threshold else ("improved" if worse < -threshold else "")
+            rows.append((case, field, a, b, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts (0.10 = 10%%)")
+    parser.add_argument("--fail", action="store_true", help="exit 1 if anything regressed")
+    args = parser.parse_args()
+
+    old, new = _load(args.old), _load(args.new)
+    if old.get("suite") != new.get("suite"):
+        parser.error(f"different suites: {old.get('suite')} vs {new.get('suite')}")
+
+    print(f"old: {old['environment'].get('commit')}  new: {new['environment'].get('commit')}")
+    regressions = 0
+    for case, field, a, b, change, verdict in compare(old, new, args.threshold):
+        regressions += verdict == "REGRESSION"
+        print(f"{case:<28} {field:<28} {a:>12g} {b:>12g} {change:>+8.1%}  {verdict}")
+
+    if args.fail and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
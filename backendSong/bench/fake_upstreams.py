@@ -0,0 +1,361 @@
+# backendSong/bench/fake_upstreams.py
+#
+# Local stand-ins for the Spotify Web API, Spotify accounts service and
+# iTunes Search, so benchmarks never touch the real services.
+#
+#   python bench/fake_upstreams.py --port 8900 --latency 40 --error-rate 0.01
+#
+# then start the app with
+#
+#   SPOTIFY_API_BASE=http://127.0.0.1:8900/v1 \
+#   SPOTIFY_ACCOUNTS_BASE=http://127.0.0.1:8900 \
+#   ITUNES_SEARCH_URL=http://127.0.0.1:8900/itunes/search  gunicorn app:app
+#
+# (bench/load.py does all of this for you.)
+#
+# Payloads come from a fixture file (--fixtures): a recorded Spotify
+# response holding track objects (/me/top/tracks or /playlists/<id>/tracks),
+# optionally with an "itunes" map of search term -> recorded results.
+# Without one, a deterministic catalogue in the same shape is generated.
+# Every request can be delayed (--latency / --jitter, in ms), failed with a
+# 503 (--error-rate) or throttled with a 429 + Retry-After (--throttle-rate).
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+PLAYLIST_ID = "benchglobalhits"
+
+_WORDS = [
+    "love", "night", "fire", "home", "dance", "heart", "summer", "light", "river", "gold",
+    "dream", "city", "rain", "stars", "wild", "blue", "tonight", "forever", "ocean", "echo",
+]
+_DECORATIONS = ["", "", "", "", " - Remastered 2011", " (feat. Guest {n})", " (Radio Edit)", " - Live"]
+
+
+class Faults:
+    """Latency and failure injection for one fake upstream."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """(delay seconds, None | 429 | 503) for the next request."""
+        with self._lock:
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 503
+        return delay, None
+
+
+def generate_catalogue(size=500, seed=7):
+    """Spotify-shaped track objects; about 40% have no preview_url."""
+    rng = random.Random(seed)
+    artists = [f"Bench Artist {i}" for i in range(max(1, size // 8))]
+    tracks = []
+    for i in range(size):
+        words = " ".join(w.capitalize() for w in rng.sample(_WORDS, rng.randint(1, 3)))
+        name = f"{words} {i}" + rng.choice(_DECORATIONS).format(n=i % 13)
+        has_preview = rng.random() >= 0.4
+        tracks.append({
+            "id": f"bench{i:06d}",
+            "name": name,
+            "artists": [{"name": rng.choice(artists)}],
+            "album": {"images": [{"url": f"https://i.scdn.co/image/bench{i}", "width": 640}]},
+            "preview_url": f"https://p.scdn.co/mp3-preview/bench{i}" if has_preview else None,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/bench{i:06d}"},
+            "duration_ms": rng.randint(150_000, 300_000),
+            "external_ids": {"isrc": f"QZBEN{i:07d}"},
+        })
+    return tracks
+
+
+def load_fixtures(path):
+    """(tracks, itunes term -> results) from a recorded fixture file."""
+    with open(path) as f:
+        data = json.load(f)
+    items = data.get("tracks") or data.get("items") or []
+    tracks = [item.get("track", item) if isinstance(item, dict) else None for item in items]
+    return [t for t in tracks if isinstance(t, dict) and t.get("name")], data.get("itunes") or {}
+
+
+def _itunes_results(track, rng):
+    """What iTunes would answer for a catalogue track: the song plus decoys."""
+    if rng.random() < 0.15:
+        return []  # not on iTunes
+    artist = track["artists"][0]["name"]
+    song = {
+        "wrapperType": "track",
+        "kind": "song",
+        "trackName": track["name"],
+        "artistName": artist,
+        "trackTimeMillis": track["duration_ms"] + rng.randint(-1500, 1500),
+        "previewUrl": f"https://audio-ssl.itunes.apple.com/bench/{track['id']}.m4a",
+    }
+    decoys = [
+        dict(song, trackName=track["name"] + " (Live)", trackTimeMillis=song["trackTimeMillis"] + 40_000,
+             previewUrl=song["previewUrl"].replace(".m4a", "-live.m4a")),
+        dict(song, artistName="Bench Karaoke Band", trackName=track["name"] + " (Karaoke Version)",
+             previewUrl=song["previewUrl"].replace(".m4a", "-karaoke.m4a")),
+    ]
+    results = [decoys[0], song, decoys[1]]
+    rng.shuffle(results)
+    return results
+
+
+def _artist_id(name):
+    return hashlib.sha1(name.encode()).hexdigest()[:22]
+
+
+class Upstreams:
+    """Shared state behind the fake servers: payloads and request counters."""
+
+    def __init__(self, tracks, itunes=None, spotify_faults=None, itunes_faults=None, seed=7):
+        self.tracks = tracks
+        self.spotify_faults = spotify_faults or Faults()
+        self.itunes_faults = itunes_faults or Faults()
+
+        rng = random.Random(seed)
+        self.itunes = dict(itunes or {})
+        for track in tracks:
+            term = f"{track['name']} {track['artists'][0]['name']}"
+            if term not in self.itunes:
+                self.itunes[term] = _itunes_results(track, rng)
+
+        # Artist id -> their tracks (catalogue artists only have names)
+        self.artists = {}
+        for track in tracks:
+            self.artists.setdefault(_artist_id(track["artists"][0]["name"]), []).append(track)
+
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def reset_counts(self):
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    def top_tracks(self, user, limit, offset):
+        # Every fake user gets their own, stable slice of the catalogue
+        rng = random.Random(user)
+        picks = rng.sample(self.tracks, min(len(self.tracks), 50))
+        return {"items": picks[offset:offset + limit], "total": len(picks), "limit": limit, "offset": offset}
+
+    def top_artists(self, user, limit, offset):
+        rng = random.Random(f"artists:{user}")
+        ids = sorted(self.artists)
+        picks = [{"id": a, "name": self.artists[a][0]["artists"][0]["name"]}
+                 for a in rng.sample(ids, min(len(ids), 50))]
+        return {"items": picks[offset:offset + limit], "total": len(picks), "limit": limit, "offset": offset}
+
+    def artist_top_tracks(self, artist_id):
+        return {"tracks": self.artists.get(artist_id, [])[:10]}
+
+    def playlist_page(self, limit, offset):
+        items = [{"track": t} for t in self.tracks[offset:offset + limit]]
+        more = offset + limit < len(self.tracks)
+        return {"items": items, "total": len(self.tracks), "next": "more" if more else None}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstreams = None  # set per server class
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject(self, faults):
+        """Apply latency / failures; True if the request was already answered."""
+        delay, status = faults.draw()
+        if delay:
+            time.sleep(delay)
+        if status == 429:
+            self._send(429, {"error": {"status": 429, "message": "rate limited"}},
+                       {"Retry-After": str(faults.retry_after)})
+            return True
+        if status == 503:
+            self._send(503, {"error": {"status": 503, "message": "injected failure"}})
+            return True
+        return False
+
+    def do_POST(self):
+        ups = self.upstreams
+        length = int(self.headers.get("Content-Length") or 0)
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+        if urlsplit(self.path).path != "/api/token":
+            return self._send(404, {"error": "not_found"})
+
+        grant = form.get("grant_type")
+        ups.count(f"accounts:{grant}")
+        if grant == "authorization_code":
+            user = form.get("code") or "anon"
+        elif grant == "refresh_token":
+            user = (form.get("refresh_token") or "refresh-anon").split("refresh-", 1)[-1]
+        else:
+            user = "app"
+        self._send(200, {
+            "access_token": f"user-{user}",
+            "refresh_token": f"refresh-{user}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+        })
+
+    def do_GET(self):
+        ups = self.upstreams
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip("/")
+
+        if path == "/itunes/search":
+            ups.count("itunes:search")
+            if self._inject(ups.itunes_faults):
+                return
+            results = ups.itunes.get(query.get("term", ""), [])
+            return self._send(200, {"resultCount": len(results), "results": results})
+
+        if not path.startswith("/v1/"):
+            return self._send(404, {"error": "not_found"})
+        endpoint = path[len("/v1/"):]
+        user = (self.headers.get("Authorization") or "").split("user-", 1)[-1] or "anon"
+        limit = int(query.get("limit", 20))
+        offset = int(query.get("offset", 0))
+
+        label = endpoint
+        if endpoint == "me":
+            payload = {"id": user, "display_name": f"Bench {user}", "images": []}
+        elif endpoint == "me/top/tracks":
+            payload = ups.top_tracks(user, limit, offset)
+        elif endpoint == "me/top/artists":
+            payload = ups.top_artists(user, limit, offset)
+        elif endpoint.startswith("artists/") and endpoint.endswith("/top-tracks"):
+            payload = ups.artist_top_tracks(endpoint.split("/")[1])
+            label = "artists/{id}/top-tracks"
+        elif endpoint == "search":
+            payload = {"playlists": {"items": [{"id": PLAYLIST_ID, "name": "Bench Global Hits"}]}}
+        elif endpoint.startswith("playlists/") and endpoint.endswith("/tracks"):
+            payload = ups.playlist_page(limit, offset)
+            label = "playlists/{id}/tracks"
+        else:
+            return self._send(404, {"error": {"status": 404, "message": "unknown endpoint"}})
+
+        ups.count(f"spotify:{label}")
+        if self._inject(ups.spotify_faults):
+            return
+
+        # Spotify sends ETags and honours If-None-Match; so do we
+        etag = '"' + hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, payload, {"ETag": etag})
+
+
+class FakeServer:
+    """One ThreadingHTTPServer serving the Spotify, accounts and iTunes fakes."""
+
+    def __init__(self, upstreams, host="127.0.0.1", port=0):
+        handler = type("Handler", (_Handler,), {"upstreams": upstreams})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.upstreams = upstreams
+        self.base = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def env(self):
+        """Environment variables that point the app at this server."""
+        return {
+            "SPOTIFY_API_BASE": f"{self.base}/v1",
+            "SPOTIFY_ACCOUNTS_BASE": self.base,
+            "ITUNES_SEARCH_URL": f"{self.base}/itunes/search",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_fault_arguments(parser):
+    parser.add_argument("--latency", type=float, default=30.0, help="mean upstream latency, ms")
+    parser.add_argument("--jitter", type=float, default=10.0, help="+/- latency jitter, ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction answered 429 + Retry-After")
+    parser.add_argument("--itunes-latency", type=float, default=None, help="iTunes latency, ms (default: --latency)")
+    parser.add_argument("--fixtures", help="recorded Spotify response with track objects (JSON)")
+    parser.add_argument("--catalogue-size", type=int, default=500)
+
+
+def upstreams_from_args(args):
+    if args.fixtures:
+        tracks, itunes = load_fixtures(args.fixtures)
+    else:
+        tracks, itunes = generate_catalogue(args.catalogue_size), {}
+    itunes_latency = args.latency if args.itunes_latency is None else args.itunes_latency
+    return Upstreams(
+        tracks,
+        itunes,
+        spotify_faults=Faults(args.latency, args.jitter, args.error_rate, args.throttle_rate),
+        itunes_faults=Faults(itunes_latency, args.jitter, args.error_rate, args.throttle_rate),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Spotify / iTunes upstreams for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--write-fixtures", metavar="PATH", help="write the generated catalogue and exit")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    upstreams = upstreams_from_args(args)
+    if args.write_fixtures:
+        with open(args.write_fixtures, "w") as f:
+            json.dump({"tracks": upstreams.tracks, "itunes": upstreams.itunes}, f, indent=1)
+        return
+
+    server = FakeServer(upstreams, args.host, args.port)
+    for name, value in server.env().items():
+        print(f"{name}={value}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
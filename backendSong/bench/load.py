@@ -0,0 +1,249 @@
+# backendSong/bench/load.py
+#
+# End-to-end load test: runs the app under gunicorn against the local fake
+# upstreams (bench/fake_upstreams.py) and reports latency percentiles and
+# throughput per worker class and endpoint, as JSON.
+#
+#   pip install gunicorn gevent          (gevent only for the gevent runs)
+#   python bench/load.py --out bench/results/load.json
+#   python bench/load.py --worker-classes gthread --latency 80 --error-rate 0.02
+#
+# Each worker class gets a fresh CACHE_DIR, logs in --users fake Spotify
+# users through /callback, warms up, then runs --concurrency client
+# threads against one endpoint at a time for --duration seconds. Upstream
+# rate budgets are lifted so the app, not our own limiter, is measured.
+# "upstream_calls_per_request" shows how much caching / coalescing saves.
+#
+# The client runs in this process, so keep --concurrency within what one
+# Python process can drive; compare results from the same machine only.
+
+import argparse
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import BACKEND_DIR, latency_summary, write_results  # noqa: E402
+from fake_upstreams import FakeServer, add_fault_arguments, upstreams_from_args  # noqa: E402
+
+ENDPOINTS = {
+    "top-tracks": "/api/quiz/top-tracks",
+    "top-artists": "/api/quiz/top-artists",
+    "global-hits": "/api/quiz/global-hits",
+}
+
+# gunicorn -k value -> module that must be importable
+WORKER_CLASSES = {"sync": "gunicorn", "gthread": "gunicorn", "gevent": "gevent"}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """The app under gunicorn, pointed at the fake upstreams."""
+
+    def __init__(self, worker_class, workers, threads, upstream_env, log_path, extra_args=(), extra_env=None,
+                 worker_connections=1000):
+        self.port = _free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.cache_dir = tempfile.mkdtemp(prefix=f"trackguessr-bench-{worker_class}-")
+
+        cmd = [
+            sys.executable, "-m", "gunicorn", *extra_args, "app:app",
+            "-k", worker_class,
+            "-w", str(workers),
+            "-b", f"127.0.0.1:{self.port}",
+            "--log-level", "warning",
+        ]
+        if worker_class == "gthread":
+            cmd += ["--threads", str(threads)]
+        if worker_class == "gevent":
+            cmd += ["--worker-connections", str(worker_connections)]
+
+        env = dict(os.environ)
+        env.update(upstream_env)
+        env.update({
+            "CACHE_DIR": self.cache_dir,
+            "FLASK_SECRET_KEY": "bench",
+            "SPOTIFY_CLIENT_ID": "bench",
+            "SPOTIFY_CLIENT_SECRET": "bench",
+            "REDIRECT_URI": f"{self.base}/callback",
+            "FRONTEND_URL": self.base,
+            "ITUNES_RATE_PER_MINUTE": "1000000",
+            "ITUNES_RATE_BURST": "10000",
+            "SPOTIFY_RATE_PER_MINUTE": "1000000",
+            "SPOTIFY_RATE_BURST": "10000",
+            "LOG_LEVEL": "WARNING",
+        })
+        env.update(extra_env or {})
+        self._log = open(log_path, "w")
+        self.proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {self.proc.returncode} (see {self._log.name})")
+            try:
+                if requests.get(f"{self.base}/api/status", timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError(f"gunicorn not ready after {timeout}s (see {self._log.name})")
+
+    def login(self, user):
+        """Session cookie for a fake Spotify user, via the real OAuth callback."""
+        resp = requests.get(f"{self.base}/callback", params={"code": user}, allow_redirects=False, timeout=10)
+        cookie = resp.cookies.get("session")
+        if resp.status_code != 302 or not cookie:
+            raise RuntimeError(f"login failed for {user}: {resp.status_code} {resp.text[:200]}")
+        # The cookie is Secure (SameSite=None); send it by hand over plain http.
+        # Then load the page like the frontend does (/auth/status), which
+        # tells the session who the user is, so their responses get cached.
+        status = requests.get(f"{self.base}/auth/status", headers={"Cookie": f"session={cookie}"}, timeout=10)
+        if not (status.json() or {}).get("logged_in"):
+            raise RuntimeError(f"login failed for {user}: /auth/status says logged out")
+        return f"session={status.cookies.get('session') or cookie}"
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self._log.close()
+
+
+def drive(url, cookies, concurrency, duration):
+    """
+    Hammer `url` from `concurrency` threads, cycling through the users'
+    `cookies` (updated in place). Returns (latencies, statuses, empty, elapsed).
+    """
+    latencies, statuses = [], {}
+    empty = [0]
+    lock = threading.Lock()
+    start = time.perf_counter()
+    stop_at = start + duration
+
+    def client(n):
+        http = requests.Session()
+        mine, codes, blank = [], {}, 0
+        i = n
+        while time.perf_counter() < stop_at:
+            user = i % len(cookies)
+            i += concurrency
+            t0 = time.perf_counter()
+            try:
+                resp = http.get(url, headers={"Cookie": cookies[user]}, timeout=30)
+                body = resp.json() if resp.status_code == 200 else None
+                status = resp.status_code
+                if resp.cookies.get("session"):
+                    # Like a browser: keep what the app stored in the session
+                    cookies[user] = f"session={resp.cookies['session']}"
+            except (requests.RequestException, ValueError):
+                status, body = "error", None
+            mine.append(time.perf_counter() - t0)
+            codes[status] = codes.get(status, 0) + 1
+            if status == 200 and not (body or {}).get("questions"):
+                blank += 1
+        with lock:
+            latencies.extend(mine)
+            for code, count in codes.items():
+                statuses[code] = statuses.get(code, 0) + count
+            empty[0] += blank
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, statuses, empty[0], time.perf_counter() - start
+
+
+def run_worker_class(worker_class, args, fake):
+    log_path = os.path.join(tempfile.gettempdir(), f"trackguessr-bench-{worker_class}.log")
+    app = AppServer(worker_class, args.workers, args.threads, fake.env(), log_path)
+    results = {}
+    try:
+        app.wait_ready()
+        cookies = [app.login(f"bench-user-{i}") for i in range(args.users)]
+        for name in args.endpoints:
+            url = app.base + ENDPOINTS[name]
+            drive(url, cookies, args.concurrency, args.warmup)
+            fake.upstreams.reset_counts()
+
+            latencies, statuses, empty, elapsed = drive(url, cookies, args.concurrency, args.duration)
+            upstream = fake.upstreams.reset_counts()
+            ok = statuses.get(200, 0)
+            result = {
+                "requests": len(latencies),
+                "throughput_rps": round(len(latencies) / elapsed, 2),
+                "errors": len(latencies) - ok,
+                "empty_quizzes": empty,
+                "upstream_calls_per_request": round(sum(upstream.values()) / max(1, len(latencies)), 3),
+            }
+            result.update(latency_summary(latencies))
+            result.pop("count")
+            results[f"{worker_class}/{name}"] = result
+            print(f"{worker_class:>8} {name:<12} {result}")
+    finally:
+        app.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrackGuessr end-to-end load test")
+    parser.add_argument("--out", default="-", help="result file (default: stdout)")
+    parser.add_argument("--worker-classes", default="sync,gthread,gevent")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gthread worker")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads")
+    parser.add_argument("--users", type=int, default=50, help="distinct logged-in users")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per endpoint")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds per endpoint")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    args.endpoints = [e for e in args.endpoints.split(",") if e]
+
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    if importlib.util.find_spec("gunicorn") is None:
+        parser.error("gunicorn is not installed")
+
+    fake = FakeServer(upstreams_from_args(args)).start()
+    results, skipped = {}, []
+    try:
+        for worker_class in args.worker_classes.split(","):
+            module = WORKER_CLASSES.get(worker_class)
+            if module is None or importlib.util.find_spec(module) is None:
+                print(f"skipping {worker_class}: {module or 'unknown worker class'} not available")
+                skipped.append(worker_class)
+                continue
+            results.update(run_worker_class(worker_class, args, fake))
+    finally:
+        fake.stop()
+
+    params = {
+        k: v for k, v in vars(args).items() if k not in ("out",)
+    }
+    params["skipped_worker_classes"] = skipped
+    write_results(args.out, "load", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# backendSong/bench/microbench.py
+#
+# CPU-only microbenchmarks for the quiz hot paths, as JSON:
+#
+#   python bench/microbench.py --out bench/results/micro.json
+#   python bench/compare.py old.json bench/results/micro.json
+#
+# - quiz/<pool>: generate_quiz_from_tracks without iTunes lookups
+# - normalize_title (cold = empty cache, warm = cached) and best_match
+#   over a 15-result iTunes search (the work that replaced exact-title
+#   comparison in itunes_client)
+# - distractors/<pool>: see bench_distractors.py
+#
+# Times are the best of --repeat runs, so background noise inflates them
+# less; compare runs from the same machine only.
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import use_backend_modules, write_results  # noqa: E402
+
+use_backend_modules()
+
+import bench_distractors  # noqa: E402
+from fake_upstreams import generate_catalogue  # noqa: E402
+from distractors import DistractorSampler  # noqa: E402
+from quiz_generator import generate_quiz_from_tracks  # noqa: E402
+from track import tracks_from_spotify  # noqa: E402
+from track_matching import best_match, normalize_title  # noqa: E402
+
+QUIZ_POOL_SIZES = [50, 500, 5000]
+
+
+def best_of(fn, number, repeat):
+    """Seconds per call, best of `repeat` runs of `number` calls."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def bench_quiz(repeat):
+    results = {}
+    for n in QUIZ_POOL_SIZES:
+        tracks = tracks_from_spotify(generate_catalogue(n, seed=n))
+        sampler = DistractorSampler(tracks)
+        number = max(5, 20000 // n)
+        for hard in (False, True):
+            name = f"quiz/{n}" + ("/hard" if hard else "")
+            results[name] = {
+                "per_quiz_us": 1e6 * best_of(
+                    lambda: generate_quiz_from_tracks(
+                        tracks, num_questions=5, options_per_q=4,
+                        resolve_previews=False, sampler=sampler, hard=hard,
+                    ),
+                    number, repeat,
+                ),
+            }
+        results[f"quiz/{n}/no_sampler"] = {
+            "per_quiz_us": 1e6 * best_of(
+                lambda: generate_quiz_from_tracks(
+                    tracks, num_questions=5, options_per_q=4, resolve_previews=False
+                ),
+                max(2, number // 10), repeat,
+            ),
+        }
+    return results
+
+
+def bench_matching(repeat):
+    catalogue = generate_catalogue(2000, seed=3)
+    titles = [t["name"] for t in catalogue]
+
+    def cold():
+        normalize_title.cache_clear()
+        for title in titles:
+            normalize_title(title)
+
+    def warm():
+        for title in titles:
+            normalize_title(title)
+
+    rng = random.Random(5)
+    searches = []
+    for t in rng.sample(catalogue, 200):
+        artist = t["artists"][0]["name"]
+        results = [
+            {"trackName": f"{t['name']} (Live)", "artistName": artist, "trackTimeMillis": t["duration_ms"] + 30000},
+            {"trackName": t["name"], "artistName": "Someone Else", "trackTimeMillis": t["duration_ms"]},
+        ]
+        results += [
+            {"trackName": o["name"], "artistName": o["artists"][0]["name"], "trackTimeMillis": o["duration_ms"]}
+            for o in rng.sample(catalogue, 12)
+        ]
+        results.append({"trackName": t["name"], "artistName": artist, "trackTimeMillis": t["duration_ms"] + 800})
+        for item in results:
+            item["previewUrl"] = "https://audio-ssl.itunes.apple.com/bench.m4a"
+        searches.append((results, t["name"], artist, t["duration_ms"]))
+
+    def match():
+        for results, track, artist, duration_ms in searches:
+            best_match(results, track, artist, duration_ms)
+
+    warm()
+    return {
+        "normalize_title/cold": {"per_title_us": 1e6 * best_of(cold, 1, repeat) / len(titles)},
+        "normalize_title/warm": {"per_title_us": 1e6 * best_of(warm, 5, repeat) / len(titles)},
+        "best_match/15_results": {"per_search_us": 1e6 * best_of(match, 5, repeat) / len(searches)},
+    }
+
+
+def bench_sampling():
+    rng = random.Random(1234)
+    return {f"distractors/{n}": bench_distractors.measure(n, rng) for n in bench_distractors.POOL_SIZES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz hot-path microbenchmarks")
+    parser.add_argument("--out", default="-", help="result file (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    results.update(bench_quiz(args.repeat))
+    results.update(bench_matching(args.repeat))
+    results.update(bench_sampling())
+    results = {name: {k: round(v, 3) for k, v in r.items()} for name, r in results.items()}
+
+    write_results(args.out, "micro", {"repeat": args.repeat}, results)
+
+
+if __name__ == "__main__":
+    main()
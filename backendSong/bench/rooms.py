@@ -0,0 +1,329 @@
+# backendSong/bench/rooms.py
+#
+# Multiplayer rooms under load: --rooms rooms with --listeners players each,
+# all following their room over Server-Sent Events, against the local fake
+# upstreams (bench/fake_upstreams.py):
+#
+#   python bench/rooms.py --out bench/results/rooms.json
+#   python bench/rooms.py --rooms 4 --listeners 250 --worker-classes gevent,gthread
+#
+# The app runs with the shipped gunicorn defaults (--workers 2, --threads
+# 8), so rooms are created, started and streamed by different workers.
+# Players follow a room over SSE; those a worker has no stream for (gthread
+# keeps ROOM_THREAD_STREAMS open) fall back to polling. Per worker class:
+# - create_ms: hosting a room, which builds its quiz
+# - streams / pollers: players following by SSE, and by polling
+# - connect_*: request sent -> "room" greeting (or first poll) received
+# - lag_*: an event's due time -> received, over every question, reveal
+#   and end event of every player (client and server share the clock)
+# - missed_events / missed_players: events never received, players whose
+#   stream did not reach "end"
+# - upstream_calls_per_room / _per_player: Spotify + iTunes calls made for
+#   the rooms, and by the players (should be none)
+# - worker_rss_kb_per_player, worker_cpu_ms_per_player: the worker's
+#   memory growth once everyone is connected, and its CPU time over the
+#   game, per player (Linux /proc only)
+#
+# Players are asyncio connections in this process, so hundreds of them
+# need no threads; keep rooms x listeners below the open-file limit.
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import latency_summary, write_results  # noqa: E402
+from fake_upstreams import FakeServer, add_fault_arguments, upstreams_from_args  # noqa: E402
+from load import WORKER_CLASSES, AppServer  # noqa: E402
+
+TIMED_EVENTS = ("question", "reveal", "end")
+
+
+# ---------- players ----------
+
+async def _get(host, port, path):
+    """(status line, body) of one HTTP/1.0 GET."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return head.split(b"\r\n", 1)[0], body
+
+
+async def poll(host, port, room_id, greeted):
+    """Follow one room by polling, as listen() does by streaming."""
+    started = time.perf_counter()
+    connect, lags, ended, after = None, [], False, 0
+    try:
+        while not ended:
+            status, body = await _get(host, port, f"/api/rooms/{room_id}/poll?after={after}")
+            if b" 200 " not in status:
+                break
+            received = time.time()
+            body = json.loads(body)
+            if connect is None:
+                connect = time.perf_counter() - started
+                greeted()
+            for event in body["events"]:
+                after = event["id"]
+                if event["event"] in TIMED_EVENTS:
+                    lags.append(received - event["data"]["at"])
+                    ended = event["event"] == "end"
+            if body["next_in"] is None:
+                break
+            await asyncio.sleep(body["next_in"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return "poll", connect, lags, ended
+
+
+async def listen(host, port, room_id, greeted):
+    """
+    Follow one room's event stream to its end, or by polling if the worker
+    sends us there. Returns ("stream" | "poll", connect seconds or None,
+    [lag seconds of each timed event], saw "end").
+    """
+    path = f"/api/rooms/{room_id}/events"
+    started = time.perf_counter()
+    connect, lags, ended = None, [], False
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return "stream", connect, lags, ended
+    try:
+        # HTTP/1.0: the response is the raw stream, no chunked encoding
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+        await writer.drain()
+        status = await reader.readline()
+        if b" 503 " in status and b"streams_busy" in await reader.read():
+            writer.close()
+            return await poll(host, port, room_id, greeted)
+        if b" 200 " not in status:
+            return "stream", connect, lags, ended
+        while (await reader.readline()).strip():
+            pass  # headers
+
+        event, data = None, []
+        while not ended:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.rstrip(b"\r\n")
+            if line.startswith(b"event:"):
+                event = line[6:].strip().decode()
+            elif line.startswith(b"data:"):
+                data.append(line[5:].strip())
+            elif not line and event:
+                received = time.time()
+                if event == "room":
+                    connect = time.perf_counter() - started
+                    greeted()
+                elif event in TIMED_EVENTS:
+                    lags.append(received - json.loads(b"\n".join(data))["at"])
+                    ended = event == "end"
+                event, data = None, []
+    except (OSError, ValueError, KeyError):
+        pass
+    finally:
+        writer.close()
+    return "stream", connect, lags, ended
+
+
+async def play(app, rooms, listeners, timeout, on_connected):
+    """Connect every player, call on_connected() once all are in, then await the ends."""
+    host, port = "127.0.0.1", app.port
+    loop = asyncio.get_running_loop()
+    everyone = asyncio.Event()
+    joined = [0]
+    total = len(rooms) * listeners
+
+    def greeted():
+        joined[0] += 1
+        if joined[0] == total:
+            everyone.set()
+
+    tasks = [
+        asyncio.ensure_future(listen(host, port, room_id, greeted))
+        for room_id in rooms
+        for _ in range(listeners)
+    ]
+    try:
+        await asyncio.wait_for(everyone.wait(), timeout)
+    except asyncio.TimeoutError:
+        print(f"only {joined[0]}/{total} players connected")
+    await loop.run_in_executor(None, on_connected)
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    return [task.result() for task in done]
+
+
+# ---------- the worker process ----------
+
+def _worker_pids(master):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == master:
+            pids.append(int(entry))
+    return pids
+
+
+def worker_usage(master):
+    """(CPU seconds, resident KiB) of the gunicorn workers, or None off Linux."""
+    if not os.path.isdir("/proc"):
+        return None
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu, rss = 0.0, 0
+    for pid in _worker_pids(master):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/status") as f:
+                rss += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+    return cpu, rss
+
+
+# ---------- one worker class ----------
+
+def create_room(app, source):
+    deadline = time.time() + 60
+    while True:
+        t0 = time.perf_counter()
+        resp = requests.post(app.base + "/api/rooms", json={"source": source}, timeout=60)
+        elapsed = time.perf_counter() - t0
+        if resp.status_code == 201:
+            body = resp.json()
+            return body["room"]["id"], body["host_token"], elapsed
+        if time.time() > deadline:
+            raise RuntimeError(f"could not create a room: {resp.status_code} {resp.text[:200]}")
+        time.sleep(0.5)  # catalogue still loading
+
+
+def run_worker_class(worker_class, args, fake):
+    log_path = os.path.join(tempfile.gettempdir(), f"trackguessr-rooms-{worker_class}.log")
+    players = args.rooms * args.listeners
+    extra_env = {
+        "ROOM_QUESTIONS": str(args.questions),
+        "ROOM_START_DELAY": str(args.start_delay),
+        "ROOM_QUESTION_SECONDS": str(args.question_seconds),
+        "ROOM_REVEAL_SECONDS": str(args.reveal_seconds),
+        "ROOM_MAX_LISTENERS": str(args.listeners),
+    }
+    app = AppServer(worker_class, args.workers, args.threads, fake.env(), log_path,
+                    extra_env=extra_env, worker_connections=players + 100)
+    try:
+        app.wait_ready()
+        # The first room waits for the global-hits catalogue; not measured
+        create_room(app, args.source)
+        fake.upstreams.reset_counts()
+
+        rooms, create = {}, []
+        for _ in range(args.rooms):
+            room_id, token, elapsed = create_room(app, args.source)
+            rooms[room_id] = token
+            create.append(elapsed)
+        room_calls = sum(fake.upstreams.reset_counts().values())
+
+        before = worker_usage(app.proc.pid)
+        usage = {}
+
+        def start_all():
+            usage["connected"] = worker_usage(app.proc.pid)
+            for room_id, token in rooms.items():
+                requests.post(f"{app.base}/api/rooms/{room_id}/start",
+                              headers={"X-Room-Token": token}, timeout=10).raise_for_status()
+
+        game = args.start_delay + args.questions * (args.question_seconds + args.reveal_seconds)
+        outcomes = asyncio.run(play(app, list(rooms), args.listeners, game + 30, start_all))
+        after = worker_usage(app.proc.pid)
+        player_calls = sum(fake.upstreams.reset_counts().values())
+    finally:
+        app.stop()
+
+    connects = [c for _, c, _, _ in outcomes if c is not None]
+    lags = [lag for _, _, lag_list, _ in outcomes for lag in lag_list]
+    expected = players * (2 * args.questions + 1)
+    result = {
+        "players": players,
+        "streams": sum(1 for mode, *_ in outcomes if mode == "stream"),
+        "pollers": sum(1 for mode, *_ in outcomes if mode == "poll"),
+        "create_ms": round(1000 * sum(create) / len(create), 1),
+        "missed_players": players - sum(1 for *_, ended in outcomes if ended),
+        "missed_events": expected - len(lags),
+        "upstream_calls_per_room": round(room_calls / args.rooms, 2),
+        "upstream_calls_per_player": round(player_calls / players, 3),
+    }
+    for prefix, values in (("connect", connects), ("lag", lags)):
+        for field, value in latency_summary(values).items():
+            if field != "count":
+                result[f"{prefix}_{field}"] = value
+    if before and usage.get("connected") and after:
+        result["worker_rss_kb_per_player"] = round((usage["connected"][1] - before[1]) / players, 2)
+        result["worker_cpu_ms_per_player"] = round(1000 * (after[0] - usage["connected"][0]) / players, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrackGuessr multiplayer room load test")
+    parser.add_argument("--out", default="-", help="result file (default: stdout)")
+    parser.add_argument("--worker-classes", default="gevent,gthread")
+    parser.add_argument("--source", default="global-hits", choices=("global-hits",))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8, help="gthread threads per worker")
+    parser.add_argument("--rooms", type=int, default=2)
+    parser.add_argument("--listeners", type=int, default=300, help="players per room")
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--start-delay", type=float, default=2.0)
+    parser.add_argument("--question-seconds", type=float, default=1.0)
+    parser.add_argument("--reveal-seconds", type=float, default=0.5)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("gunicorn") is None:
+        parser.error("gunicorn is not installed")
+
+    fake = FakeServer(upstreams_from_args(args)).start()
+    results, skipped = {}, []
+    try:
+        for worker_class in args.worker_classes.split(","):
+            module = WORKER_CLASSES.get(worker_class)
+            if worker_class == "sync" or module is None or importlib.util.find_spec(module) is None:
+                # A sync worker would serve every player by polling, one at a time
+                print(f"skipping {worker_class}: not installed or too slow to poll {args.listeners} players")
+                skipped.append(worker_class)
+                continue
+            result = run_worker_class(worker_class, args, fake)
+            results[f"{worker_class}/rooms"] = result
+            print(f"{worker_class:>8} rooms {result}")
+    finally:
+        fake.stop()
+
+    params = {k: v for k, v in vars(args).items() if k != "out"}
+    params["skipped_worker_classes"] = skipped
+    write_results(args.out, "rooms", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# backendSong/circuit_breaker.py
+
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger("circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# name -> CircuitBreaker, so every breaker can be reported in one place
+_BREAKERS = {}
+
+
+class _Permit:
+    """A call let through by allow(); `trial` is the half-open period it is a trial call of, if any."""
+
+    __slots__ = ("trial",)
+
+    def __init__(self, trial=None):
+        self.trial = trial
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+      closed    -> calls go through; `failure_threshold` consecutive
+                   failures open the breaker
+      open      -> calls are rejected immediately for `recovery_timeout`
+                   seconds
+      half_open -> up to `half_open_max_calls` trial calls go through;
+                   one success closes the breaker, one failure re-opens it
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self._half_open_period = 0  # bumped on every entry into half_open
+        self.transitions = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        self.rejected = 0
+
+        self._listeners = []
+        self._lock = threading.Lock()
+        _BREAKERS[name] = self
+
+    def add_listener(self, fn):
+        """fn(name, old_state, new_state) is called on every state change."""
+        self._listeners.append(fn)
+
+    def _transition(self, new_state):
+        # Caller holds the lock
+        old_state, self.state = self.state, new_state
+        self.transitions[new_state] += 1
+        if new_state == OPEN:
+            self.opened_at = time.time()
+        if new_state == HALF_OPEN:
+            self._half_open_period += 1
+        if new_state != HALF_OPEN:
+            self.half_open_calls = 0
+        if new_state == CLOSED:
+            self.failures = 0
+        return old_state
+
+    def _notify(self, old_state, new_state):
+        log.warning("circuit_breaker_transition", breaker=self.name, old=old_state, new=new_state)
+        for fn in self._listeners:
+            try:
+                fn(self.name, old_state, new_state)
+            except Exception:
+                log.exception("circuit_breaker_listener_failed", breaker=self.name)
+
+    def is_open(self):
+        """True while calls are being rejected (does not count as a call)."""
+        return self.state == OPEN and time.time() - self.opened_at < self.recovery_timeout
+
+    def allow(self):
+        """
+        A permit (truthy) if a call may go upstream right now, else False.
+        Pass the permit to release() if the call ends without an outcome.
+        """
+        changed = None
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                changed = (self._transition(HALF_OPEN), HALF_OPEN)
+
+            if self.state == HALF_OPEN:
+                if self.half_open_calls >= self.half_open_max_calls:
+                    self.rejected += 1
+                    allowed = False
+                else:
+                    self.half_open_calls += 1
+                    allowed = _Permit(self._half_open_period)
+            else:
+                allowed = _Permit()
+
+        if changed:
+            self._notify(*changed)
+        return allowed
+
+    def release(self, permit):
+        """
+        Give back `permit` from allow() for a call that never reached
+        upstream or ended without record_success / record_failure, so a
+        half-open breaker's trial slot is not held forever. Only the trial
+        call holding the slot frees it; releasing any other permit (or the
+        same one twice) does nothing, so it is safe on every way out.
+        """
+        with self._lock:
+            if (
+                permit.trial is not None
+                and permit.trial == self._half_open_period
+                and self.state == HALF_OPEN
+                and self.half_open_calls > 0
+            ):
+                self.half_open_calls -= 1
+            permit.trial = None
+
+    def record_success(self):
+        changed = None
+        with self._lock:
+            if self.state == HALF_OPEN:
+                changed = (self._transition(CLOSED), CLOSED)
+            else:
+                self.failures = 0
+        if changed:
+            self._notify(*changed)
+
+    def record_failure(self):
+        changed = None
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (
+                self.state == CLOSED and self.failures >= self.failure_threshold
+            ):
+                changed = (self._transition(OPEN), OPEN)
+        if changed:
+            self._notify(*changed)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+def all_breakers():
+    return dict(_BREAKERS)
+
+
+def breaker_stats():
+    return {name: b.stats() for name, b in _BREAKERS.items()}
@@ -8,3 +8,200 @@ FLASK_SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "dev-secret")
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://127.0.0.1:5000")  # or whatever local dev URL
 _raw = os.getenv("ALLOWED_ORIGINS", "")
 ALLOWED_ORIGINS = [o.strip() for o in _raw.split(",") if o.strip()]
+
+# Upstream endpoints. Only overridden to point at local stand-ins (see
+# bench/fake_upstreams.py); production always uses the defaults.
+SPOTIFY_API_BASE = os.environ.get("SPOTIFY_API_BASE", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_BASE = os.environ.get("SPOTIFY_ACCOUNTS_BASE", "https://accounts.spotify.com")
+ITUNES_SEARCH_URL = os.environ.get("ITUNES_SEARCH_URL", "https://itunes.apple.com/search")
+
+# iTunes preview fallback: how many lookups run in parallel per worker,
+# and how long (seconds) a quiz waits for all of them before giving up.
+ITUNES_LOOKUP_WORKERS = int(os.environ.get("ITUNES_LOOKUP_WORKERS", "8"))
+ITUNES_LOOKUP_DEADLINE = float(os.environ.get("ITUNES_LOOKUP_DEADLINE", "3.5"))
+
+# iTunes matching: candidates fetched per search, and the minimum score
+# (0..1, see track_matching.py) a candidate needs to be used.
+ITUNES_SEARCH_LIMIT = int(os.environ.get("ITUNES_SEARCH_LIMIT", "15"))
+ITUNES_MATCH_THRESHOLD = float(os.environ.get("ITUNES_MATCH_THRESHOLD", "0.75"))
+
+# iTunes preview cache. Set PREVIEW_CACHE_PATH="" to keep it in memory only;
+# otherwise every worker on the host shares (and persists) it via SQLite.
+# PREVIEW_CACHE_SIZE entries per worker in memory, PREVIEW_CACHE_SHARED_SIZE
+# rows in the SQLite file (oldest written evicted first).
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+PREVIEW_CACHE_PATH = os.environ.get("PREVIEW_CACHE_PATH", os.path.join(CACHE_DIR, "previews.sqlite3"))
+PREVIEW_CACHE_SIZE = int(os.environ.get("PREVIEW_CACHE_SIZE", "20000"))
+PREVIEW_CACHE_SHARED_SIZE = int(os.environ.get("PREVIEW_CACHE_SHARED_SIZE", "200000"))
+PREVIEW_CACHE_HIT_TTL = int(os.environ.get("PREVIEW_CACHE_HIT_TTL", str(30 * 24 * 3600)))
+PREVIEW_CACHE_MISS_TTL = int(os.environ.get("PREVIEW_CACHE_MISS_TTL", str(24 * 3600)))
+# Offline preview index built from bulk exports (preview_index.py),
+# consulted before the cache and iTunes. "" disables it.
+PREVIEW_INDEX_PATH = os.environ.get("PREVIEW_INDEX_PATH", os.path.join(CACHE_DIR, "previews.idx"))
+# iTunes lookups per minute for "preview_index.py warm". It runs beside the
+# workers and spends the same per-IP budget, so keep it well below theirs.
+PREVIEW_WARM_RATE_PER_MINUTE = float(os.environ.get("PREVIEW_WARM_RATE_PER_MINUTE", "4"))
+
+# Pooled HTTP sessions for Spotify / iTunes (see http_session.py).
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.2"))
+# Longest Retry-After (seconds) we are willing to sleep through inline.
+HTTP_MAX_RETRY_AFTER = float(os.environ.get("HTTP_MAX_RETRY_AFTER", "2"))
+
+# Shared global-hits catalogue: refresh interval and how long a refresh may
+# spend resolving iTunes previews (runs in the background, not per request).
+GLOBAL_HITS_TTL = int(os.environ.get("GLOBAL_HITS_TTL", "3600"))
+GLOBAL_HITS_RESOLVE_DEADLINE = float(os.environ.get("GLOBAL_HITS_RESOLVE_DEADLINE", "30"))
+# The iTunes rate limit only lets a refresh resolve part of the playlist;
+# tracks still without a preview are retried every
+# GLOBAL_HITS_BACKFILL_INTERVAL seconds until the next refresh.
+GLOBAL_HITS_BACKFILL_INTERVAL = float(os.environ.get("GLOBAL_HITS_BACKFILL_INTERVAL", "60"))
+# Every refresh also writes the pool here (host-wide), for snapshot.py
+GLOBAL_HITS_STATE_PATH = os.environ.get("GLOBAL_HITS_STATE_PATH", os.path.join(CACHE_DIR, "global-hits.json"))
+
+# Warm-start snapshot (snapshot.py): preview cache entries and the
+# global-hits pool, written by `python snapshot.py save` and loaded once by
+# the gunicorn master before it forks (gunicorn.conf.py). Missing = cold start.
+WARM_SNAPSHOT_PATH = os.environ.get("WARM_SNAPSHOT_PATH", os.path.join(CACHE_DIR, "warm-snapshot.json.gz"))
+
+# Pre-generated quiz pool (see quiz_pool.py)
+QUIZ_POOL_CAPACITY = int(os.environ.get("QUIZ_POOL_CAPACITY", "16"))
+QUIZ_POOL_LOW_WATER = int(os.environ.get("QUIZ_POOL_LOW_WATER", "8"))
+QUIZ_POOL_CONCURRENCY = int(os.environ.get("QUIZ_POOL_CONCURRENCY", "1"))
+# Seconds a refill worker sleeps after each build, to yield to requests.
+QUIZ_POOL_REFILL_PAUSE = float(os.environ.get("QUIZ_POOL_REFILL_PAUSE", "0.05"))
+
+# Per-user Spotify response cache (see spotify_client.py). Within the TTL a
+# response is reused as-is; after it, it is revalidated with its ETag.
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "2000"))
+USER_CACHE_MAX_AGE = int(os.environ.get("USER_CACHE_MAX_AGE", str(24 * 3600)))
+ME_CACHE_TTL = int(os.environ.get("ME_CACHE_TTL", "300"))
+TOP_ITEMS_CACHE_TTL = int(os.environ.get("TOP_ITEMS_CACHE_TTL", "3600"))
+
+# Audio preview proxy (/api/preview/<id>): PREVIEW_PROXY=1 makes quiz
+# responses point at it instead of the Spotify / iTunes CDNs. Files are
+# kept on disk up to PREVIEW_PROXY_MAX_BYTES in total (oldest dropped first).
+PREVIEW_PROXY = os.environ.get("PREVIEW_PROXY", "0") == "1"
+PREVIEW_PROXY_DIR = os.environ.get("PREVIEW_PROXY_DIR", os.path.join(CACHE_DIR, "previews"))
+PREVIEW_PROXY_MAX_BYTES = int(os.environ.get("PREVIEW_PROXY_MAX_BYTES", str(2 * 1024 ** 3)))
+PREVIEW_PROXY_MAX_FILE = int(os.environ.get("PREVIEW_PROXY_MAX_FILE", str(5 * 1024 ** 2)))
+PREVIEW_PROXY_MAX_AGE = int(os.environ.get("PREVIEW_PROXY_MAX_AGE", str(365 * 24 * 3600)))
+
+# Top-artists quiz: how many of the user's top artists it uses, and their
+# top tracks (not user-specific, so shared by all users and workers via
+# ARTIST_TRACKS_CACHE_PATH, for ARTIST_TRACKS_TTL seconds, or
+# ARTIST_TRACKS_EMPTY_TTL when an artist has none; at most
+# ARTIST_TRACKS_CACHE_SIZE artists per worker in memory and
+# ARTIST_TRACKS_SHARED_SIZE in the SQLite file). Missing artists
+# are fetched at most ARTIST_FANOUT_CONCURRENCY at a time per worker, and a
+# quiz waits at most ARTIST_FANOUT_DEADLINE seconds for them.
+TOP_ARTISTS_LIMIT = int(os.environ.get("TOP_ARTISTS_LIMIT", "20"))
+ARTIST_TRACKS_MARKET = os.environ.get("ARTIST_TRACKS_MARKET", "US")
+ARTIST_TRACKS_TTL = int(os.environ.get("ARTIST_TRACKS_TTL", str(24 * 3600)))
+ARTIST_TRACKS_EMPTY_TTL = int(os.environ.get("ARTIST_TRACKS_EMPTY_TTL", "3600"))
+ARTIST_TRACKS_CACHE_PATH = os.environ.get("ARTIST_TRACKS_CACHE_PATH", os.path.join(CACHE_DIR, "artists.sqlite3"))
+ARTIST_TRACKS_CACHE_SIZE = int(os.environ.get("ARTIST_TRACKS_CACHE_SIZE", "5000"))
+ARTIST_TRACKS_SHARED_SIZE = int(os.environ.get("ARTIST_TRACKS_SHARED_SIZE", "50000"))
+ARTIST_FANOUT_CONCURRENCY = int(os.environ.get("ARTIST_FANOUT_CONCURRENCY", "8"))
+ARTIST_FANOUT_DEADLINE = float(os.environ.get("ARTIST_FANOUT_DEADLINE", "4"))
+
+# Daily challenge (/api/quiz/daily): one global-hits quiz per UTC day,
+# seeded by the date, built once and kept as a static JSON file in
+# DAILY_QUIZ_DIR (shared by all workers) for DAILY_QUIZ_KEEP_DAYS days.
+DAILY_QUIZ_DIR = os.environ.get("DAILY_QUIZ_DIR", os.path.join(CACHE_DIR, "daily"))
+DAILY_QUIZ_QUESTIONS = int(os.environ.get("DAILY_QUIZ_QUESTIONS", "10"))
+DAILY_QUIZ_KEEP_DAYS = int(os.environ.get("DAILY_QUIZ_KEEP_DAYS", "30"))
+
+# Multiplayer rooms (rooms.py): one quiz of ROOM_QUESTIONS questions per
+# room, played on a fixed timeline (ROOM_START_DELAY seconds of countdown,
+# then ROOM_QUESTION_SECONDS per question and ROOM_REVEAL_SECONDS showing
+# the answer) that every player receives over Server-Sent Events. Rooms
+# are kept in the SQLite file at ROOMS_PATH, shared by every worker on the
+# host (ROOMS_PATH="" keeps them in the worker that created them: run a
+# single worker then); workers pick up a start made elsewhere within
+# ROOM_SYNC_INTERVAL seconds. Unstarted rooms last ROOM_LOBBY_TTL seconds,
+# finished ones ROOM_LINGER seconds. At most ROOM_MAX rooms created per
+# worker and ROOM_MAX_LISTENERS streams per room in each worker; idle
+# streams get a keep-alive every ROOM_HEARTBEAT seconds. On thread workers
+# (sync, gthread) a stream holds a thread, so at most ROOM_THREAD_STREAMS
+# are open per worker and further players are sent to the polling endpoint.
+ROOMS_PATH = os.environ.get("ROOMS_PATH", os.path.join(CACHE_DIR, "rooms.sqlite3"))
+ROOM_QUESTIONS = int(os.environ.get("ROOM_QUESTIONS", "10"))
+ROOM_START_DELAY = float(os.environ.get("ROOM_START_DELAY", "5"))
+ROOM_QUESTION_SECONDS = float(os.environ.get("ROOM_QUESTION_SECONDS", "20"))
+ROOM_REVEAL_SECONDS = float(os.environ.get("ROOM_REVEAL_SECONDS", "5"))
+ROOM_LOBBY_TTL = int(os.environ.get("ROOM_LOBBY_TTL", "1800"))
+ROOM_LINGER = int(os.environ.get("ROOM_LINGER", "300"))
+ROOM_MAX = int(os.environ.get("ROOM_MAX", "1000"))
+ROOM_MAX_LISTENERS = int(os.environ.get("ROOM_MAX_LISTENERS", "1000"))
+ROOM_HEARTBEAT = float(os.environ.get("ROOM_HEARTBEAT", "15"))
+ROOM_SYNC_INTERVAL = float(os.environ.get("ROOM_SYNC_INTERVAL", "1"))
+ROOM_THREAD_STREAMS = int(os.environ.get("ROOM_THREAD_STREAMS", "2"))
+
+# Server-side Spotify token store (the session cookie only carries an
+# opaque session id). TOKEN_STORE_PATH="" keeps tokens in memory only, per
+# worker. Tokens unused for TOKEN_STORE_TTL seconds are forgotten; tokens
+# used within TOKEN_REFRESH_AHEAD seconds of expiry are refreshed in the
+# background.
+TOKEN_STORE_PATH = os.environ.get("TOKEN_STORE_PATH", os.path.join(CACHE_DIR, "tokens.sqlite3"))
+TOKEN_STORE_SIZE = int(os.environ.get("TOKEN_STORE_SIZE", "10000"))
+TOKEN_STORE_TTL = int(os.environ.get("TOKEN_STORE_TTL", str(30 * 24 * 3600)))
+TOKEN_REFRESH_AHEAD = float(os.environ.get("TOKEN_REFRESH_AHEAD", "300"))
+
+# Share in-flight iTunes lookups between worker processes (not just threads)
+# through a short lease in the SQLite preview cache tier.
+SINGLEFLIGHT_CROSS_WORKER = os.environ.get("SINGLEFLIGHT_CROSS_WORKER", "0") == "1"
+SINGLEFLIGHT_LEASE_TTL = float(os.environ.get("SINGLEFLIGHT_LEASE_TTL", "4"))
+
+# iTunes circuit breaker: consecutive failures before it opens, and seconds
+# it stays open before letting a trial request through.
+ITUNES_BREAKER_FAILURES = int(os.environ.get("ITUNES_BREAKER_FAILURES", "5"))
+ITUNES_BREAKER_RECOVERY = float(os.environ.get("ITUNES_BREAKER_RECOVERY", "30"))
+
+# Upstream rate budgets, per worker process (divide by the number of
+# workers if they share one outbound IP). Max waits are in seconds: a
+# caller that would wait longer gets a "rate limited" answer instead.
+ITUNES_RATE_PER_MINUTE = float(os.environ.get("ITUNES_RATE_PER_MINUTE", "20"))
+ITUNES_RATE_BURST = int(os.environ.get("ITUNES_RATE_BURST", "10"))
+ITUNES_INTERACTIVE_MAX_WAIT = float(os.environ.get("ITUNES_INTERACTIVE_MAX_WAIT", "2"))
+ITUNES_BACKGROUND_MAX_WAIT = float(os.environ.get("ITUNES_BACKGROUND_MAX_WAIT", "60"))
+SPOTIFY_RATE_PER_MINUTE = float(os.environ.get("SPOTIFY_RATE_PER_MINUTE", "600"))
+SPOTIFY_RATE_BURST = int(os.environ.get("SPOTIFY_RATE_BURST", "30"))
+SPOTIFY_INTERACTIVE_MAX_WAIT = float(os.environ.get("SPOTIFY_INTERACTIVE_MAX_WAIT", "2"))
+SPOTIFY_BACKGROUND_MAX_WAIT = float(os.environ.get("SPOTIFY_BACKGROUND_MAX_WAIT", "30"))
+
+# Playlist pages fetched in parallel after the first one, and how many
+# tracks the global-hits catalogue keeps from its playlist.
+SPOTIFY_PAGE_CONCURRENCY = int(os.environ.get("SPOTIFY_PAGE_CONCURRENCY", "4"))
+GLOBAL_HITS_MAX_TRACKS = int(os.environ.get("GLOBAL_HITS_MAX_TRACKS", "100"))
+
+# Async upstream clients (async_http.py; needs httpx, and flask[async] for
+# the async routes). Per-host limits on concurrent requests, shared by
+# every request in the worker.
+ASYNC_ROUTES = os.environ.get("ASYNC_ROUTES", "0") == "1"
+ASYNC_SPOTIFY_CONCURRENCY = int(os.environ.get("ASYNC_SPOTIFY_CONCURRENCY", "16"))
+ASYNC_ITUNES_CONCURRENCY = int(os.environ.get("ASYNC_ITUNES_CONCURRENCY", "8"))
+
+# Response compression (responses.py): JSON and text bodies of at least
+# COMPRESS_MIN_SIZE bytes are sent brotli- (if the brotli package is
+# installed) or gzip-encoded, whichever the client prefers.
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "5"))
+
+# Metrics (/metrics) and logging. Every worker writes its metrics to
+# METRICS_DIR every METRICS_FLUSH_INTERVAL seconds and /metrics adds them
+# all up. Counters of exited workers are kept in a running total there;
+# their gauges are dropped. METRICS_DIR="" reports the answering worker only.
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(CACHE_DIR, "metrics"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+# Logs are JSON lines on stderr, written off the request path. DEBUG/INFO
+# lines are kept with probability LOG_SAMPLE_RATE, and any one message is
+# logged at most LOG_BURST times per LOG_BURST_WINDOW seconds.
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+LOG_BURST = int(os.environ.get("LOG_BURST", "20"))
+LOG_BURST_WINDOW = float(os.environ.get("LOG_BURST_WINDOW", "60"))
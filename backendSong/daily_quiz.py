@@ -0,0 +1,162 @@
+# backendSong/daily_quiz.py
+
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+
+from config import DAILY_QUIZ_DIR, DAILY_QUIZ_KEEP_DAYS
+from singleflight import SingleFlight
+from logs import get_logger
+
+log = get_logger("daily_quiz")
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Cache lifetime (seconds) of /api/quiz/daily/<date>: it never changes
+DATED_MAX_AGE = 365 * 24 * 3600
+
+
+def today():
+    """The current daily-challenge date (UTC), as YYYY-MM-DD."""
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def seconds_until_tomorrow():
+    """Seconds until the next daily challenge (UTC midnight)."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tomorrow = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=datetime.timezone.utc
+    )
+    return max(1, int((tomorrow - now).total_seconds()))
+
+
+class DailyQuizStore:
+    """
+    One quiz per UTC day, written once as a static JSON file and then only
+    ever served from disk (no Spotify / iTunes calls, no quiz building).
+
+    `builder(date, rng)` returns the day's quiz dict (or None if it cannot
+    be built right now); `rng` is seeded with the date, so every worker and
+    host builds the same quiz from the same track pool. The first worker to
+    finish publishes the file and the others adopt it, so all of them serve
+    byte-identical responses (and ETags) all day.
+    """
+
+    def __init__(self, directory=DAILY_QUIZ_DIR, keep_days=DAILY_QUIZ_KEEP_DAYS):
+        self.directory = directory
+        self.keep_days = keep_days
+        self._builder = None
+        self._flight = SingleFlight()
+        self._etags = {}  # path -> sha256 of its bytes (files never change)
+        self._lock = threading.Lock()
+
+        self.builds = 0
+        self.build_failures = 0
+
+    def register(self, builder):
+        self._builder = builder
+
+    def _path(self, date):
+        return os.path.join(self.directory, f"daily-{date}.json")
+
+    def get(self, date=None):
+        """
+        (path, etag) of the quiz file for `date` (default: today), building
+        today's on first use. (None, status) otherwise: 404 for dates that
+        have no quiz, 503 if today's could not be built.
+        """
+        current = today()
+        date = date or current
+        if not _DATE_RE.match(date):
+            return None, 404
+
+        path = self._path(date)
+        if not os.path.exists(path):
+            if date != current:
+                return None, 404  # past quizzes are never rebuilt, future ones not yet
+            if not self._flight.do(date, self._build, date):
+                return None, 503
+        return path, self._etag(path)
+
+    def _etag(self, path):
+        etag = self._etags.get(path)
+        if etag is None:
+            with open(path, "rb") as f:
+                etag = hashlib.sha256(f.read()).hexdigest()
+            with self._lock:
+                self._etags[path] = etag
+        return etag
+
+    def _build(self, date):
+        path = self._path(date)
+        if os.path.exists(path):
+            return True  # another worker published it meanwhile
+
+        quiz = self._builder(date, random.Random(f"daily:{date}")) if self._builder else None
+        if not quiz or not quiz.get("questions"):
+            self.build_failures += 1
+            log.warning("daily_quiz_build_failed", date=date)
+            return False
+
+        body = json.dumps(
+            dict(quiz, date=date, source="daily"), separators=(",", ":"), sort_keys=True
+        ).encode()
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            try:
+                # link() fails if the file exists: the first published quiz wins
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            except OSError:
+                # No hard links on this file system: plain rename, unless
+                # someone beat us to it (a narrow race remains)
+                if not os.path.exists(path):
+                    os.replace(tmp, path)
+        finally:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+
+        self.builds += 1
+        log.info("daily_quiz_published", date=date, questions=len(quiz["questions"]))
+        self._prune(date)
+        return True
+
+    def _prune(self, current):
+        cutoff = (
+            datetime.date.fromisoformat(current) - datetime.timedelta(days=self.keep_days)
+        ).isoformat()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith("daily-") and name.endswith(".json") and name[6:-5] < cutoff:
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                with self._lock:
+                    self._etags.pop(os.path.join(self.directory, name), None)
+
+    def stats(self):
+        return {
+            "today": today(),
+            "published": os.path.exists(self._path(today())),
+            "builds": self.builds,
+            "build_failures": self.build_failures,
+        }
+
+
+# Shared by every request in this worker process
+store = DailyQuizStore()
@@ -0,0 +1,121 @@
+# backendSong/distractors.py
+
+import random
+import re
+from typing import Dict, List, Optional, Sequence
+
+from track import Track
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Too common to make two titles "similar"
+_STOP_WORDS = frozenset(
+    "a an and the of in on to for is it me my you your i we feat ft with from "
+    "remix version edit remastered live mix radio".split()
+)
+
+
+def _title_words(title: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(title.lower()) if w not in _STOP_WORDS and len(w) > 1]
+
+
+class DistractorSampler:
+    """
+    Picks wrong answer options for a track pool.
+
+    Built once per pool (O(N)); afterwards every draw of k distractors is
+    O(k) expected, by rejection sampling over an index of deduplicated
+    titles instead of copying and shuffling the whole title list.
+
+    Hard mode prefers titles by the same artist(s) or sharing a word with
+    the correct title, via indexes precomputed here.
+    """
+
+    def __init__(self, tracks: Sequence[Track]):
+        self.titles: List[str] = []
+        self._index: Dict[str, int] = {}
+        # artist (lowercase) -> title indexes
+        self._by_artist: Dict[str, List[int]] = {}
+        # significant title word -> title indexes
+        self._by_word: Dict[str, List[int]] = {}
+        # title index -> artists (lowercase) of the first track with that title
+        self._artists_of: List[tuple] = []
+
+        for t in tracks:
+            if t.name in self._index:
+                continue
+            i = self._index[t.name] = len(self.titles)
+            self.titles.append(t.name)
+
+            artists = tuple(a.lower() for a in t.artists)
+            self._artists_of.append(artists)
+            for a in artists:
+                self._by_artist.setdefault(a, []).append(i)
+            for w in set(_title_words(t.name)):
+                self._by_word.setdefault(w, []).append(i)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def sample(
+        self,
+        correct: str,
+        k: int,
+        rng: Optional[random.Random] = None,
+        hard: bool = False,
+    ) -> List[str]:
+        """
+        Up to k distinct titles other than `correct` (fewer only if the pool
+        doesn't have k other titles).
+        """
+        rng = rng or random
+        n = len(self.titles)
+        skip = self._index.get(correct)
+        others = n - (1 if skip is not None else 0)
+        k = max(0, min(k, others))
+        if k == 0:
+            return []
+
+        chosen: List[int] = []
+        seen = {skip} if skip is not None else set()
+
+        if hard and skip is not None:
+            for i in self._hard_candidates(skip, k, rng):
+                if i not in seen:
+                    seen.add(i)
+                    chosen.append(i)
+                    if len(chosen) == k:
+                        break
+
+        need = k - len(chosen)
+        if need and need * 2 > others - len(chosen):
+            # Asking for most of a tiny pool: rejection sampling would spin,
+            # and a full pass is cheap at this size anyway.
+            rest = [i for i in range(n) if i not in seen]
+            chosen.extend(rng.sample(rest, need))
+        else:
+            while len(chosen) < k:
+                i = rng.randrange(n)
+                if i not in seen:
+                    seen.add(i)
+                    chosen.append(i)
+
+        return [self.titles[i] for i in chosen]
+
+    def _hard_candidates(self, idx: int, k: int, rng) -> List[int]:
+        """Same-artist titles first, then titles sharing a word (each shuffled)."""
+        groups = [self._by_artist.get(a, ()) for a in self._artists_of[idx]]
+        groups += [self._by_word.get(w, ()) for w in _title_words(self.titles[idx])]
+
+        picked = []
+        for group in groups:
+            if len(group) > 4 * k:
+                # Big artist / common word: sample without copying the list
+                picked.extend(rng.sample(group, 4 * k))
+            else:
+                group = list(group)
+                rng.shuffle(group)
+                picked.extend(group)
+            if len(picked) >= 4 * k:
+                break
+        return picked
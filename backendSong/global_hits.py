@@ -0,0 +1,351 @@
+# backendSong/global_hits.py
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import List, Any, Optional
+
+from config import (
+    GLOBAL_HITS_TTL,
+    GLOBAL_HITS_RESOLVE_DEADLINE,
+    GLOBAL_HITS_BACKFILL_INTERVAL,
+    GLOBAL_HITS_MAX_TRACKS,
+    GLOBAL_HITS_STATE_PATH,
+)
+from spotify_auth import get_app_token
+from spotify_client import search_playlists, get_all_playlist_track_records
+from quiz_generator import generate_quiz_from_tracks, lookup_itunes_previews
+from rate_limiter import INTERACTIVE, BACKGROUND
+from singleflight import SingleFlight
+from distractors import DistractorSampler
+from track import Track
+from logs import get_logger
+from metrics import QUIZ_BUILD_SECONDS
+
+log = get_logger("global_hits")
+
+SEARCH_TERMS = ["Top 50 Global", "Today's Top Hits", "Global Top 50"]
+
+# Concurrent refreshes (e.g. a manual refresh racing the background one)
+# share their Spotify searches.
+_SEARCH_FLIGHT = SingleFlight()
+
+
+class GlobalHitsCatalogue:
+    """
+    Process-wide pool of "global hits" tracks.
+
+    The playlist is the same for every visitor, so it is resolved once with
+    an app token (client credentials), its tracks' previews are resolved
+    ahead of time, and the result is refreshed in the background every
+    `ttl` seconds. Requests only sample questions from memory.
+
+    Each refresh is also written to `state_path` (if set), so snapshot.py
+    can ship the pool to processes that have not loaded it yet.
+    """
+
+    def __init__(self, ttl=GLOBAL_HITS_TTL, search_terms=SEARCH_TERMS, state_path=GLOBAL_HITS_STATE_PATH):
+        self.ttl = ttl
+        self.search_terms = list(search_terms)
+        self.state_path = state_path
+
+        self.playlist_id: Optional[str] = None
+        self.tracks: List[Track] = []
+        self.sampler: Optional[DistractorSampler] = None
+        self.loaded_at = 0.0
+        # Bumped whenever `tracks` changes (refresh, backfill, restore), so
+        # quizzes built from an older pool can be told apart
+        self.generation = 0
+        self.last_error: Optional[Any] = None
+        # When the last refresh failed; requests back off from retrying it
+        self.last_failure = 0.0
+
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    # ---------- loading ----------
+
+    def _find_playlist_id(self, token, priority):
+        for term in self.search_terms:
+            search_data = _SEARCH_FLIGHT.do(
+                term, search_playlists, term, limit=5, token=token, priority=priority
+            )
+
+            if isinstance(search_data, tuple):
+                body, status = search_data
+                log.warning("global_hits_search_error", term=term, error=body)
+                continue
+
+            raw_playlists = (search_data.get("playlists") or {}).get("items") or []
+            playlists = [
+                p for p in raw_playlists
+                if isinstance(p, dict) and p.get("id")
+            ]
+
+            if playlists:
+                log.debug("global_hits_playlist_found", term=term, playlist_id=playlists[0]["id"])
+                return playlists[0]["id"]
+
+        return None
+
+    def _fetch_tracks(self, playlist_id, token, priority):
+        tracks = get_all_playlist_track_records(
+            playlist_id, max_tracks=GLOBAL_HITS_MAX_TRACKS, token=token, priority=priority
+        )
+
+        if isinstance(tracks, tuple):
+            body, status = tracks
+            log.warning("global_hits_playlist_error", playlist_id=playlist_id, error=body)
+            self.last_error = body
+            return None
+
+        if tracks is None:
+            log.warning("global_hits_unexpected_playlist_response", playlist_id=playlist_id)
+            self.last_error = "unexpected_playlist_response"
+            return None
+
+        if not tracks:
+            self.last_error = "empty_playlist"
+        return tracks
+
+    @staticmethod
+    def _resolve_previews(tracks, priority):
+        """
+        Return `tracks` with preview_url filled from iTunes where Spotify has
+        none, so quizzes built later need no lookups at all.
+        """
+        lookups = [(i, t) for i, t in enumerate(tracks) if not t.preview_url]
+
+        found = lookup_itunes_previews(
+            lookups, deadline=GLOBAL_HITS_RESOLVE_DEADLINE, priority=priority
+        )
+
+        return [
+            t.with_preview(found[i]) if found.get(i) else t
+            for i, t in enumerate(tracks)
+        ]
+
+    def missing_previews(self):
+        """How many tracks in the pool have no preview yet."""
+        return sum(1 for t in self.tracks if not t.preview_url)
+
+    def backfill_previews(self, priority=BACKGROUND):
+        """
+        Retry the iTunes lookups of tracks that are still without a preview.
+        A refresh only gets through part of the playlist within the iTunes
+        rate limit; its late lookups land in the preview cache, so they are
+        picked up here without another request, and the rest get another
+        try. Returns how many tracks gained a preview.
+        """
+        tracks = self.tracks
+        missing = [(i, t) for i, t in enumerate(tracks) if not t.preview_url]
+        if not missing:
+            return 0
+
+        found = lookup_itunes_previews(
+            missing, deadline=GLOBAL_HITS_RESOLVE_DEADLINE, priority=priority
+        )
+        found = {i: url for i, url in found.items() if url}
+        if not found:
+            return 0
+
+        with self._refresh_lock:
+            if self.tracks is not tracks:
+                return 0  # a refresh replaced the pool meanwhile
+            self.tracks = [
+                t.with_preview(found[i]) if i in found else t
+                for i, t in enumerate(tracks)
+            ]
+            self.generation += 1
+            self._save_state()
+        log.info("global_hits_previews_backfilled", found=len(found), missing=len(missing) - len(found))
+        return len(found)
+
+    def refresh(self, only_if_empty=False, only_if_stale=False, priority=BACKGROUND):
+        """
+        Re-resolve the playlist and its tracks. Keeps serving the previous
+        tracks if anything fails. Returns True on success.
+
+        Runs at BACKGROUND priority unless a player is waiting on it.
+        """
+        with self._refresh_lock:
+            if only_if_empty and self.tracks:
+                # Someone else loaded the pool while we waited for the lock
+                return True
+            if only_if_stale and self.tracks and time.time() - self.loaded_at < self.ttl:
+                return True
+
+            ok = False
+            try:
+                ok = self._load(priority)
+                return ok
+            finally:
+                if not ok:
+                    self.last_failure = time.time()
+
+    def _load(self, priority):
+        """The body of refresh(). Caller holds _refresh_lock."""
+        token = get_app_token()
+        if not token:
+            self.last_error = "app_token_unavailable"
+            return False
+
+        playlist_id = self._find_playlist_id(token, priority) or self.playlist_id
+        if not playlist_id:
+            log.warning("global_hits_no_playlist_found")
+            self.last_error = "no_playlist_found"
+            return False
+
+        with QUIZ_BUILD_SECONDS.time(phase="fetch"):
+            tracks = self._fetch_tracks(playlist_id, token, priority)
+        if not tracks:
+            return False
+
+        tracks = self._resolve_previews(tracks, priority)
+        # A reader racing this swap may pair old tracks with the new
+        # sampler; that only means distractors from the newer pool.
+        self.sampler = DistractorSampler(tracks)
+        self.tracks = tracks
+        self.playlist_id = playlist_id
+        self.loaded_at = time.time()
+        self.generation += 1
+        self.last_error = None
+        log.info("global_hits_refreshed", playlist_id=playlist_id, tracks=len(tracks))
+        self._save_state()
+        return True
+
+    # ---------- warm start ----------
+
+    def export(self):
+        """The current pool as JSON-able state, or None if nothing is loaded."""
+        if not self.tracks:
+            return None
+        return {
+            "playlist_id": self.playlist_id,
+            "loaded_at": self.loaded_at,
+            "tracks": [t.to_row() for t in self.tracks],
+        }
+
+    def restore(self, state):
+        """
+        Adopt a pool from export() unless ours is at least as fresh. A stale
+        one is still served, and refreshed in the background on first use.
+        """
+        if not state or not state.get("tracks") or state.get("loaded_at", 0) <= self.loaded_at:
+            return False
+        tracks = [Track.from_row(row) for row in state["tracks"]]
+        with self._refresh_lock:
+            self.sampler = DistractorSampler(tracks)
+            self.tracks = tracks
+            self.playlist_id = state.get("playlist_id")
+            self.loaded_at = state["loaded_at"]
+            self.generation += 1
+        return True
+
+    def load_state(self):
+        """The state last written by any process on this host, or None."""
+        if not self.state_path:
+            return None
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.export(), f, separators=(",", ":"))
+            os.replace(tmp, self.state_path)
+        except OSError as e:
+            log.warning("global_hits_state_write_failed", path=self.state_path, error=str(e))
+
+    # ---------- background refresh ----------
+
+    def _refresh_loop(self):
+        while True:
+            wait = self.loaded_at + self.ttl - time.time()
+            if self.tracks and self.missing_previews():
+                wait = min(wait, GLOBAL_HITS_BACKFILL_INTERVAL)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                if self.tracks and time.time() - self.loaded_at < self.ttl:
+                    self.backfill_previews()
+                    ok = True
+                else:
+                    ok = self.refresh(only_if_stale=True)
+            except Exception:
+                log.exception("global_hits_refresh_failed")
+                ok = False
+            if not ok:
+                # Back off before retrying; keep serving the stale pool.
+                time.sleep(min(60, self.ttl))
+
+    def _ensure_refresher(self):
+        # Started lazily (on first use, i.e. inside a worker process) so no
+        # thread is created before gunicorn forks.
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._refresh_loop,
+                    name="global-hits-refresh",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    # ---------- serving ----------
+
+    def get_tracks(self):
+        """
+        Current track pool. Only the very first call in a process waits for
+        Spotify; afterwards the pool is refreshed in the background.
+        """
+        # Waits for a refresh already in flight (on _refresh_lock), but
+        # doesn't let every request hammer Spotify while it is failing.
+        if not self.tracks and time.time() - self.last_failure > 30:
+            self.refresh(only_if_empty=True, priority=INTERACTIVE)
+        self._ensure_refresher()
+        return self.tracks
+
+    def build_quiz(self, num_questions=5, options_per_q=4, hard=False, rng=None):
+        tracks = self.get_tracks()
+        sampler = self.sampler
+        if not tracks:
+            return None
+        # Ask about tracks that have audio while enough of them do; the
+        # sampler still draws wrong options from the whole playlist
+        playable = [t for t in tracks if t.preview_url]
+        return generate_quiz_from_tracks(
+            playable if len(playable) >= num_questions else tracks,
+            num_questions=num_questions,
+            options_per_q=options_per_q,
+            resolve_previews=False,
+            sampler=sampler,
+            hard=hard,
+            rng=rng,
+        )
+
+    def stats(self):
+        return {
+            "playlist_id": self.playlist_id,
+            "tracks": len(self.tracks),
+            "age_seconds": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+            "ttl": self.ttl,
+            "generation": self.generation,
+            "last_error": self.last_error,
+        }
+
+
+# Shared by every request in this worker process
+catalogue = GlobalHitsCatalogue()
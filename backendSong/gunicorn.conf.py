@@ -0,0 +1,89 @@
+# backendSong/gunicorn.conf.py
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# The master preloads the app and the warm-start snapshot (snapshot.py)
+# once, then forks: every worker, including ones recycled later, starts
+# with the preview cache and global-hits pool already in memory, shared
+# copy-on-write. Background threads (refreshers, pools, the async I/O
+# loop) are only ever started inside workers, so forking stays safe.
+
+import gc
+import os
+import sys
+
+
+def _cli_worker_class():
+    # gunicorn reads this file (it is the default config) before applying
+    # `-k` from its command line, but the gevent patching below cannot wait
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg in ("-k", "--worker-class") and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith("--worker-class="):
+            return arg.split("=", 1)[1]
+        if arg.startswith("-k") and len(arg) > 2:
+            return arg[2:]
+    return None
+
+
+wsgi_app = "app:create_app()"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:" + os.environ.get("PORT", "8000"))
+worker_class = _cli_worker_class() or os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+keepalive = 5
+
+# Recycle workers now and then (with jitter, so not all at once); they
+# come back from the preloaded master, not cold.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+if worker_class == "gevent":
+    # Patch before the master imports the app (and with it requests / ssl)
+    from gevent import monkey
+
+    monkey.patch_all()
+
+
+def _load_snapshot(log):
+    import snapshot
+
+    summary = snapshot.load()
+    if summary is None:
+        log.info("No warm-start snapshot, starting cold")
+    else:
+        log.info("Warm-start snapshot loaded: %s", summary)
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded, before any fork
+    if server.cfg.preload_app:
+        _load_snapshot(server.log)
+        # Keep the garbage collector from touching (and so copying) every
+        # page the workers inherit
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        _load_snapshot(worker.log)
+
+
+def worker_exit(server, worker):
+    # Last snapshot, so child_exit below has everything this worker counted
+    import metrics
+
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    # Runs in the master: keep the exited worker's counters in /metrics
+    # totals and drop its gauges
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,101 @@
+# backendSong/http_session.py
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from config import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_FACTOR,
+    HTTP_MAX_RETRY_AFTER,
+)
+
+# One pooled, keep-alive session per upstream host. requests.Session is
+# safe to share between threads for plain GET/POST usage like ours.
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class _CappedRetry(Retry):
+    """
+    Retry that honours Retry-After, but refuses to sleep for longer than
+    HTTP_MAX_RETRY_AFTER seconds: a long Spotify 429 back-off is handed
+    straight back to the caller instead of pinning a worker.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > HTTP_MAX_RETRY_AFTER:
+                # With raise_on_status=False urllib3 returns the response as-is.
+                raise MaxRetryError(_pool, url, ResponseError(f"Retry-After {retry_after}s too long"))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def _make_retry(retries):
+    kwargs = dict(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # Only idempotent requests are retried; token POSTs never are.
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        # Hand the final 429/5xx response back instead of raising, so the
+        # callers' existing status handling keeps working.
+        raise_on_status=False,
+    )
+    try:
+        return _CappedRetry(backoff_jitter=HTTP_BACKOFF_FACTOR, **kwargs)
+    except TypeError:
+        # urllib3 < 2 has no backoff_jitter.
+        return _CappedRetry(**kwargs)
+
+
+def get_session(host, retries=HTTP_MAX_RETRIES):
+    """
+    Return the shared session for `host` (e.g. "api.spotify.com"),
+    creating it with a sized connection pool and retry policy on first use.
+    """
+    key = (host, retries)
+    session = _SESSIONS.get(key)
+    if session is not None:
+        return session
+
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+                max_retries=_make_retry(retries),
+            )
+            session.mount(f"https://{host}", adapter)
+            session.mount(f"http://{host}", adapter)
+            _SESSIONS[key] = session
+    return session
+
+
+def timeout(read):
+    """(connect, read) timeout tuple for requests."""
+    return (HTTP_CONNECT_TIMEOUT, read)
+
+
+def reset_sessions():
+    """
+    Drop every pooled session. Call in a freshly forked worker so no
+    sockets are shared with the parent process.
+    """
+    with _SESSIONS_LOCK:
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
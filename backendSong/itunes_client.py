@@ -1,99 +1,306 @@
 # backendSong/itunes_client.py
 
-import re
+import asyncio
+import time
+from urllib.parse import urlsplit
+
 import requests
 
-# Simple in-memory cache: {(track_lower, artist_lower): preview_url_or_empty}
-_ITUNES_CACHE = {}
+import async_http
+import preview_index
+from http_session import get_session, timeout
+from circuit_breaker import CircuitBreaker
+from config import (
+    SINGLEFLIGHT_CROSS_WORKER,
+    SINGLEFLIGHT_LEASE_TTL,
+    ITUNES_BREAKER_FAILURES,
+    ITUNES_BREAKER_RECOVERY,
+    ITUNES_RATE_PER_MINUTE,
+    ITUNES_RATE_BURST,
+    ITUNES_INTERACTIVE_MAX_WAIT,
+    ITUNES_BACKGROUND_MAX_WAIT,
+    ITUNES_SEARCH_LIMIT,
+    ITUNES_SEARCH_URL,
+)
+from preview_cache import MISS, PreviewCache, build_preview_cache
+from rate_limiter import RateLimiter, INTERACTIVE
+from singleflight import AsyncSingleFlight, SingleFlight
+from track_matching import best_match
+from logs import get_logger
+import metrics
 
+log = get_logger("itunes")
 
-def _normalize_title(s: str) -> str:
-    """
-    Normalize song titles so we can compare iTunes results to the
-    expected track name more robustly.
+# (track, artist) -> preview URL, or "" for a cached "no match".
+# In-process LRU, plus a host-wide SQLite tier when configured.
+_ITUNES_CACHE = build_preview_cache()
 
-    Examples:
-      "Bound 2 (Album Version)"  -> "bound 2"
-      "Bound 2 - Radio Edit"     -> "bound 2"
-      "Heartless"                -> "heartless"
-    """
-    if not s:
-        return ""
-    s = s.lower()
-    # remove parentheses and bracket content: (..), [..]
-    s = re.sub(r"\(.*?\)", "", s)
-    s = re.sub(r"\[.*?\]", "", s)
-    # keep only letters, digits, and spaces
-    s = re.sub(r"[^a-z0-9\s]", "", s)
-    # collapse multiple spaces
-    s = re.sub(r"\s+", " ", s)
-    return s.strip()
-
-
-def find_itunes_preview(track, artist=None):
+ITUNES_HOST = urlsplit(ITUNES_SEARCH_URL).hostname
+
+# While iTunes is failing we stop calling it (and stop waiting on it) and
+# serve questions without iTunes audio until a trial call succeeds again.
+_ITUNES_BREAKER = CircuitBreaker(
+    "itunes",
+    failure_threshold=ITUNES_BREAKER_FAILURES,
+    recovery_timeout=ITUNES_BREAKER_RECOVERY,
+)
+
+# iTunes Search allows roughly 20 requests/minute per IP. Player-facing
+# lookups go first; refills and warm-ups only use leftover capacity.
+_ITUNES_LIMITER = RateLimiter("itunes", ITUNES_RATE_PER_MINUTE, ITUNES_RATE_BURST)
+_MAX_WAIT = {INTERACTIVE: ITUNES_INTERACTIVE_MAX_WAIT}
+
+# Concurrent lookups for the same (track, artist) share one iTunes request;
+# optionally across workers too, via a lease in the shared cache tier.
+_ITUNES_FLIGHT = SingleFlight(
+    lease_backend=_ITUNES_CACHE.backend if SINGLEFLIGHT_CROSS_WORKER else None,
+    lease_ttl=SINGLEFLIGHT_LEASE_TTL,
+)
+# The same for find_itunes_preview_async, whose lookups all run on the
+# shared async I/O loop.
+_ITUNES_ASYNC_FLIGHT = AsyncSingleFlight()
+
+
+def find_itunes_preview(track, artist=None, priority=INTERACTIVE, duration_ms=None, isrc=None):
     """
     Query Apple's iTunes Search API for a preview MP3, but only accept
-    results whose track title *really* matches the requested track name.
+    a result that scores as the same recording (title words, artist,
+    and duration / ISRC when Spotify gave us them; see track_matching).
 
     If no close match is found, returns None instead of a wrong song.
+    `priority` (rate_limiter.INTERACTIVE / BACKGROUND) decides who gets
+    the iTunes rate budget first; if it is exhausted, returns None too.
     """
     if not track:
         return None
 
-    key = (track.strip().lower(), (artist or "").strip().lower())
+    # 0) The offline bulk index answers without any network (preview_index.py)
+    indexed = indexed_preview(track, artist, isrc)
+    if indexed:
+        return indexed
 
     # 1) Check cache first (even cached failures)
-    if key in _ITUNES_CACHE:
-        cached = _ITUNES_CACHE[key]
+    cached = _ITUNES_CACHE.get(track, artist)
+    if cached is not MISS:
         return cached or None
 
-    base = "https://itunes.apple.com/search"
+    # 2) Fail fast while iTunes is known to be down
+    if _ITUNES_BREAKER.is_open():
+        metrics.UPSTREAM_SKIPPED.inc(upstream="itunes", reason="circuit_open")
+        return None
+
+    # 3) Otherwise ask iTunes, sharing the request with concurrent callers
+    def peek():
+        value = _ITUNES_CACHE.backend.get(PreviewCache.make_key(track, artist))
+        return value if value is MISS else (value or None)
+
+    return _ITUNES_FLIGHT.do(
+        PreviewCache.make_key(track, artist),
+        _search_itunes,
+        track,
+        artist,
+        priority,
+        duration_ms,
+        peek=peek,
+    )
+
+
+def _search_itunes(track, artist, priority=INTERACTIVE, duration_ms=None):
+    """
+    The actual iTunes request behind find_itunes_preview.
+
+    Real answers (including "no matching song") are cached. Transient
+    failures (network errors, 429/5xx, garbage bodies) are not, so they
+    never poison the cache; they count against the circuit breaker instead.
+
+    Rate budget comes first and the breaker second, so a half-open
+    breaker's single trial slot is only taken by a request that is really
+    sent; its permit is released on every way out, which frees the slot
+    only if this call held it (see CircuitBreaker.release).
+    """
+    if not _ITUNES_LIMITER.acquire(priority, _MAX_WAIT.get(priority, ITUNES_BACKGROUND_MAX_WAIT)):
+        # Out of rate budget: degrade to "no audio" without caching anything
+        metrics.UPSTREAM_SKIPPED.inc(upstream="itunes", reason="rate_limited")
+        return None
+
+    permit = _ITUNES_BREAKER.allow()
+    if not permit:
+        metrics.UPSTREAM_SKIPPED.inc(upstream="itunes", reason="circuit_open")
+        return None
+
+    try:
+        started = time.perf_counter()
+        try:
+            # A single quick retry at most: the quiz has its own overall deadline.
+            resp = get_session(ITUNES_HOST, retries=1).get(
+                ITUNES_SEARCH_URL, params=_search_params(track, artist), timeout=timeout(3)
+            )
+        except requests.RequestException as e:
+            return _request_failed(e, started)
+
+        _observe(resp.status_code, started)
+
+        return _handle_search_response(resp, track, artist, duration_ms)
+    finally:
+        _ITUNES_BREAKER.release(permit)
+
+
+async def find_itunes_preview_async(track, artist=None, priority=INTERACTIVE, duration_ms=None, isrc=None):
+    """
+    find_itunes_preview for coroutines (same caching, breaker and rate
+    budget), over the shared async connection pool. Needs httpx.
+    """
+    if not track:
+        return None
+
+    indexed = indexed_preview(track, artist, isrc)
+    if indexed:
+        return indexed
+
+    # The cache may block on SQLite (busy timeout): keep it off the loop
+    cached = await asyncio.to_thread(_ITUNES_CACHE.get, track, artist)
+    if cached is not MISS:
+        return cached or None
+
+    if _ITUNES_BREAKER.is_open():
+        metrics.UPSTREAM_SKIPPED.inc(upstream="itunes", reason="circuit_open")
+        return None
+
+    return await async_http.run(_ITUNES_ASYNC_FLIGHT.do(
+        PreviewCache.make_key(track, artist),
+        _search_itunes_async,
+        track,
+        artist,
+        priority,
+        duration_ms,
+    ))
+
+
+async def _search_itunes_async(track, artist, priority=INTERACTIVE, duration_ms=None):
+    """_search_itunes for the async I/O loop."""
+    if not await _ITUNES_LIMITER.acquire_async(priority, _MAX_WAIT.get(priority, ITUNES_BACKGROUND_MAX_WAIT)):
+        metrics.UPSTREAM_SKIPPED.inc(upstream="itunes", reason="rate_limited")
+        return None
+
+    permit = _ITUNES_BREAKER.allow()
+    if not permit:
+        metrics.UPSTREAM_SKIPPED.inc(upstream="itunes", reason="circuit_open")
+        return None
+
+    try:
+        started = time.perf_counter()
+        try:
+            resp = await async_http.get(
+                ITUNES_HOST, ITUNES_SEARCH_URL, params=_search_params(track, artist), read_timeout=3, retries=1
+            )
+        except async_http.HTTPError as e:
+            return _request_failed(e, started)
+
+        _observe(resp.status_code, started)
 
+        preview, answer = _read_search_response(resp, track, artist, duration_ms)
+        if answer is not None:
+            await asyncio.to_thread(_ITUNES_CACHE.set, track, artist, answer)
+        return preview
+    finally:
+        _ITUNES_BREAKER.release(permit)
+
+
+def _observe(status, started):
+    metrics.observe_upstream("itunes", "search", status, time.perf_counter() - started)
+
+
+def _request_failed(error, started):
+    log.warning("itunes_request_error", error=str(error))
+    _observe("error", started)
+    _ITUNES_BREAKER.record_failure()
+    return None
+
+
+def _search_params(track, artist):
     # Build search query
     query = track
     if artist:
         query += f" {artist}"
 
-    params = {
+    # One search with room for remasters, live cuts and covers to compete,
+    # rather than a narrow search plus retries.
+    return {
         "term": query,
         "media": "music",
-        "limit": 5
+        "entity": "song",
+        "limit": ITUNES_SEARCH_LIMIT,
     }
 
-    try:
-        resp = requests.get(base, params=params, timeout=3)
-    except requests.RequestException as e:
-        print("iTunes API request error:", e)
-        _ITUNES_CACHE[key] = ""
-        return None
 
+def _handle_search_response(resp, track, artist, duration_ms):
+    """Pick the preview out of a requests / httpx search response, caching the answer."""
+    preview, answer = _read_search_response(resp, track, artist, duration_ms)
+    if answer is not None:
+        _ITUNES_CACHE.set(track, artist, answer)
+    return preview
+
+
+def _read_search_response(resp, track, artist, duration_ms):
+    """
+    (preview or None, answer to cache): the answer is the preview URL,
+    "" for no match, or None when the response was an error.
+    """
     if resp.status_code != 200:
-        print("iTunes API error:", resp.status_code, resp.text)
-        _ITUNES_CACHE[key] = ""
-        return None
+        log.warning("itunes_error_response", status=resp.status_code, body=resp.text[:200])
+        _ITUNES_BREAKER.record_failure()
+        return None, None
+
+    try:
+        data = resp.json()
+    except ValueError:
+        log.warning("itunes_non_json_response")
+        _ITUNES_BREAKER.record_failure()
+        return None, None
+
+    _ITUNES_BREAKER.record_success()
 
-    data = resp.json()
     results = data.get("results", [])
     if not results:
-        _ITUNES_CACHE[key] = ""
-        return None
+        return None, ""
 
-    norm_target = _normalize_title(track)
+    item, _ = best_match(results, track, artist, duration_ms)
+    if item is None:
+        # If nothing matches well, don't use iTunes preview at all
+        return None, ""
 
-    # Only accept results with a normalized title that matches exactly
-    for item in results:
-        preview = item.get("previewUrl")
-        title = item.get("trackName") or item.get("collectionName")
-        if not preview or not title:
-            continue
+    preview = item["previewUrl"]
+    return preview, preview
 
-        norm_title = _normalize_title(title)
 
-        # Strict: must be the same normalized title
-        if norm_title == norm_target:
-            _ITUNES_CACHE[key] = preview
-            return preview
+def indexed_preview(track, artist=None, isrc=None):
+    """Preview URL from the offline index (preview_index.py), or None."""
+    url = preview_index.lookup(track, artist, isrc)
+    if url:
+        metrics.PREVIEW_CACHE_LOOKUPS.inc(result="index")
+    return url
 
-    # If nothing matches well, don't use iTunes preview at all
-    _ITUNES_CACHE[key] = ""
-    return None
+
+def itunes_available():
+    """False while the iTunes circuit breaker is open."""
+    return not _ITUNES_BREAKER.is_open()
+
+
+def preview_cache_stats():
+    """Hit/miss/eviction counters for the preview cache (all tiers)."""
+    return dict(
+        _ITUNES_CACHE.stats(),
+        singleflight=_ITUNES_FLIGHT.stats(),
+        async_singleflight=_ITUNES_ASYNC_FLIGHT.stats(),
+        index=preview_index.stats(),
+    )
+
+
+def export_preview_cache():
+    """Live preview lookups, for a warm-start snapshot (see snapshot.py)."""
+    return _ITUNES_CACHE.dump()
+
+
+def restore_preview_cache(entries):
+    """Seed the preview cache from export_preview_cache() output."""
+    return _ITUNES_CACHE.restore(entries)
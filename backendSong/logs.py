@@ -0,0 +1,158 @@
+# backendSong/logs.py
+
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from config import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_BURST, LOG_BURST_WINDOW
+
+_QUEUE_SIZE = 10000
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            "pid": record.process,
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _BackgroundHandler(logging.Handler):
+    """
+    Hands records to a writer thread, so logging never blocks a request
+    on stderr. If the queue is full the record is dropped (and counted).
+    The writer thread is started lazily in each process, after any fork.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__()
+        self.stream = stream or sys.stderr
+        self.dropped = 0
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=_QUEUE_SIZE)
+                threading.Thread(target=self._write_loop, name="log-writer", daemon=True).start()
+                self._pid = os.getpid()
+
+    def emit(self, record):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        q = self._queue
+        while True:
+            record = q.get()
+            try:
+                self.stream.write(self.format(record) + "\n")
+                if q.empty():
+                    self.stream.flush()
+            except Exception:
+                self.handleError(record)
+
+
+class _Burst:
+    __slots__ = ("window_start", "count", "suppressed")
+
+    def __init__(self):
+        self.window_start = 0.0
+        self.count = 0
+        self.suppressed = 0
+
+
+class StructLogger:
+    """
+    Leveled, structured logger: log.info("event_name", key=value, ...).
+
+    Warnings and errors are always kept. DEBUG / INFO records are sampled
+    (LOG_SAMPLE_RATE). Each distinct event is logged at most LOG_BURST
+    times per LOG_BURST_WINDOW seconds; the next record that gets through
+    says how many were suppressed.
+    """
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(name)
+        self._bursts = {}
+        self._lock = threading.Lock()
+
+    def _allow(self, level, event):
+        if level < logging.WARNING and LOG_SAMPLE_RATE < 1 and random.random() >= LOG_SAMPLE_RATE:
+            return False, 0
+
+        now = time.monotonic()
+        with self._lock:
+            burst = self._bursts.get(event)
+            if burst is None:
+                burst = self._bursts[event] = _Burst()
+            if now - burst.window_start >= LOG_BURST_WINDOW:
+                burst.window_start, burst.count = now, 0
+            if burst.count >= LOG_BURST:
+                burst.suppressed += 1
+                return False, 0
+            burst.count += 1
+            suppressed, burst.suppressed = burst.suppressed, 0
+            return True, suppressed
+
+    def log(self, level, event, exc_info=None, **fields):
+        if not self._logger.isEnabledFor(level):
+            return
+        allowed, suppressed = self._allow(level, event)
+        if not allowed:
+            return
+        if suppressed:
+            fields["suppressed"] = suppressed
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event, **fields):
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+_handler = _BackgroundHandler()
+_handler.setFormatter(_JSONFormatter())
+
+_root = logging.getLogger("trackguessr")
+_root.addHandler(_handler)
+_root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+_root.propagate = False
+
+
+def get_logger(name):
+    """StructLogger for a module, e.g. get_logger("itunes")."""
+    return StructLogger(f"trackguessr.{name}")
+
+
+def dropped_records():
+    return _handler.dropped
@@ -0,0 +1,382 @@
+# backendSong/metrics.py
+
+import bisect
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, folding is best effort
+    fcntl = None
+
+# Latency buckets (seconds) for everything we time
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Snapshots of workers that stopped writing this long ago are treated as
+# dead, even if their pid exists (it may have been reused)
+_STALE_AFTER = 600
+
+# Counters and histograms of workers that have exited, summed, so totals
+# never go down (Prometheus would read that as a counter reset)
+_AGGREGATE = "aggregate.json"
+_WORKER_FILE_RE = re.compile(r"worker-(\d+)\.json$")
+
+# name -> metric, in registration order
+_METRICS = {}
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        _METRICS[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v if not isinstance(v, list) else list(v)] for k, v in self._series.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Summed across workers (e.g. queue depths, open breakers)."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [count per bucket..., +Inf count, sum]
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+# ---------- shared metrics ----------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "trackguessr_http_request_duration_seconds",
+    "Time to produce a response, per route.",
+    ("route", "method", "status"),
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "trackguessr_upstream_request_duration_seconds",
+    "Upstream HTTP calls by upstream, endpoint and status (or 'error').",
+    ("upstream", "endpoint", "status"),
+)
+UPSTREAM_SKIPPED = Counter(
+    "trackguessr_upstream_skipped_total",
+    "Upstream calls not made, by reason (rate_limited, circuit_open).",
+    ("upstream", "reason"),
+)
+PREVIEW_CACHE_LOOKUPS = Counter(
+    "trackguessr_preview_cache_lookups_total",
+    "iTunes preview lookups by result (index, hit, negative_hit, miss).",
+    ("result",),
+)
+QUIZ_BUILD_SECONDS = Histogram(
+    "trackguessr_quiz_build_phase_seconds",
+    "Quiz build time by phase (fetch, resolve_previews, assemble).",
+    ("phase",),
+)
+RESPONSE_BYTES = Counter(
+    "trackguessr_http_response_bytes_total",
+    "Bytes of compressed responses before (raw) and after (sent) encoding.",
+    ("encoding", "stage"),
+)
+
+QUIZ_POOL_DEPTH = Gauge(
+    "trackguessr_quiz_pool_depth",
+    "Ready pre-built quizzes per pool source (all workers).",
+    ("source",),
+)
+CIRCUIT_OPEN = Gauge(
+    "trackguessr_circuit_breaker_open",
+    "Workers whose circuit breaker for an upstream is open.",
+    ("upstream",),
+)
+ROOMS_OPEN = Gauge(
+    "trackguessr_rooms_open",
+    "Multiplayer rooms by state (lobby, playing, finished).",
+    ("state",),
+)
+ROOM_LISTENERS = Gauge(
+    "trackguessr_room_listeners",
+    "Open multiplayer room event streams.",
+)
+
+
+def observe_upstream(upstream, endpoint, status, seconds):
+    UPSTREAM_REQUEST_SECONDS.observe(seconds, upstream=upstream, endpoint=endpoint, status=status)
+
+
+# ---------- cross-worker aggregation ----------
+
+_collectors = []
+
+
+def add_collector(fn):
+    """fn() is called before every snapshot, e.g. to update gauges. Usable as a decorator."""
+    _collectors.append(fn)
+    return fn
+
+
+def _snapshot():
+    for fn in _collectors:
+        try:
+            fn()
+        except Exception:
+            pass
+    return {
+        name: {
+            "kind": m.kind,
+            "help": m.help,
+            "labels": list(m.labels),
+            "buckets": list(getattr(m, "buckets", ())),
+            "series": m.snapshot(),
+        }
+        for name, m in _METRICS.items()
+    }
+
+
+class _Flusher:
+    """Writes this worker's snapshot to METRICS_DIR periodically (started lazily, per process)."""
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not METRICS_DIR or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                threading.Thread(target=self._loop, name="metrics-flush", daemon=True).start()
+                self._pid = os.getpid()
+
+    def _loop(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            try:
+                flush()
+            except OSError:
+                pass
+
+
+_FLUSHER = _Flusher()
+
+
+def ensure_flushing():
+    """Call from request handling so each worker starts reporting."""
+    _FLUSHER.ensure_started()
+
+
+def _write(path, snapshot):
+    fd, tmp = tempfile.mkstemp(dir=METRICS_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(json.dumps(snapshot))
+    os.replace(tmp, path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Atomically write this worker's snapshot to METRICS_DIR."""
+    if not METRICS_DIR:
+        return
+    _write(os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json"), _snapshot())
+
+
+@contextmanager
+def _dir_lock(exclusive):
+    """Folding (exclusive) vs reading (shared) METRICS_DIR, across processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(METRICS_DIR, "lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _alive(pid):
+    if os.name == "nt":
+        return True  # os.kill would terminate it; rely on _STALE_AFTER
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, owned by someone else
+    return True
+
+
+def _fold(path):
+    """
+    Add a dead worker's counters and histograms to the aggregate and drop
+    its snapshot, gauges and all. Caller holds the exclusive _dir_lock.
+    """
+    snapshot = _read(path)
+    if snapshot is not None:
+        aggregate_path = os.path.join(METRICS_DIR, _AGGREGATE)
+        kept = {name: m for name, m in snapshot.items() if m["kind"] != "gauge"}
+        merged = _merge([_read(aggregate_path) or {}, kept])
+        _write(aggregate_path, {
+            name: dict(m, series=[[list(k), v] for k, v in m["series"].items()])
+            for name, m in merged.items()
+        })
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def mark_process_dead(pid):
+    """
+    A worker has exited: keep its counters in the aggregate and stop
+    reporting its gauges. Called by the gunicorn master (gunicorn.conf.py);
+    scrapes also catch dead workers it missed.
+    """
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return
+    with _dir_lock(exclusive=True):
+        _fold(os.path.join(METRICS_DIR, f"worker-{pid}.json"))
+
+
+def _load_snapshots():
+    if not METRICS_DIR:
+        return [_snapshot()]
+
+    try:
+        flush()  # our own numbers, right now
+    except OSError:
+        return [_snapshot()]
+
+    now = time.time()
+    paths, dead = [], []
+    for path in glob.glob(os.path.join(METRICS_DIR, "worker-*.json")):
+        match = _WORKER_FILE_RE.search(path)
+        try:
+            stale = now - os.path.getmtime(path) > _STALE_AFTER
+        except OSError:
+            continue
+        if match is None or stale or not _alive(int(match.group(1))):
+            dead.append(path)
+        else:
+            paths.append(path)
+
+    try:
+        if dead:
+            with _dir_lock(exclusive=True):
+                for path in dead:
+                    _fold(path)
+        with _dir_lock(exclusive=False):
+            snapshots = [_read(os.path.join(METRICS_DIR, _AGGREGATE))]
+            snapshots += [_read(path) for path in paths]
+    except OSError:
+        return [_snapshot()]
+    return [snapshot for snapshot in snapshots if snapshot is not None]
+
+
+def _merge(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, dict(metric, series={}))
+            for key, value in metric["series"]:
+                key = tuple(key)
+                if isinstance(value, list):
+                    prev = target["series"].get(key)
+                    target["series"][key] = value if prev is None else [a + b for a, b in zip(prev, value)]
+                else:
+                    target["series"][key] = target["series"].get(key, 0) + value
+    return merged
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def render():
+    """Every worker's metrics, summed, in Prometheus text format (0.0.4)."""
+    lines = []
+    for name, metric in _merge(_load_snapshots()).items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labels"]
+        for key, value in sorted(metric["series"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, key)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(names, key, ('le', bound))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {value[-1]}")
+            lines.append(f"{name}_count{_labels(names, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
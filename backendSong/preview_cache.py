@@ -0,0 +1,489 @@
+# backendSong/preview_cache.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    PREVIEW_CACHE_SIZE,
+    PREVIEW_CACHE_SHARED_SIZE,
+    PREVIEW_CACHE_PATH,
+    PREVIEW_CACHE_HIT_TTL,
+    PREVIEW_CACHE_MISS_TTL,
+)
+from logs import get_logger
+from metrics import PREVIEW_CACHE_LOOKUPS
+
+log = get_logger("cache")
+
+# Returned by CacheBackend.get() when there is no (live) entry for a key.
+# Distinct from None / "" so callers can cache "nothing found" results.
+MISS = object()
+
+
+class CacheBackend:
+    """
+    Minimal key/value cache interface used by the upstream clients.
+
+    Keys are strings, values are anything JSON-serialisable, and every
+    entry carries its own TTL (seconds, None = never expires).
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def get_with_expiry(self, key):
+        """(value or MISS, expires_at or None): get() plus when the entry expires, if known."""
+        return self.get(key), None
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Set key only if it has no live entry. Returns True if it was set."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def dump(self):
+        """Every live entry, as [(key, value, expires_at or None)]."""
+        raise NotImplementedError
+
+    def add_many(self, entries):
+        """
+        add() for many (key, value, expires_at) entries, e.g. from dump().
+        Returns how many were set.
+        """
+        now = time.time()
+        added = 0
+        for key, value, expires_at in entries:
+            if expires_at is None or expires_at > now:
+                added += self.add(key, value, None if expires_at is None else expires_at - now)
+        return added
+
+    def stats(self):
+        return {}
+
+
+class MemoryLRUCache(CacheBackend):
+    """
+    Thread-safe, size-bounded, in-process LRU with per-entry expiry.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _set_locked(self, key, value, ttl):
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._set_locked(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                return False
+            self._set_locked(key, value, ttl)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def dump(self):
+        now = time.time()
+        with self._lock:
+            return [
+                (key, value, expires_at)
+                for key, (expires_at, value) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteCache(CacheBackend):
+    """
+    On-disk cache shared by every worker process on the host.
+
+    Uses WAL mode so readers never block each other, and survives restarts
+    and deploys as long as `path` lives on persistent storage. Expired rows
+    are skipped on read and purged opportunistically on write; with
+    `max_rows`, the oldest written rows beyond it are evicted at the same
+    time (so the table may briefly exceed it by up to _PURGE_EVERY rows).
+    """
+
+    _PURGE_EVERY = 500  # writes between expired-row purges
+
+    def __init__(self, path, mode=None, max_rows=None):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.purged = 0
+        self.evicted = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if mode is not None:
+            self._restrict(mode)
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL"
+            ")"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+
+    def _restrict(self, mode):
+        # Create the database file with `mode` before SQLite ever opens it:
+        # SQLite gives the -wal / -shm files it creates the database file's
+        # permissions, so they never exist with looser ones. Files left by
+        # an older version are tightened too.
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, mode))
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.chmod(self.path + suffix, mode)
+            except FileNotFoundError:
+                pass
+
+    def _conn(self):
+        # One connection per thread (and per process: connections opened
+        # before a fork are never reused by the child).
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        return self.get_with_expiry(key)[0]
+
+    def get_with_expiry(self, key):
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="read", path=self.path, error=str(e))
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return MISS, None
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            with self._lock:
+                self._writes += 1
+                purge = self._writes % self._PURGE_EVERY == 0
+            if purge:
+                self._purge(conn)
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="write", path=self.path, error=str(e))
+
+    def _purge(self, conn):
+        cur = conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?",
+            (time.time(),),
+        )
+        self.purged += cur.rowcount
+        if self.max_rows is None:
+            return
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_rows
+        if excess > 0:
+            # A replaced row gets a new rowid, so the lowest ones were written longest ago
+            cur = conn.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY rowid LIMIT ?)",
+                (excess,),
+            )
+            self.evicted += cur.rowcount
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        try:
+            # Insert, or take over an expired row; a live row is left alone.
+            cur = self._conn().execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE cache.expires_at IS NOT NULL AND cache.expires_at <= ?",
+                (key, json.dumps(value), expires_at, now),
+            )
+            return cur.rowcount > 0
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="add", path=self.path, error=str(e))
+            return False
+
+    def delete(self, key):
+        try:
+            self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="delete", path=self.path, error=str(e))
+
+    def clear(self):
+        try:
+            self._conn().execute("DELETE FROM cache")
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="clear", path=self.path, error=str(e))
+
+    def dump(self):
+        try:
+            rows = self._conn().execute(
+                "SELECT key, value, expires_at FROM cache WHERE expires_at IS NULL OR expires_at > ?",
+                (time.time(),),
+            ).fetchall()
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="dump", path=self.path, error=str(e))
+            return []
+        return [(key, json.loads(value), expires_at) for key, value, expires_at in rows]
+
+    def add_many(self, entries):
+        # One transaction instead of a commit per row; live rows win
+        now = time.time()
+        rows = [
+            (key, json.dumps(value), expires_at, now)
+            for key, value, expires_at in entries
+            if expires_at is None or expires_at > now
+        ]
+        try:
+            conn = self._conn()
+            before = conn.total_changes
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                    "WHERE cache.expires_at IS NOT NULL AND cache.expires_at <= ?",
+                    rows,
+                )
+            return conn.total_changes - before
+        except sqlite3.Error as e:
+            log.warning("sqlite_cache_error", op="add_many", path=self.path, error=str(e))
+            return 0
+
+    def stats(self):
+        try:
+            size = self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        return {
+            "path": self.path,
+            "size": size,
+            "max_rows": self.max_rows,
+            "hits": self.hits,
+            "misses": self.misses,
+            "purged": self.purged,
+            "evicted": self.evicted,
+        }
+
+
+class TieredCache(CacheBackend):
+    """
+    Small fast tier (per-process LRU) in front of a slower shared tier.
+
+    Reads fall through to the shared tier and promote hits into the local
+    one, for no longer than they have left there; writes go to both.
+    """
+
+    def __init__(self, local, shared, local_ttl=300):
+        self.local = local
+        self.shared = shared
+        # Cap how long a value may live in the local tier, so entries
+        # refreshed by another worker are picked up reasonably quickly.
+        self.local_ttl = local_ttl
+
+    def _local_ttl(self, ttl):
+        return self.local_ttl if ttl is None else min(ttl, self.local_ttl)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not MISS:
+            return value
+        value, expires_at = self.shared.get_with_expiry(key)
+        if value is not MISS:
+            ttl = self.local_ttl if expires_at is None else min(self.local_ttl, expires_at - time.time())
+            if ttl > 0:
+                self.local.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, self._local_ttl(ttl))
+        self.shared.set(key, value, ttl)
+
+    def add(self, key, value, ttl=None):
+        # Only the shared tier can arbitrate between processes.
+        return self.shared.add(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def dump(self):
+        return self.shared.dump()
+
+    def add_many(self, entries):
+        entries = list(entries)
+        cap = time.time() + self.local_ttl
+        self.local.add_many(
+            (key, value, cap if expires_at is None else min(expires_at, cap))
+            for key, value, expires_at in entries
+        )
+        return self.shared.add_many(entries)
+
+    def stats(self):
+        return {"local": self.local.stats(), "shared": self.shared.stats()}
+
+
+class PreviewCache:
+    """
+    iTunes preview lookups on top of any CacheBackend.
+
+    Found previews and "no match" results are stored with separate TTLs
+    so a track that had no preview yesterday is eventually re-checked.
+    """
+
+    def __init__(self, backend, hit_ttl=PREVIEW_CACHE_HIT_TTL, miss_ttl=PREVIEW_CACHE_MISS_TTL):
+        self.backend = backend
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(track, artist=None):
+        return "itunes:{}\x1f{}".format(
+            (track or "").strip().lower(),
+            (artist or "").strip().lower(),
+        )
+
+    def get(self, track, artist=None):
+        """
+        Returns MISS if we have never looked this track up (or the entry
+        expired), "" for a cached "no preview", otherwise the preview URL.
+        """
+        value = self.backend.get(self.make_key(track, artist))
+        if value is MISS:
+            self.misses += 1
+            PREVIEW_CACHE_LOOKUPS.inc(result="miss")
+        elif value:
+            self.hits += 1
+            PREVIEW_CACHE_LOOKUPS.inc(result="hit")
+        else:
+            self.negative_hits += 1
+            PREVIEW_CACHE_LOOKUPS.inc(result="negative_hit")
+        return value
+
+    def set(self, track, artist, preview_url):
+        ttl = self.hit_ttl if preview_url else self.miss_ttl
+        self.backend.set(self.make_key(track, artist), preview_url or "", ttl)
+
+    def dump(self):
+        """Every live lookup result, as (key, preview URL or "", expires_at)."""
+        return [entry for entry in self.backend.dump() if entry[0].startswith("itunes:")]
+
+    def restore(self, entries):
+        """Seed the cache with dump() output, keeping anything already cached."""
+        return self.backend.add_many(entry for entry in entries if entry[0].startswith("itunes:"))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ttl": self.hit_ttl,
+            "miss_ttl": self.miss_ttl,
+            "backend": self.backend.stats(),
+        }
+
+
+def build_preview_cache():
+    """
+    Build the preview cache from config: always an in-process LRU, backed
+    by a host-wide SQLite file when PREVIEW_CACHE_PATH is set.
+    """
+    local = MemoryLRUCache(maxsize=PREVIEW_CACHE_SIZE)
+    if not PREVIEW_CACHE_PATH:
+        return PreviewCache(local)
+
+    try:
+        shared = SQLiteCache(PREVIEW_CACHE_PATH, max_rows=PREVIEW_CACHE_SHARED_SIZE or None)
+    except (sqlite3.Error, OSError) as e:
+        log.warning("preview_cache_sqlite_unavailable", error=str(e))
+        return PreviewCache(local)
+
+    return PreviewCache(TieredCache(local, shared))
@@ -0,0 +1,388 @@
+# backendSong/preview_index.py
+#
+# Offline preview index: ISRC and (normalised title, artist) -> preview URL,
+# built from bulk exports (our own logs, a licensed catalogue, ...) and
+# searched in place with a binary search over a memory-mapped file. No
+# network and no rate budget, and every worker shares the same pages.
+#
+#   python preview_index.py build exports/*.csv exports/*.jsonl [--out PATH]
+#   python preview_index.py warm PLAYLIST [PLAYLIST ...] [--max-tracks N]
+#   python preview_index.py info [--path PATH]
+#
+# "build" reads CSV or JSON-lines files (optionally .gz). Each row needs a
+# preview URL plus an ISRC and/or a title and (primary) artist; our field
+# names (title, artist, isrc, preview_url) and iTunes' (trackName,
+# artistName, previewUrl) both work. Later rows win over earlier ones.
+#
+# "warm" resolves, ahead of time, the previews of playlist tracks that have
+# neither a Spotify preview nor an index entry: iTunes lookups into the
+# shared preview cache that the running workers read. The workers use the
+# same per-IP iTunes budget, so warm paces itself at
+# PREVIEW_WARM_RATE_PER_MINUTE (--rate), well below theirs.
+#
+# File layout (little-endian): header (magic, entry count, offset of the
+# table), the distinct preview URLs, the keys (each with the offset of its
+# URL), then a table of key offsets sorted by key.
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+from config import PREVIEW_INDEX_PATH, PREVIEW_WARM_RATE_PER_MINUTE
+from track import split_artists
+from track_matching import normalize_artist, normalize_title
+from logs import get_logger
+
+log = get_logger("preview_index")
+
+MAGIC = b"TGPIDX01"
+_HEADER = struct.Struct("<8sII")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+
+# How often (seconds) a worker checks whether the index file was replaced
+_RECHECK_INTERVAL = 30
+
+_FIELDS = {
+    "title": ("title", "name", "track", "trackName"),
+    "artist": ("artist", "artistName"),
+    "isrc": ("isrc",),
+    "preview_url": ("preview_url", "previewUrl", "preview"),
+}
+
+
+def title_key(title, artist=None):
+    return f"t:{normalize_title(title)}\x1f{normalize_artist(artist or '')}".encode()
+
+
+def isrc_key(isrc):
+    return f"i:{isrc.strip().upper()}".encode()
+
+
+class PreviewIndex:
+    """A built index file, memory-mapped read-only."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self._table = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a preview index")
+
+    def _key_at(self, i):
+        offset = _U32.unpack_from(self._mm, self._table + 4 * i)[0]
+        end = offset + 2 + _U16.unpack_from(self._mm, offset)[0]
+        return self._mm[offset + 2:end], end
+
+    def get(self, key):
+        """Preview URL stored under `key` (bytes), or None. O(log n)."""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count:
+            return None
+        found, end = self._key_at(lo)
+        if found != key:
+            return None
+        value = _U32.unpack_from(self._mm, end)[0]
+        length = _U16.unpack_from(self._mm, value)[0]
+        return self._mm[value + 2:value + 2 + length].decode()
+
+    def lookup(self, track, artist=None, isrc=None):
+        """Preview URL by ISRC, else by title + artist; None if not indexed."""
+        if isrc:
+            url = self.get(isrc_key(isrc))
+            if url:
+                return url
+        return self.get(title_key(track, artist)) if track else None
+
+    def close(self):
+        self._mm.close()
+
+
+class _SharedIndex:
+    """
+    The index at PREVIEW_INDEX_PATH for this process: opened on first use
+    and reopened when `build` replaces the file. A missing file just means
+    every lookup misses.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._identity = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def current(self):
+        if time.monotonic() - self._checked_at < _RECHECK_INTERVAL:
+            return self._index
+        with self._lock:
+            if time.monotonic() - self._checked_at < _RECHECK_INTERVAL:
+                return self._index
+            self._checked_at = time.monotonic()
+            try:
+                st = os.stat(self.path)
+                identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+            except OSError:
+                identity = None
+            if identity != self._identity:
+                index = None
+                if identity is not None:
+                    try:
+                        index = PreviewIndex(self.path)
+                        log.info("preview_index_opened", path=self.path, entries=index.count)
+                    except (OSError, ValueError, struct.error) as e:
+                        log.warning("preview_index_unusable", path=self.path, error=str(e))
+                # The old mapping is left to the garbage collector: a
+                # concurrent lookup may still be reading it.
+                self._index, self._identity = index, identity
+        return self._index
+
+    def lookup(self, track, artist=None, isrc=None):
+        index = self.current() if self.path else None
+        if index is None:
+            return None
+        url = index.lookup(track, artist, isrc)
+        if url:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return url
+
+    def stats(self):
+        index = self._index
+        return {
+            "path": self.path,
+            "entries": index.count if index is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_SHARED = _SharedIndex(PREVIEW_INDEX_PATH)
+
+
+def lookup(track, artist=None, isrc=None):
+    """Preview URL from the offline index, or None. Never touches the network."""
+    return _SHARED.lookup(track, artist, isrc)
+
+
+def stats():
+    return _SHARED.stats()
+
+
+# ---------- building ----------
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_rows(path):
+    """Rows of a CSV (by extension) or JSON-lines file, as dicts."""
+    with _open_text(path) as f:
+        if ".csv" in os.path.basename(path):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _field(row, name):
+    for alias in _FIELDS[name]:
+        value = row.get(alias)
+        if value:
+            return value
+    return None
+
+
+def _artist(row):
+    artist = _field(row, "artist")
+    if artist is None and isinstance(row.get("artists"), list) and row["artists"]:
+        first = row["artists"][0]  # Spotify-style track objects
+        artist = first.get("name") if isinstance(first, dict) else first
+    return artist
+
+
+def build(inputs, out=PREVIEW_INDEX_PATH):
+    """Build the index at `out` from bulk files. Returns a summary."""
+    entries = {}
+    # Lookups use Track.primary_artist, so a joined credit ("A & B",
+    # "A feat. B") is also keyed by its first artist. Exact keys win.
+    primary = {}
+    rows = skipped = 0
+    for path in inputs:
+        for row in read_rows(path):
+            rows += 1
+            url = _field(row, "preview_url")
+            title, isrc = _field(row, "title"), _field(row, "isrc")
+            if not url or not (title or isrc) or len(url.encode()) > 0xFFFF:
+                skipped += 1
+                continue
+            if isrc:
+                entries[isrc_key(isrc)] = url
+            if title:
+                artist = _artist(row)
+                entries[title_key(title, artist)] = url
+                artists = split_artists(artist)
+                if len(artists) > 1:
+                    primary[title_key(title, artists[0])] = url
+    entries = {**primary, **entries}
+
+    keys = sorted(k for k in entries if len(k) <= 0xFFFF)
+
+    values, value_offsets = bytearray(), {}
+    for url in entries.values():
+        if url not in value_offsets:
+            value_offsets[url] = _HEADER.size + len(values)
+            encoded = url.encode()
+            values += _U16.pack(len(encoded)) + encoded
+
+    records, table = bytearray(), bytearray()
+    records_start = _HEADER.size + len(values)
+    for key in keys:
+        table += _U32.pack(records_start + len(records))
+        records += _U16.pack(len(key)) + key + _U32.pack(value_offsets[entries[key]])
+
+    table_offset = records_start + len(records)
+    if table_offset + len(table) > 0xFFFFFFFF:
+        raise ValueError("index would exceed 4 GiB; split the input")
+
+    directory = os.path.dirname(os.path.abspath(out))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(keys), table_offset))
+            f.write(values)
+            f.write(records)
+            f.write(table)
+        os.replace(tmp, out)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    return {
+        "rows": rows,
+        "skipped": skipped,
+        "keys": len(keys),
+        "previews": len(value_offsets),
+        "bytes": os.path.getsize(out),
+    }
+
+
+# ---------- warming ----------
+
+def _playlist_id(arg):
+    # Accept bare ids as well as open.spotify.com/playlist/<id>?si=... links
+    return arg.rstrip("/").rsplit("/", 1)[-1].split("?", 1)[0]
+
+
+def warm(playlists, max_tracks=None, rate_per_minute=PREVIEW_WARM_RATE_PER_MINUTE, out=sys.stdout):
+    """
+    Resolve the missing previews of `playlists` into the shared preview
+    cache, at most `rate_per_minute` iTunes lookups a minute. Returns
+    per-playlist counts; lookups skipped by the rate limiter or the open
+    circuit breaker are counted apart from "not_found".
+    """
+    from itunes_client import find_itunes_preview, itunes_available
+    from rate_limiter import BACKGROUND, RateLimiter, limiter_stats
+    from spotify_auth import get_app_token
+    from spotify_client import get_all_playlist_track_records
+
+    token = get_app_token()
+    if not token:
+        raise RuntimeError("no Spotify app token (check SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET)")
+
+    pace = RateLimiter("itunes-warm", rate_per_minute, 1, background_reserve=0)
+
+    def rate_limited():
+        return limiter_stats()["itunes"]["rejected"]["background"]
+
+    summary = {}
+    for arg in playlists:
+        playlist_id = _playlist_id(arg)
+        tracks = get_all_playlist_track_records(
+            playlist_id, max_tracks=max_tracks, token=token, priority=BACKGROUND
+        )
+        if not isinstance(tracks, list):
+            log.warning("preview_warm_playlist_error", playlist_id=playlist_id, error=str(tracks))
+            summary[playlist_id] = {"error": "playlist_unavailable"}
+            continue
+
+        counts = {
+            "tracks": len(tracks), "spotify": 0, "indexed": 0, "found": 0, "not_found": 0,
+            "rate_limited": 0, "circuit_open": 0,
+        }
+        for i, t in enumerate(tracks, 1):
+            if t.preview_url:
+                counts["spotify"] += 1
+            elif lookup(t.name, t.primary_artist, t.isrc):
+                counts["indexed"] += 1
+            elif not itunes_available():
+                counts["circuit_open"] += 1
+            else:
+                pace.acquire(BACKGROUND)
+                rejected = rate_limited()
+                if find_itunes_preview(t.name, t.primary_artist, BACKGROUND, t.duration_ms, t.isrc):
+                    counts["found"] += 1
+                elif rate_limited() > rejected:
+                    counts["rate_limited"] += 1
+                else:
+                    counts["not_found"] += 1
+            if i % 25 == 0:
+                print(f"{playlist_id}: {i}/{len(tracks)} {counts}", file=out, flush=True)
+        summary[playlist_id] = counts
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline iTunes preview index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="build the index from CSV / JSON-lines files")
+    p.add_argument("inputs", nargs="+")
+    p.add_argument("--out", default=PREVIEW_INDEX_PATH)
+
+    p = sub.add_parser("warm", help="resolve playlists' missing previews ahead of time")
+    p.add_argument("playlists", nargs="+", help="playlist ids or open.spotify.com links")
+    p.add_argument("--max-tracks", type=int, default=None)
+    p.add_argument("--rate", type=float, default=PREVIEW_WARM_RATE_PER_MINUTE, help="iTunes lookups per minute")
+
+    p = sub.add_parser("info", help="describe an index file")
+    p.add_argument("--path", default=PREVIEW_INDEX_PATH)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        result = build(args.inputs, args.out)
+    elif args.command == "warm":
+        result = warm(args.playlists, args.max_tracks, args.rate)
+    else:
+        index = PreviewIndex(args.path)
+        result = {"path": args.path, "entries": index.count, "bytes": os.path.getsize(args.path)}
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
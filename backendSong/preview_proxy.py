@@ -0,0 +1,290 @@
+# backendSong/preview_proxy.py
+
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+from config import (
+    PREVIEW_PROXY,
+    PREVIEW_PROXY_DIR,
+    PREVIEW_PROXY_MAX_BYTES,
+    PREVIEW_PROXY_MAX_FILE,
+    PREVIEW_CACHE_HIT_TTL,
+)
+from http_session import get_session, timeout
+from preview_cache import MISS, MemoryLRUCache, SQLiteCache, TieredCache
+from singleflight import SingleFlight
+from logs import get_logger
+
+log = get_logger("preview_proxy")
+
+PROXY_PREFIX = "/api/preview/"
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_CHUNK = 64 * 1024
+# Served files get their mtime bumped at most this often (for pruning)
+_TOUCH_EVERY = 24 * 3600
+
+
+class PreviewStore:
+    """
+    Content-addressed on-disk cache of preview MP3s, served at
+    /api/preview/<id>.
+
+    <id> is a hash of the upstream URL, and only ids this server handed
+    out (register()) are fetched, so the endpoint can't be used as an
+    open proxy. Files are named after the SHA-256 of their bytes, which is
+    also their (strong) ETag; identical previews behind different URLs
+    are stored once.
+
+    When the directory grows past `max_bytes`, the least recently served
+    files are deleted; they are simply downloaded again when next needed.
+    """
+
+    def __init__(
+        self,
+        directory=PREVIEW_PROXY_DIR,
+        max_bytes=PREVIEW_PROXY_MAX_BYTES,
+        max_file=PREVIEW_PROXY_MAX_FILE,
+        index_ttl=PREVIEW_CACHE_HIT_TTL,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.index_ttl = index_ttl
+
+        self._index = None
+        self._bytes = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        # Threads are started lazily on the first prefetch
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preview-prefetch")
+
+        self.served = 0
+        self.downloads = 0
+        self.download_failures = 0
+        self.pruned = 0
+
+    # ---------- id <-> upstream URL index ----------
+
+    def index(self):
+        # Built on first use, so nothing touches the disk unless the proxy is used
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    local = MemoryLRUCache(maxsize=20000)
+                    try:
+                        shared = SQLiteCache(os.path.join(self.directory, "index.sqlite3"))
+                        self._index = TieredCache(local, shared)
+                    except (sqlite3.Error, OSError) as e:
+                        log.warning("preview_proxy_index_unavailable", error=str(e))
+                        self._index = local
+        return self._index
+
+    @staticmethod
+    def preview_id(url):
+        return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+    def register(self, url):
+        """Proxy path for an upstream preview URL (other values pass through)."""
+        if not url or url.startswith(PROXY_PREFIX):
+            return url
+        if urlsplit(url).scheme not in ("http", "https"):
+            return url
+
+        pid = self.preview_id(url)
+        if self.index().get(pid) is MISS:
+            self.index().set(pid, {"url": url}, self.index_ttl)
+        return PROXY_PREFIX + pid
+
+    # ---------- files ----------
+
+    def _path(self, sha):
+        return os.path.join(self.directory, sha[:2], sha + ".mp3")
+
+    def fetch(self, pid):
+        """
+        Local file for a preview id, downloading it first if needed.
+        Returns (path, sha256) or (None, status) with 404 for unknown ids
+        and 502 when the upstream download failed.
+        """
+        if not _ID_RE.match(pid or ""):
+            return None, 404
+        record = self.index().get(pid)
+        if record is MISS:
+            return None, 404
+
+        sha = record.get("sha256")
+        if sha:
+            path = self._path(sha)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                pass  # pruned; download again
+            else:
+                if time.time() - mtime > _TOUCH_EVERY:
+                    try:
+                        os.utime(path)
+                    except OSError:
+                        pass
+                return path, sha
+
+        sha = self._flight.do(pid, self._download, pid, record["url"])
+        if sha is None:
+            return None, 502
+        return self._path(sha), sha
+
+    def _download(self, pid, url):
+        self.downloads += 1
+        try:
+            resp = get_session(urlsplit(url).hostname).get(url, stream=True, timeout=timeout(10))
+        except requests.RequestException as e:
+            log.warning("preview_download_error", url=url, error=str(e))
+            self.download_failures += 1
+            return None
+
+        with resp:
+            content_type = resp.headers.get("Content-Type", "")
+            if resp.status_code != 200 or not (
+                content_type.startswith("audio/") or content_type == "application/octet-stream"
+            ):
+                log.warning("preview_download_failed", url=url, status=resp.status_code, content_type=content_type)
+                self.download_failures += 1
+                return None
+
+            try:
+                sha, size = self._store(resp)
+            except (requests.RequestException, OSError, ValueError) as e:
+                log.warning("preview_download_error", url=url, error=str(e))
+                self.download_failures += 1
+                return None
+
+        record = {"url": url, "sha256": sha}
+        self.index().set(pid, record, self.index_ttl)
+        self._account(size)
+        return sha
+
+    def _store(self, resp):
+        """Stream a response to disk while hashing it. Returns (sha256, size)."""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in resp.iter_content(_CHUNK):
+                    size += len(chunk)
+                    if size > self.max_file:
+                        raise ValueError(f"preview larger than {self.max_file} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            sha = digest.hexdigest()
+            path = self._path(sha)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic: readers (and other workers) never see a partial file
+            os.replace(tmp, path)
+            return sha, size
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".mp3"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield st.st_mtime, st.st_size, path
+
+    def _account(self, size):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(s for _, s, _ in self._files())
+            else:
+                self._bytes += size
+            if self._bytes <= self.max_bytes:
+                return
+            self._prune()
+
+    def _prune(self):
+        # Caller holds the lock. Down to 90% so we don't prune on every write.
+        files = sorted(self._files())
+        total = sum(s for _, s, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.pruned += 1
+        self._bytes = total
+
+    # ---------- prefetch ----------
+
+    def prefetch(self, urls):
+        """Download the previews behind these (proxy) URLs in the background."""
+        for url in urls:
+            if url and url.startswith(PROXY_PREFIX):
+                self._executor.submit(self._prefetch_one, url[len(PROXY_PREFIX):])
+
+    def _prefetch_one(self, pid):
+        try:
+            self.fetch(pid)
+        except Exception:
+            log.exception("preview_prefetch_failed", preview_id=pid)
+
+    def stats(self):
+        return {
+            "enabled": PREVIEW_PROXY,
+            "served": self.served,
+            "downloads": self.downloads,
+            "download_failures": self.download_failures,
+            "pruned": self.pruned,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+store = PreviewStore()
+
+
+def proxy_quiz_audio(quiz, prefetch=False):
+    """
+    Point a quiz's audio_url values at /api/preview/<id> (when PREVIEW_PROXY
+    is on), optionally downloading them ahead of time. Returns the quiz.
+    """
+    if not PREVIEW_PROXY or not quiz:
+        return quiz
+    urls = []
+    for question in quiz.get("questions") or []:
+        question["audio_url"] = store.register(question.get("audio_url"))
+        urls.append(question["audio_url"])
+    if prefetch:
+        store.prefetch(urls)
+    return quiz
+
+
+def proxy_question_audio(question):
+    """proxy_quiz_audio for a single (streamed) question."""
+    if PREVIEW_PROXY:
+        question["audio_url"] = store.register(question.get("audio_url"))
+    return question
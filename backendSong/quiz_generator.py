@@ -1,47 +1,127 @@
 # backendSong/quiz_generator.py
 
+import asyncio
 import random
-from typing import List, Dict, Any, Optional
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed, wait
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 
-from itunes_client import find_itunes_preview
+from config import ITUNES_LOOKUP_WORKERS, ITUNES_LOOKUP_DEADLINE
+from itunes_client import find_itunes_preview, find_itunes_preview_async, indexed_preview, itunes_available
+from rate_limiter import INTERACTIVE
+from distractors import DistractorSampler
+from track import Track, tracks_from_spotify
+from logs import get_logger
+from metrics import QUIZ_BUILD_SECONDS
 
+log = get_logger("quiz")
 
-def _get_artist_names(track: Dict[str, Any]) -> str:
+# Shared pool for iTunes fallback lookups. Threads are started lazily on
+# the first submit, so importing this module spawns nothing.
+_LOOKUP_EXECUTOR = ThreadPoolExecutor(
+    max_workers=ITUNES_LOOKUP_WORKERS,
+    thread_name_prefix="itunes-lookup",
+)
+# Background lookups (catalogue refreshes, warm-ups) can sit waiting for
+# rate budget for a long time, so they get their own small pool and never
+# occupy the threads that interactive quizzes need.
+_BACKGROUND_EXECUTOR = ThreadPoolExecutor(
+    max_workers=2,
+    thread_name_prefix="itunes-lookup-bg",
+)
+
+
+def _submit_lookups(lookups, priority=INTERACTIVE):
     """
-    Build a nice 'Artist 1, Artist 2' string from a Spotify track object.
+    Queue iTunes lookups; returns {future: key}. Tracks in the offline
+    preview index get already-completed futures; the rest are left out
+    while iTunes is down.
     """
-    if not isinstance(track, dict):
-        return ""
+    futures, pending = {}, []
+    for key, t in lookups:
+        url = indexed_preview(t.name, t.primary_artist, t.isrc)
+        if url:
+            future = Future()
+            future.set_result(url)
+            futures[future] = key
+        else:
+            pending.append((key, t))
 
-    artists = track.get("artists") or []
-    names = [a.get("name", "") for a in artists if isinstance(a, dict) and a.get("name")]
-    return ", ".join(names)
+    if not pending:
+        return futures
 
+    if not itunes_available():
+        # Circuit breaker is open: don't even queue the lookups
+        log.info("itunes_unavailable_skipping_lookups", lookups=len(pending))
+        return futures
+
+    executor = _LOOKUP_EXECUTOR if priority == INTERACTIVE else _BACKGROUND_EXECUTOR
+    for key, t in pending:
+        future = executor.submit(
+            find_itunes_preview, t.name, t.primary_artist, priority, t.duration_ms, t.isrc
+        )
+        futures[future] = key
+    return futures
 
-def _get_album_image_url(track: Dict[str, Any]) -> Optional[str]:
+
+def lookup_itunes_previews(
+    lookups: List[Tuple[Any, Track]],
+    deadline: float = ITUNES_LOOKUP_DEADLINE,
+    priority: int = INTERACTIVE,
+) -> Dict[Any, Optional[str]]:
     """
-    Get the first album image URL from a Spotify track object, if any.
+    Run find_itunes_preview for every (key, track record) in `lookups`
+    in parallel and return {key: preview_url_or_None}.
+
+    Waits at most `deadline` seconds overall. Lookups still running when
+    the deadline passes are left out of the result; they keep running in
+    the background and still land in the iTunes cache for the next quiz.
     """
-    if not isinstance(track, dict):
-        return None
+    futures = _submit_lookups(lookups, priority)
+    if not futures:
+        return {}
+
+    with QUIZ_BUILD_SECONDS.time(phase="resolve_previews"):
+        done, not_done = wait(futures, timeout=deadline)
 
-    album = track.get("album") or {}
-    images = album.get("images") or []
-    if images and isinstance(images, list):
-        # Usually largest first
-        first = images[0]
-        if isinstance(first, dict):
-            return first.get("url")
-    return None
+    results: Dict[Any, Optional[str]] = {}
+    for fut in done:
+        try:
+            results[futures[fut]] = fut.result()
+        except Exception:
+            log.exception("itunes_lookup_failed")
+
+    if not_done:
+        log.info("itunes_lookups_past_deadline", late=len(not_done), total=len(futures))
+
+    return results
+
+
+def resolve_missing_previews(
+    questions: List[Dict[str, Any]],
+    lookups: List[Tuple[int, Track]],
+    deadline: float = ITUNES_LOOKUP_DEADLINE,
+) -> None:
+    """
+    Fill in questions[i]["audio_url"] from iTunes for every (i, track record)
+    in `lookups`. Questions whose lookup misses the deadline keep None.
+    """
+    for idx, url in lookup_itunes_previews(lookups, deadline).items():
+        questions[idx]["audio_url"] = url
 
 
 def generate_quiz_from_tracks(
-    tracks: List[Dict[str, Any]],
+    tracks: List[Any],
     num_questions: int = 10,
-    options_per_q: int = 4
+    options_per_q: int = 4,
+    resolve_previews: bool = True,
+    sampler: Optional[DistractorSampler] = None,
+    hard: bool = False,
+    rng: Optional[random.Random] = None,
 ) -> Dict[str, Any]:
     """
-    Build a quiz JSON object from a list of Spotify track objects.
+    Build a quiz JSON object from a list of Track records (raw Spotify
+    track objects are accepted too and converted on the way in).
 
     Each question looks like:
     {
@@ -53,82 +133,204 @@ def generate_quiz_from_tracks(
         "external_url": "https://open.spotify.com/track/..."
     }
 
+    Tracks without a Spotify preview get an iTunes fallback looked up
+    (all in parallel) unless resolve_previews is False, e.g. for track
+    pools whose previews were already resolved ahead of time.
+
+    Wrong options come from `sampler` (pass one built once for a shared
+    pool; otherwise one is built here). `hard` prefers options by the same
+    artist or with similar titles.
+
+    All randomness (track choice, distractors, option order) comes from
+    `rng`, so a random.Random with a fixed seed and the same track list
+    gives the same quiz every time.
+
     This function is defensive:
       - skips None / malformed track entries
       - handles missing titles / artists / images
       - returns {"questions": []} if nothing usable is found
     """
 
+    with QUIZ_BUILD_SECONDS.time(phase="assemble"):
+        questions, lookups = _build_questions(
+            tracks, num_questions, options_per_q, resolve_previews, sampler, hard, rng
+        )
+    resolve_missing_previews(questions, lookups)
+
+    return {"questions": questions}
+
+
+async def generate_quiz_from_tracks_async(
+    tracks: List[Any],
+    num_questions: int = 10,
+    options_per_q: int = 4,
+    resolve_previews: bool = True,
+    deadline: float = ITUNES_LOOKUP_DEADLINE,
+    sampler: Optional[DistractorSampler] = None,
+    hard: bool = False,
+    rng: Optional[random.Random] = None,
+) -> Dict[str, Any]:
+    """
+    generate_quiz_from_tracks for coroutines: the iTunes fallbacks run
+    concurrently on the shared async I/O loop instead of lookup threads.
+    Lookups that miss `deadline` keep running there and still get cached.
+    """
+    with QUIZ_BUILD_SECONDS.time(phase="assemble"):
+        questions, lookups = _build_questions(
+            tracks, num_questions, options_per_q, resolve_previews, sampler, hard, rng
+        )
+    # Offline index first: it answers even while iTunes is down
+    pending = []
+    for idx, t in lookups:
+        url = indexed_preview(t.name, t.primary_artist, t.isrc)
+        if url:
+            questions[idx]["audio_url"] = url
+        else:
+            pending.append((idx, t))
+    lookups = pending
+    if not lookups:
+        return {"questions": questions}
+
+    if not itunes_available():
+        log.info("itunes_unavailable_skipping_lookups", lookups=len(lookups))
+        return {"questions": questions}
+
+    tasks = {
+        asyncio.ensure_future(
+            find_itunes_preview_async(t.name, t.primary_artist, INTERACTIVE, t.duration_ms, t.isrc)
+        ): idx
+        for idx, t in lookups
+    }
+    with QUIZ_BUILD_SECONDS.time(phase="resolve_previews"):
+        done, not_done = await asyncio.wait(tasks, timeout=deadline)
+
+    for task in done:
+        try:
+            questions[tasks[task]]["audio_url"] = task.result()
+        except Exception:
+            log.exception("itunes_lookup_failed")
+
+    if not_done:
+        log.info("itunes_lookups_past_deadline", late=len(not_done), total=len(tasks))
+        for task in not_done:
+            # Only stops our waiting; the lookup itself carries on
+            task.cancel()
+
+    return {"questions": questions}
+
+
+def iter_quiz_questions(
+    tracks: List[Any],
+    num_questions: int = 10,
+    options_per_q: int = 4,
+    resolve_previews: bool = True,
+    deadline: float = ITUNES_LOOKUP_DEADLINE,
+    sampler: Optional[DistractorSampler] = None,
+    hard: bool = False,
+    rng: Optional[random.Random] = None,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Streaming variant of generate_quiz_from_tracks.
+
+    Yields (index, question) as soon as each question's audio_url is
+    settled: questions that already have a Spotify preview (or need no
+    lookup) come first, the rest in the order their iTunes lookups finish.
+    Lookups still running after `deadline` are yielded with audio_url None.
+    """
+    with QUIZ_BUILD_SECONDS.time(phase="assemble"):
+        questions, lookups = _build_questions(
+            tracks, num_questions, options_per_q, resolve_previews, sampler, hard, rng
+        )
+
+    # Start the lookups before handing out the questions that need none
+    futures = _submit_lookups(lookups)
+
+    pending = {idx for idx, _ in lookups}
+    for idx, question in enumerate(questions):
+        if idx not in pending:
+            yield idx, question
+
+    started = time.perf_counter()
+    try:
+        for fut in as_completed(futures, timeout=deadline):
+            idx = futures[fut]
+            try:
+                questions[idx]["audio_url"] = fut.result()
+            except Exception:
+                log.exception("itunes_lookup_failed")
+            pending.discard(idx)
+            yield idx, questions[idx]
+    except FuturesTimeout:
+        log.info("itunes_lookups_past_deadline", late=len(pending), total=len(futures))
+    if futures:
+        QUIZ_BUILD_SECONDS.observe(time.perf_counter() - started, phase="resolve_previews")
+
+    # Past the deadline (or iTunes is down): send the rest without audio
+    for idx in sorted(pending):
+        yield idx, questions[idx]
+
+
+def _build_questions(
+    tracks: List[Any],
+    num_questions: int,
+    options_per_q: int,
+    resolve_previews: bool,
+    sampler: Optional[DistractorSampler] = None,
+    hard: bool = False,
+    rng: Optional[random.Random] = None,
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, Track]]]:
+    """
+    Assemble questions from Spotify data only. Returns (questions, lookups)
+    where lookups lists the (question index, track record) pairs that
+    still need an iTunes preview.
+    """
     if not tracks:
-        return {"questions": []}
+        return [], []
 
-    # Clean tracks: keep only dictionaries with a name
-    cleaned_tracks: List[Dict[str, Any]] = []
-    for t in tracks:
-        if isinstance(t, dict) and t.get("name"):
-            cleaned_tracks.append(t)
+    # Normalise to Track records; drops None / malformed / untitled entries
+    cleaned_tracks: List[Track] = tracks_from_spotify(tracks)
 
     if not cleaned_tracks:
-        return {"questions": []}
+        return [], []
 
-    # Shuffle for randomness
-    shuffled_tracks = list(cleaned_tracks)
-    random.shuffle(shuffled_tracks)
+    rng = rng or random
 
-    # Limit how many we will use to build questions
-    chosen_tracks = shuffled_tracks[:num_questions]
+    # Random pick of the tracks we will use to build questions
+    chosen_tracks = rng.sample(cleaned_tracks, min(num_questions, len(cleaned_tracks)))
 
-    # Pool of all track titles for distractor options
-    all_titles = []
-    for t in cleaned_tracks:
-        name = t.get("name")
-        if isinstance(name, str) and name.strip():
-            all_titles.append(name)
+    # Index of all track titles for distractor options
+    if sampler is None:
+        sampler = DistractorSampler(cleaned_tracks)
 
     questions = []
+    # (question index, track record) for tracks without a Spotify preview
+    lookups: List[Tuple[int, Track]] = []
 
     for track in chosen_tracks:
-        if not isinstance(track, dict):
-            continue
-
-        name = track.get("name")
-        if not isinstance(name, str) or not name.strip():
-            continue  # skip tracks with no usable title
+        name = track.name
 
-        artist_names = _get_artist_names(track)
-        image_url = _get_album_image_url(track)
+        # Try Spotify preview first (or one resolved ahead of time)
+        preview_url = track.preview_url
 
-        # Try Spotify preview first
-        preview_url = track.get("preview_url")
+        # If there is no preview, queue an iTunes fallback (resolved later, in parallel)
+        if not preview_url and resolve_previews:
+            lookups.append((len(questions), track))
 
-        # If Spotify has no preview, try iTunes fallback (smart)
-        if not preview_url:
-            primary_artist = (
-                artist_names.split(",")[0].strip()
-                if artist_names else None
-            )
-            preview_url = find_itunes_preview(name, primary_artist)
-
-        # External Spotify URL (for "open in Spotify" links)
-        external_url = (track.get("external_urls") or {}).get("spotify")
-
-        # Build options: correct title + some random other titles
-        other_titles = [t for t in all_titles if t != name]
-        random.shuffle(other_titles)
-        distractors = other_titles[: max(0, options_per_q - 1)]
+        # Build options: correct title + some other titles from the pool
+        distractors = sampler.sample(name, options_per_q - 1, rng, hard=hard)
 
         options = [name] + distractors
-        random.shuffle(options)
+        rng.shuffle(options)
 
         questions.append(
             {
                 "audio_url": preview_url,       # might be None if neither Spotify nor iTunes has a good preview
-                "image": image_url,
-                "artist": artist_names,
+                "image": track.image,
+                "artist": track.artist_names,
                 "correct": name,
                 "options": options,
-                "external_url": external_url,
+                "external_url": track.external_url,   # for "open in Spotify" links
             }
         )
 
-    return {"questions": questions}
+    return questions, lookups
@@ -0,0 +1,206 @@
+# backendSong/quiz_pool.py
+
+import threading
+import time
+from collections import deque
+
+from config import (
+    QUIZ_POOL_CAPACITY,
+    QUIZ_POOL_LOW_WATER,
+    QUIZ_POOL_CONCURRENCY,
+    QUIZ_POOL_REFILL_PAUSE,
+)
+from logs import get_logger
+
+log = get_logger("quiz_pool")
+
+
+class _SourceBuffer:
+    """Ring buffer of ready quizzes for one source, plus its counters."""
+
+    def __init__(self, builder, version, capacity):
+        self.builder = builder
+        self.version = version
+        self.quizzes = deque(maxlen=capacity)  # of (version, quiz)
+        self.building = 0            # builds currently in flight
+        self.refill_since = None     # when we dropped below low-water
+        self.last_refill_lag = None  # seconds from low-water to full, last time
+        self.served_pooled = 0
+        self.served_inline = 0
+        self.built = 0
+        self.build_failures = 0
+        self.discarded = 0           # built from data that has since changed
+
+    def current(self):
+        return self.version() if self.version is not None else None
+
+    def drop_stale(self):
+        """Forget quizzes built from older data. Caller holds the pool's _cond."""
+        version = self.current()
+        fresh = [entry for entry in self.quizzes if entry[0] == version]
+        if len(fresh) < len(self.quizzes):
+            self.discarded += len(self.quizzes) - len(fresh)
+            self.quizzes.clear()
+            self.quizzes.extend(fresh)
+
+
+class QuizPool:
+    """
+    Keeps a few ready-to-serve quizzes per source (e.g. "global-hits") so a
+    request only has to pop one.
+
+    When a buffer drops below `low_water`, background workers refill it to
+    `capacity`. At most `concurrency` builds run at once, with a short pause
+    after each one, so refills never crowd out interactive requests.
+    """
+
+    def __init__(
+        self,
+        capacity=QUIZ_POOL_CAPACITY,
+        low_water=QUIZ_POOL_LOW_WATER,
+        concurrency=QUIZ_POOL_CONCURRENCY,
+        refill_pause=QUIZ_POOL_REFILL_PAUSE,
+    ):
+        self.capacity = capacity
+        self.low_water = min(low_water, capacity)
+        self.concurrency = concurrency
+        self.refill_pause = refill_pause
+
+        self._sources = {}
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def register(self, source, builder, version=None):
+        """
+        `builder()` must return a quiz dict, or None if it cannot build one
+        right now (None results are not pooled). `version()`, if given,
+        identifies the data builder() reads (e.g. a catalogue generation):
+        quizzes built from an older version are dropped, not served.
+        """
+        with self._cond:
+            self._sources[source] = _SourceBuffer(builder, version, self.capacity)
+            self._mark_low(self._sources[source])
+            self._cond.notify_all()
+
+    # ---------- serving ----------
+
+    def get(self, source):
+        """
+        Pop a ready quiz for `source`, building one inline if the buffer is
+        empty (e.g. right after startup).
+        """
+        self._ensure_workers()
+        buf = self._sources[source]
+
+        with self._cond:
+            buf.drop_stale()
+            quiz = buf.quizzes.popleft()[1] if buf.quizzes else None
+            if quiz is not None:
+                buf.served_pooled += 1
+            else:
+                buf.served_inline += 1
+            self._mark_low(buf)
+            self._cond.notify_all()
+
+        if quiz is None:
+            quiz = buf.builder()
+        return quiz
+
+    # ---------- refilling ----------
+
+    def _mark_low(self, buf):
+        if buf.refill_since is None and len(buf.quizzes) < self.low_water:
+            buf.refill_since = time.time()
+
+    def _next_job(self):
+        """Pick the emptiest source that is refilling. Caller holds _cond."""
+        best = None
+        for source, buf in self._sources.items():
+            if buf.refill_since is None:
+                continue
+            if len(buf.quizzes) + buf.building >= self.capacity:
+                continue
+            if best is None or len(buf.quizzes) < len(self._sources[best].quizzes):
+                best = source
+        return best
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                source = self._next_job()
+                while source is None:
+                    self._cond.wait()
+                    source = self._next_job()
+                buf = self._sources[source]
+                buf.building += 1
+
+            version = buf.current()
+            try:
+                quiz = buf.builder()
+            except Exception:
+                log.exception("quiz_pool_build_failed", source=source)
+                quiz = None
+
+            with self._cond:
+                buf.building -= 1
+                buf.drop_stale()
+                if quiz and quiz.get("questions") and version != buf.current():
+                    buf.discarded += 1
+                elif quiz and quiz.get("questions"):
+                    buf.quizzes.append((version, quiz))
+                    buf.built += 1
+                    if len(buf.quizzes) >= self.capacity and buf.refill_since is not None:
+                        buf.last_refill_lag = time.time() - buf.refill_since
+                        buf.refill_since = None
+                else:
+                    buf.build_failures += 1
+                self._mark_low(buf)
+
+            # Leave room for request threads; back off harder after failures.
+            time.sleep(self.refill_pause if quiz else max(1.0, self.refill_pause))
+
+    def _ensure_workers(self):
+        # Started lazily, inside the worker process (never before a fork).
+        if self._workers:
+            return
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self.concurrency):
+                t = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"quiz-pool-{i}",
+                    daemon=True,
+                )
+                t.start()
+                self._workers.append(t)
+
+    # ---------- metrics ----------
+
+    def stats(self):
+        now = time.time()
+        with self._cond:
+            return {
+                source: {
+                    "depth": len(buf.quizzes),
+                    "capacity": self.capacity,
+                    "low_water": self.low_water,
+                    "building": buf.building,
+                    "refill_lag_seconds": (
+                        round(now - buf.refill_since, 3) if buf.refill_since is not None else 0.0
+                    ),
+                    "last_refill_lag_seconds": (
+                        round(buf.last_refill_lag, 3) if buf.last_refill_lag is not None else None
+                    ),
+                    "served_pooled": buf.served_pooled,
+                    "served_inline": buf.served_inline,
+                    "built": buf.built,
+                    "build_failures": buf.build_failures,
+                    "discarded": buf.discarded,
+                }
+                for source, buf in self._sources.items()
+            }
+
+
+# Shared by every request in this worker process
+pool = QuizPool()
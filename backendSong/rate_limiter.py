@@ -0,0 +1,153 @@
+# backendSong/rate_limiter.py
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+# Priority classes: lower value is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# name -> RateLimiter, so every limiter can be reported in one place
+_LIMITERS = {}
+
+
+class RateLimiter:
+    """
+    Token bucket for one upstream, with priority classes.
+
+    Interactive callers (a player waiting for a quiz) are always served
+    before background ones (catalogue refreshes, warm-ups, prefetches), and
+    background callers may only spend tokens above `background_reserve`
+    (a fraction of the bucket), so they run on leftover capacity.
+
+    acquire() never queues without bound: if the estimated wait exceeds
+    `max_wait` it returns False right away and the caller should degrade
+    (skip the lookup, serve without audio, ...).
+    """
+
+    def __init__(self, name, rate_per_minute, burst, background_reserve=0.25):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.reserve = burst * background_reserve
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []  # heap of (priority, seq) tickets
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+        self.granted = {p: 0 for p in _PRIORITY_NAMES}
+        self.rejected = {p: 0 for p in _PRIORITY_NAMES}
+        self.wait_total = {p: 0.0 for p in _PRIORITY_NAMES}
+        self.wait_max = {p: 0.0 for p in _PRIORITY_NAMES}
+
+        _LIMITERS[name] = self
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _floor(self, priority):
+        return 0.0 if priority == INTERACTIVE else self.reserve
+
+    def _grant(self, priority, waited):
+        self._tokens -= 1
+        self.granted[priority] += 1
+        self.wait_total[priority] += waited
+        self.wait_max[priority] = max(self.wait_max[priority], waited)
+        return True
+
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        """
+        Take one token, waiting up to `max_wait` seconds (None = no limit).
+        Returns False, without waiting, if that would take too long.
+        """
+        start = time.monotonic()
+        floor = self._floor(priority)
+
+        with self._cond:
+            self._refill()
+
+            nobody_ahead = not self._waiters or priority < self._waiters[0][0]
+            if nobody_ahead and self._tokens - 1 >= floor:
+                return self._grant(priority, 0.0)
+
+            # Rough estimate: everyone of our priority or better goes first
+            ahead = sum(1 for p, _ in self._waiters if p <= priority)
+            estimate = max(0.0, ahead + 1 + floor - self._tokens) / self.rate
+            if max_wait is not None and estimate > max_wait:
+                self.rejected[priority] += 1
+                return False
+
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            deadline = start + max_wait if max_wait is not None else None
+
+            try:
+                while True:
+                    self._refill()
+                    at_head = self._waiters[0] == ticket
+                    if at_head and self._tokens - 1 >= floor:
+                        heapq.heappop(self._waiters)
+                        return self._grant(priority, time.monotonic() - start)
+
+                    timeout = (floor + 1 - self._tokens) / self.rate if at_head else None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._waiters.remove(ticket)
+                            heapq.heapify(self._waiters)
+                            self.rejected[priority] += 1
+                            return False
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+
+                    self._cond.wait(timeout=max(timeout, 0.001) if timeout is not None else None)
+            finally:
+                # Whoever is at the head now may be able to proceed
+                self._cond.notify_all()
+
+    async def acquire_async(self, priority=INTERACTIVE, max_wait=None):
+        """
+        acquire() for coroutines. A free token is taken right here; only
+        when we would have to queue does the wait move to a worker thread,
+        so the event loop is never blocked.
+        """
+        with self._cond:
+            self._refill()
+            nobody_ahead = not self._waiters or priority < self._waiters[0][0]
+            if nobody_ahead and self._tokens - 1 >= self._floor(priority):
+                return self._grant(priority, 0.0)
+        return await asyncio.to_thread(self.acquire, priority, max_wait)
+
+    def stats(self):
+        with self._cond:
+            self._refill()
+            depth = {name: 0 for name in _PRIORITY_NAMES.values()}
+            for p, _ in self._waiters:
+                depth[_PRIORITY_NAMES[p]] += 1
+            return {
+                "tokens": round(self._tokens, 2),
+                "rate_per_minute": round(self.rate * 60, 2),
+                "burst": self.burst,
+                "queue_depth": depth,
+                "granted": {_PRIORITY_NAMES[p]: n for p, n in self.granted.items()},
+                "rejected": {_PRIORITY_NAMES[p]: n for p, n in self.rejected.items()},
+                "wait_avg_seconds": {
+                    _PRIORITY_NAMES[p]: round(self.wait_total[p] / self.granted[p], 3) if self.granted[p] else 0.0
+                    for p in _PRIORITY_NAMES
+                },
+                "wait_max_seconds": {
+                    _PRIORITY_NAMES[p]: round(w, 3) for p, w in self.wait_max.items()
+                },
+            }
+
+
+def limiter_stats():
+    return {name: limiter.stats() for name, limiter in _LIMITERS.items()}
@@ -0,0 +1,145 @@
+# backendSong/responses.py
+
+import gzip
+import json
+from functools import wraps
+
+from flask import make_response, request
+from flask.json.provider import DefaultJSONProvider
+
+from config import COMPRESS_MIN_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+from metrics import RESPONSE_BYTES
+
+# Both optional: faster JSON encoding, better compression
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Worth compressing; audio, images and files from send_file are not touched
+COMPRESSIBLE_TYPES = frozenset({
+    "application/json",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/javascript",
+    "application/javascript",
+})
+
+
+def dumps(obj):
+    """Compact JSON text, via orjson when installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            pass  # something orjson cannot encode: let json have a go
+    return json.dumps(obj, separators=(",", ":"))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider, serialising jsonify() output with orjson when it
+    is installed (same compact, key-sorted output as the default; pretty
+    printing in debug mode still goes through the json module).
+    """
+
+    def _orjson_options(self):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, option=self._orjson_options()).decode()
+        except TypeError:
+            return super().dumps(obj)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, option=self._orjson_options())
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+def _choose_encoding(accept):
+    br = accept["br"] if brotli is not None else 0
+    gz = accept["gzip"]
+    if br and br >= gz:
+        return "br"
+    return "gzip" if gz else None
+
+
+def compress_response(response):
+    """
+    after_request hook: brotli / gzip encode JSON and text responses of
+    at least COMPRESS_MIN_SIZE bytes for clients that accept it.
+    Streams and files (direct passthrough) are sent as they are.
+    """
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.mimetype not in COMPRESSIBLE_TYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    encoding = _choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        body = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        body = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+
+    # The encoded bytes differ, so a strong validator no longer holds
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    RESPONSE_BYTES.inc(len(data), encoding=encoding, stage="raw")
+    RESPONSE_BYTES.inc(len(body), encoding=encoding, stage="sent")
+    return response
+
+
+def revalidated(view):
+    """
+    Weak ETag on the view's 200 responses, and 304 Not Modified when the
+    client's If-None-Match still matches. For small per-user responses
+    that clients poll: browsers must revalidate (no-cache) and keep them
+    to themselves (private).
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            response.add_etag(weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+        return response
+
+    return wrapper
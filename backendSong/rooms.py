@@ -0,0 +1,514 @@
+# backendSong/rooms.py
+
+import hashlib
+import hmac
+import math
+import secrets
+import sqlite3
+import threading
+import time
+
+from config import (
+    ROOMS_PATH,
+    ROOM_START_DELAY,
+    ROOM_QUESTION_SECONDS,
+    ROOM_REVEAL_SECONDS,
+    ROOM_LOBBY_TTL,
+    ROOM_LINGER,
+    ROOM_MAX,
+    ROOM_MAX_LISTENERS,
+    ROOM_THREAD_STREAMS,
+    ROOM_HEARTBEAT,
+    ROOM_SYNC_INTERVAL,
+)
+from preview_cache import MISS, MemoryLRUCache, SQLiteCache
+from responses import dumps
+from logs import get_logger
+
+log = get_logger("rooms")
+
+LOBBY, PLAYING, FINISHED = "lobby", "playing", "finished"
+
+# Room codes are read out loud: no 0/O or 1/I/L look-alikes
+_CODE_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+_CODE_LENGTH = 6
+
+# Only sent with the answer, after a question's time is up
+_ANSWER_FIELDS = ("correct", "external_url")
+
+# How long (ms) EventSource waits before reconnecting a dropped stream
+_RETRY_MS = 2000
+
+
+def _room_key(code):
+    return f"room:{code}"
+
+
+def _start_key(code):
+    return f"room-start:{code}"
+
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _frame(event, data, seq=None):
+    """One Server-Sent Events frame, encoded."""
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {event}\ndata: {dumps(data)}\n\n".encode()
+
+
+def streams_hold_threads():
+    """
+    True when every open event stream occupies a worker thread (sync and
+    gthread workers), False under gevent, where it is just a greenlet.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return True
+    return not monkey.is_module_patched("threading")
+
+
+class Room:
+    """
+    One quiz, played by any number of players on a shared timeline.
+
+    A room is a record in the registry's store (quiz, settings, and once
+    the host starts it, the start time), so every worker can serve it.
+    The timeline follows from the start time alone: start, a question and
+    a reveal event per question, then end, each due at a wall-clock time.
+    Each worker encodes it once as SSE frames. A player's stream sends the
+    frames that are due and sleeps until the next one, so a player costs
+    one open connection, never a quiz build. Frame ids are positions in
+    the timeline, so a reconnect (Last-Event-ID) resumes where it left off.
+    """
+
+    def __init__(self, record, registry):
+        self.id = record["id"]
+        self.source = record["source"]
+        self.questions = record["questions"]
+        self.token_hash = record["token_hash"]
+        self.start_delay = record["start_delay"]
+        self.question_seconds = record["question_seconds"]
+        self.reveal_seconds = record["reveal_seconds"]
+        self.linger = record["linger"]
+        self.created_at = record["created_at"]
+        self.expires_at = record["expires_at"]
+        self.starts_at = None
+        self.ends_at = None
+
+        self.registry = registry
+        self.created_here = False
+        self.listeners = 0  # in this worker
+        self.peak_listeners = 0
+        self.joins = 0
+
+        self._timeline = []  # [(due_at, event, data, frame)], sorted; frame id = index + 1
+        self._synced_at = 0.0
+        self._cond = threading.Condition()
+
+    # ---------- state ----------
+
+    def state(self, now=None):
+        if self.starts_at is None:
+            return LOBBY
+        return PLAYING if (now or time.time()) < self.ends_at else FINISHED
+
+    def expired(self, now=None):
+        return (now or time.time()) >= self.expires_at
+
+    def is_host(self, token):
+        return bool(token) and hmac.compare_digest(_token_hash(str(token)), self.token_hash)
+
+    def finished_for(self, last_id):
+        """True if a client that has seen frame `last_id` has seen them all."""
+        return bool(self._timeline) and last_id >= len(self._timeline)
+
+    def info(self):
+        return {
+            "id": self.id,
+            "source": self.source,
+            "state": self.state(),
+            "questions": len(self.questions),
+            "start_delay": self.start_delay,
+            "question_seconds": self.question_seconds,
+            "reveal_seconds": self.reveal_seconds,
+            "starts_at": self.starts_at,
+            "ends_at": self.ends_at,
+            "listeners": self.listeners,
+        }
+
+    # ---------- timeline ----------
+
+    def _schedule(self, starts_at):
+        """Build the timeline for `starts_at`. Caller holds _cond."""
+        step = self.question_seconds + self.reveal_seconds
+        timeline = [(starts_at - self.start_delay, "start", {
+            "starts_at": starts_at,
+            "questions": len(self.questions),
+            "question_seconds": self.question_seconds,
+            "reveal_seconds": self.reveal_seconds,
+            # Clips to download during the countdown; no titles in them
+            "audio": [q.get("audio_url") for q in self.questions],
+        })]
+        for index, q in enumerate(self.questions):
+            at = round(starts_at + index * step, 3)
+            ends_at = round(at + self.question_seconds, 3)
+            timeline.append((at, "question", {
+                "index": index,
+                "at": at,
+                "ends_at": ends_at,
+                "question": {k: v for k, v in q.items() if k not in _ANSWER_FIELDS},
+            }))
+            timeline.append((ends_at, "reveal", dict(
+                {k: q.get(k) for k in _ANSWER_FIELDS}, index=index, at=ends_at
+            )))
+        ends_at = round(starts_at + len(self.questions) * step, 3)
+        timeline.append((ends_at, "end", {"at": ends_at}))
+
+        self._timeline = [
+            (at, event, data, _frame(event, data, seq))
+            for seq, (at, event, data) in enumerate(timeline, 1)
+        ]
+        self.starts_at, self.ends_at = starts_at, ends_at
+        self.expires_at = ends_at + self.linger
+        self._cond.notify_all()
+
+    def start(self):
+        """Schedule the game; False if it was already started (by any worker)."""
+        store = self.registry.store
+        with self._cond:
+            if self.starts_at is not None:
+                return False
+            starts_at = round(time.time() + self.start_delay, 3)
+            ttl = starts_at + len(self.questions) * (self.question_seconds + self.reveal_seconds) \
+                + self.linger - time.time()
+            if not store.add(_start_key(self.id), starts_at, ttl):
+                self._synced_at = 0.0
+                started = False
+            else:
+                self._schedule(starts_at)
+                started = True
+        if not started:
+            self.sync()
+            return False
+
+        # Keep the room itself around for as long as its game
+        record = store.get(_room_key(self.id))
+        if record is not MISS:
+            store.set(_room_key(self.id), dict(record, expires_at=self.expires_at), ttl)
+        log.info("room_started", room=self.id, listeners=self.listeners, questions=len(self.questions))
+        return True
+
+    def sync(self):
+        """Pick up a start made by another worker (at most every sync interval)."""
+        if self.starts_at is not None:
+            return
+        now = time.monotonic()
+        if now - self._synced_at < self.registry.sync_interval:
+            return
+        self._synced_at = now
+        starts_at = self.registry.store.get(_start_key(self.id))
+        if starts_at is MISS:
+            return
+        with self._cond:
+            if self.starts_at is None:
+                self._schedule(starts_at)
+
+    def _due(self, seq, now):
+        """Timeline entries after `seq` that are due, and seconds until the next one. Caller holds _cond."""
+        due = []
+        for entry in self._timeline[seq:]:
+            if entry[0] > now:
+                return due, entry[0] - now
+            due.append(entry)
+        return due, math.inf
+
+    def poll(self, after=0):
+        """
+        The events after `after` that are due now, and when to ask again
+        (None once "end" was sent): /api/rooms/<id>/poll, for clients that
+        cannot keep a stream open.
+        """
+        self.sync()
+        with self._cond:
+            now = time.time()
+            seq = min(max(after, 0), len(self._timeline))
+            due, wait = self._due(seq, now)
+        events = [
+            {"id": seq + i, "event": event, "data": data}
+            for i, (_, event, data, _) in enumerate(due, 1)
+        ]
+        done = bool(self._timeline) and seq + len(due) == len(self._timeline)
+        if done:
+            next_in = None
+        elif self.starts_at is None:
+            next_in = self.registry.sync_interval
+        else:
+            next_in = round(min(wait, self.registry.heartbeat), 3)
+        return {"room": self.info(), "events": events, "next_in": next_in}
+
+    # ---------- streams ----------
+
+    def _join(self):
+        """Take a listener slot; False if the room is full. Holds _cond for check and take."""
+        with self._cond:
+            if self.listeners >= self.registry.max_listeners:
+                return False
+            self.listeners += 1
+            self.joins += 1
+            self.peak_listeners = max(self.peak_listeners, self.listeners)
+            return True
+
+    def _leave(self):
+        with self._cond:
+            self.listeners -= 1
+
+    def _chunks(self, seq):
+        """
+        SSE byte chunks for one player: a "room" greeting, then every
+        timeline frame after `seq` as it comes due, with keep-alive
+        comments in between (which also notice players who left). Ends
+        after the "end" frame, or when the room expires.
+        """
+        heartbeat = self.registry.heartbeat
+        yield f"retry: {_RETRY_MS}\n\n".encode() + _frame("room", self.info())
+        sent_at = time.monotonic()
+        while True:
+            self.sync()
+            with self._cond:
+                now = time.time()
+                due, wait = self._due(seq, now)
+                if not due:
+                    if self.starts_at is None:
+                        wait = min(wait, self.registry.sync_interval)
+                    idle = heartbeat - (time.monotonic() - sent_at)
+                    timeout = min(wait, idle, self.expires_at - now)
+                    if timeout > 0:
+                        self._cond.wait(timeout)
+                        now = time.time()
+                        due, wait = self._due(seq, now)
+                last = len(self._timeline)
+
+            if due:
+                seq += len(due)
+                yield b"".join(entry[3] for entry in due)
+                sent_at = time.monotonic()
+                if seq == last:
+                    return  # that was "end"
+            elif now >= self.expires_at:
+                return
+            elif time.monotonic() - sent_at >= heartbeat:
+                yield b": ping\n\n"
+                sent_at = time.monotonic()
+
+
+class _Stream:
+    """
+    One player's event stream, holding a listener slot (and, on thread
+    workers, a stream slot) until the server closes it, even if it never
+    started iterating.
+    """
+
+    def __init__(self, room, last_id):
+        self.room = room
+        with room._cond:
+            seq = min(max(last_id, 0), len(room._timeline))
+        self._chunks = room._chunks(seq)
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._chunks.close()
+        self.room._leave()
+        self.room.registry._stream_closed()
+
+
+class RoomRegistry:
+    """
+    Rooms by code. Room records live in `store`, so with a host-wide
+    SQLite store every worker on the host can create, start and serve any
+    room; each worker keeps the rooms it has seen in memory.
+
+    Where a stream occupies a worker thread (sync / gthread workers), at
+    most `thread_streams` streams are open per worker; past that, clients
+    are sent to the polling endpoint, so rooms never starve other requests
+    of threads. Under gevent the only limit is `max_listeners` per room.
+    """
+
+    def __init__(
+        self,
+        store,
+        max_rooms=ROOM_MAX,
+        max_listeners=ROOM_MAX_LISTENERS,
+        thread_streams=ROOM_THREAD_STREAMS,
+        heartbeat=ROOM_HEARTBEAT,
+        sync_interval=ROOM_SYNC_INTERVAL,
+        start_delay=ROOM_START_DELAY,
+        question_seconds=ROOM_QUESTION_SECONDS,
+        reveal_seconds=ROOM_REVEAL_SECONDS,
+        lobby_ttl=ROOM_LOBBY_TTL,
+        linger=ROOM_LINGER,
+    ):
+        self.store = store
+        self.max_rooms = max_rooms
+        self.max_listeners = max_listeners
+        self.thread_streams = thread_streams
+        self.heartbeat = heartbeat
+        self.sync_interval = sync_interval
+        self.start_delay = start_delay
+        self.question_seconds = question_seconds
+        self.reveal_seconds = reveal_seconds
+        self.lobby_ttl = lobby_ttl
+        self.linger = linger
+
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._streams = 0
+        self._hold_threads = None
+
+        self.created = 0
+        self.expired = 0
+        self.rejected = 0
+        self.streams_refused = 0
+        self.polls = 0
+
+    def _sweep(self, now):
+        """Forget expired rooms. Caller holds _lock."""
+        gone = [code for code, room in self._rooms.items() if room.expired(now)]
+        for code in gone:
+            del self._rooms[code]
+        self.expired += len(gone)
+
+    def create(self, source, quiz):
+        """
+        A new room playing `quiz`, as (room, host_token), or (None, None)
+        if this worker already hosts max_rooms rooms.
+        """
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            if sum(1 for room in self._rooms.values() if room.created_here) >= self.max_rooms:
+                self.rejected += 1
+                log.warning("rooms_full", rooms=len(self._rooms))
+                return None, None
+
+        token = secrets.token_urlsafe(24)
+        record = {
+            "source": source,
+            "questions": quiz["questions"],
+            "token_hash": _token_hash(token),
+            "start_delay": self.start_delay,
+            "question_seconds": self.question_seconds,
+            "reveal_seconds": self.reveal_seconds,
+            "linger": self.linger,
+            "created_at": now,
+            "expires_at": now + self.lobby_ttl,
+        }
+        for _ in range(10):
+            record["id"] = "".join(secrets.choice(_CODE_ALPHABET) for _ in range(_CODE_LENGTH))
+            if self.store.add(_room_key(record["id"]), record, self.lobby_ttl):
+                break
+        else:
+            self.rejected += 1
+            log.warning("room_code_unavailable")
+            return None, None
+
+        room = Room(record, self)
+        room.created_here = True
+        with self._lock:
+            self._rooms[room.id] = room
+            self.created += 1
+        log.info("room_created", room=room.id, source=source, questions=len(room.questions))
+        return room, token
+
+    def get(self, code):
+        """The room with this code, from this worker's memory or the store; None if unknown or expired."""
+        code = (code or "").upper()
+        room = self._rooms.get(code)
+        if room is None:
+            record = self.store.get(_room_key(code))
+            if record is MISS:
+                return None
+            with self._lock:
+                room = self._rooms.setdefault(code, Room(record, self))
+        room.sync()
+        if room.expired():
+            return None
+        return room
+
+    def open_stream(self, room, last_id=0):
+        """
+        A player's event stream, as (stream, None), or (None, reason):
+        "room_full", or "streams_busy" when this worker has no thread to
+        spare (the client should poll instead).
+        """
+        if self._hold_threads is None:
+            self._hold_threads = streams_hold_threads()
+        with self._lock:
+            if self._hold_threads and self._streams >= self.thread_streams:
+                self.streams_refused += 1
+                return None, "streams_busy"
+            self._streams += 1
+        if not room._join():
+            self._stream_closed()
+            return None, "room_full"
+        return _Stream(room, last_id), None
+
+    def _stream_closed(self):
+        with self._lock:
+            self._streams -= 1
+
+    def poll(self, room, after=0):
+        self.polls += 1
+        return room.poll(after)
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            rooms = [room for room in self._rooms.values() if not room.expired(now)]
+        # Counted by the worker that created them, so sums across workers hold
+        states = {LOBBY: 0, PLAYING: 0, FINISHED: 0}
+        for room in rooms:
+            if room.created_here:
+                states[room.state(now)] += 1
+        return {
+            "rooms": len(rooms),
+            "by_state": states,
+            "listeners": sum(room.listeners for room in rooms),
+            "peak_listeners": max((room.peak_listeners for room in rooms), default=0),
+            "open_streams": self._streams,
+            "stream_limit": self.thread_streams if self._hold_threads else None,
+            "streams_refused": self.streams_refused,
+            "polls": self.polls,
+            "created": self.created,
+            "expired": self.expired,
+            "rejected": self.rejected,
+        }
+
+
+def build_room_registry():
+    """
+    Registry from config: rooms shared by every worker on the host through
+    the SQLite file at ROOMS_PATH, or kept by each worker to itself when it
+    is "" (then run a single worker).
+    """
+    if ROOMS_PATH:
+        try:
+            return RoomRegistry(SQLiteCache(ROOMS_PATH))
+        except (sqlite3.Error, OSError) as e:
+            log.warning("rooms_sqlite_unavailable", error=str(e))
+    return RoomRegistry(MemoryLRUCache(maxsize=2 * ROOM_MAX))
+
+
+# Shared by every request in this worker process
+registry = build_room_registry()
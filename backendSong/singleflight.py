@@ -0,0 +1,136 @@
+# backendSong/singleflight.py
+
+import asyncio
+import threading
+import time
+
+from preview_cache import MISS
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "waiters")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, everyone who arrives while it is in flight waits and gets the
+    same result (or the same exception).
+
+    Optionally coordinates across worker processes through a shared cache
+    backend (anything with add()/delete(), e.g. SQLiteCache): the leader
+    takes a short lease, and leaders in other processes that find the
+    lease taken poll `peek()` for the result instead of calling upstream.
+    `peek()` must return MISS until the result is available, then the same
+    value `fn` would have returned.
+    """
+
+    def __init__(self, lease_backend=None, lease_ttl=5.0, poll_interval=0.05):
+        self.lease_backend = lease_backend
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.lease_waits = 0
+
+    def do(self, key, fn, *args, peek=None, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_leader(key, fn, args, kwargs, peek)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _run_leader(self, key, fn, args, kwargs, peek):
+        if self.lease_backend is None or peek is None:
+            return fn(*args, **kwargs)
+
+        lease_key = f"lease:{key}"
+        if self.lease_backend.add(lease_key, True, self.lease_ttl):
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.lease_backend.delete(lease_key)
+
+        if self.lease_backend.get(lease_key) is MISS:
+            # Released meanwhile, or the backend is failing: don't wait on it
+            return fn(*args, **kwargs)
+
+        # Another process is fetching this right now; wait for its result
+        # to show up in the shared cache, but never longer than the lease.
+        self.lease_waits += 1
+        deadline = time.time() + self.lease_ttl
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            value = peek()
+            if value is not MISS:
+                return value
+        return fn(*args, **kwargs)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "lease_waits": self.lease_waits,
+        }
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines running on one event loop: the first
+    caller's coroutine runs as a task, later callers for the same key
+    await that task. A caller that is cancelled doesn't cancel the task.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.leaders += 1
+            task = self._tasks[key] = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._tasks),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
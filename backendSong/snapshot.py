@@ -0,0 +1,124 @@
+# backendSong/snapshot.py
+#
+# Warm-start snapshot: the iTunes preview cache and the global-hits pool in
+# one gzipped JSON file, so a fresh deploy (or a recycled worker) does not
+# start with every cache empty.
+#
+#   python snapshot.py save [--path PATH]    # from this host's caches
+#   python snapshot.py info [--path PATH]
+#
+# "save" reads what the running instance shares on disk: the SQLite preview
+# cache and the pool the global-hits catalogue writes on every refresh. The
+# gunicorn master loads the file once before forking (gunicorn.conf.py), so
+# the workers share it copy-on-write.
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+from config import WARM_SNAPSHOT_PATH
+from logs import get_logger
+
+log = get_logger("snapshot")
+
+SNAPSHOT_VERSION = 1
+
+
+def save(path=WARM_SNAPSHOT_PATH):
+    """Write a snapshot of this host's caches to `path`. Returns its summary."""
+    from global_hits import catalogue
+    from itunes_client import export_preview_cache
+
+    previews = export_preview_cache()
+    global_hits = catalogue.export() or catalogue.load_state()
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.time(),
+        "previews": previews,
+        "global_hits": global_hits,
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", compresslevel=6) as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return _summary(data)
+
+
+def read(path=WARM_SNAPSHOT_PATH):
+    """The snapshot at `path`, or None if there is none (or it is unusable)."""
+    try:
+        with gzip.open(path, "rt") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning("snapshot_unreadable", path=path, error=str(e))
+        return None
+    if data.get("version") != SNAPSHOT_VERSION:
+        log.warning("snapshot_version_mismatch", path=path, version=data.get("version"))
+        return None
+    return data
+
+
+def load(path=WARM_SNAPSHOT_PATH):
+    """
+    Seed the preview cache and the global-hits pool from the snapshot at
+    `path`; entries already cached are kept. Returns a summary, or None if
+    there was no snapshot.
+    """
+    if not path:
+        return None
+    started = time.perf_counter()
+    data = read(path)
+    if data is None:
+        return None
+
+    from global_hits import catalogue
+    from itunes_client import restore_preview_cache
+
+    summary = _summary(data)
+    summary["previews_added"] = restore_preview_cache(data.get("previews") or [])
+    summary["global_hits_restored"] = catalogue.restore(data.get("global_hits"))
+    summary["load_ms"] = round(1000 * (time.perf_counter() - started), 1)
+    log.info("snapshot_loaded", path=path, **summary)
+    return summary
+
+
+def _summary(data):
+    global_hits = data.get("global_hits") or {}
+    return {
+        "age_seconds": round(time.time() - data.get("created_at", 0), 1),
+        "previews": len(data.get("previews") or []),
+        "global_hits_tracks": len(global_hits.get("tracks") or []),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrackGuessr warm-start snapshot")
+    parser.add_argument("command", choices=("save", "info"))
+    parser.add_argument("--path", default=WARM_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "save":
+        summary = save(args.path)
+    else:
+        data = read(args.path)
+        if data is None:
+            sys.exit(f"no usable snapshot at {args.path}")
+        summary = _summary(data)
+    print(json.dumps(dict(summary, path=args.path)))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,29 @@
 
 import base64
 import requests
+import threading
 import time
+from urllib.parse import urlsplit
+
 from flask import session, redirect, request
 
-from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, REDIRECT_URI, FRONTEND_URL
+from http_session import get_session, timeout
+from token_manager import build_token_manager, new_session_id
+from logs import get_logger
+import metrics
+from config import (
+    SPOTIFY_CLIENT_ID,
+    SPOTIFY_CLIENT_SECRET,
+    REDIRECT_URI,
+    FRONTEND_URL,
+    SPOTIFY_ACCOUNTS_BASE,
+)
+
+log = get_logger("spotify_auth")
 
-TOKEN_URL = "https://accounts.spotify.com/api/token"
+AUTHORIZE_URL = f"{SPOTIFY_ACCOUNTS_BASE.rstrip('/')}/authorize"
+TOKEN_URL = f"{SPOTIFY_ACCOUNTS_BASE.rstrip('/')}/api/token"
+ACCOUNTS_HOST = urlsplit(TOKEN_URL).hostname
 
 
 def _encode_client_credentials():
@@ -15,15 +32,29 @@ def _encode_client_credentials():
     return base64.b64encode(creds.encode()).decode()
 
 
+def _post_token(data, headers):
+    """POST to the accounts token endpoint, timed per grant type."""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        response = get_session(ACCOUNTS_HOST).post(TOKEN_URL, data=data, headers=headers, timeout=timeout(10))
+        status = response.status_code
+        return response
+    finally:
+        metrics.observe_upstream(
+            "spotify_accounts", f"token:{data['grant_type']}", status, time.perf_counter() - started
+        )
+
+
 # -------------------------------------------
 # 1. Redirect user to Spotify login
 # -------------------------------------------
 def spotify_login():
     scope = "user-top-read playlist-read-private playlist-read-collaborative"
 
-    print("DEBUG REDIRECT_URI =", REDIRECT_URI, flush=True)
+    log.debug("spotify_login_redirect", redirect_uri=REDIRECT_URI)
     auth_url = (
-        "https://accounts.spotify.com/authorize"
+        f"{AUTHORIZE_URL}"
         f"?client_id={SPOTIFY_CLIENT_ID}"
         f"&response_type=code"
         f"&redirect_uri={REDIRECT_URI}"
@@ -54,16 +85,27 @@ def spotify_callback():
         "Content-Type": "application/x-www-form-urlencoded",
     }
 
-    response = requests.post(TOKEN_URL, data=token_data, headers=headers)
-    tokens = response.json()
+    try:
+        response = _post_token(token_data, headers)
+        tokens = response.json()
+    except (requests.RequestException, ValueError) as e:
+        log.error("spotify_token_exchange_failed", error=str(e))
+        return "Error fetching token: upstream unavailable", 502
 
     if "access_token" not in tokens:
         return f"Error fetching token: {tokens}", 400
 
-    # Save tokens in session
-    session["access_token"] = tokens["access_token"]
-    session["refresh_token"] = tokens.get("refresh_token")
-    session["expires_at"] = time.time() + tokens["expires_in"]
+    # Keep the tokens server-side under a fresh session id; the cookie only
+    # carries the id (and we forget which user the old tokens belonged to).
+    _TOKENS.forget(session.pop("sid", None))
+    session.pop("spotify_user_id", None)
+    sid = session["sid"] = new_session_id()
+    _TOKENS.save(
+        sid,
+        tokens["access_token"],
+        tokens.get("refresh_token"),
+        time.time() + tokens["expires_in"],
+    )
 
     return redirect(FRONTEND_URL)
 
@@ -71,24 +113,8 @@ def spotify_callback():
 # -------------------------------------------
 # 3. Auto-refresh access token if expired
 # -------------------------------------------
-def get_valid_token():
-    """
-    Returns a valid access token from the session, refreshing if needed.
-    """
-    if "access_token" not in session:
-        return None
-
-    expires_at = session.get("expires_at", 0)
-
-    # If not close to expiring, just use current token
-    if time.time() < expires_at - 60:
-        return session["access_token"]
-
-    # Need to refresh token
-    refresh_token = session.get("refresh_token")
-    if not refresh_token:
-        return None
-
+def _refresh_tokens(refresh_token):
+    """POST a refresh_token grant; Spotify's token dict, or None on failure."""
     refresh_data = {
         "grant_type": "refresh_token",
         "refresh_token": refresh_token,
@@ -99,17 +125,91 @@ def get_valid_token():
         "Content-Type": "application/x-www-form-urlencoded",
     }
 
-    response = requests.post(TOKEN_URL, data=refresh_data, headers=headers)
-    tokens = response.json()
+    try:
+        response = _post_token(refresh_data, headers)
+        tokens = response.json()
+    except (requests.RequestException, ValueError) as e:
+        log.warning("token_refresh_failed", error=str(e))
+        return None
 
     if "access_token" not in tokens:
-        print("Failed to refresh token:", tokens)
+        log.warning("token_refresh_rejected", error=tokens.get("error") if isinstance(tokens, dict) else None)
         return None
 
-    new_access = tokens["access_token"]
-    expires_in = tokens.get("expires_in", 3600)
+    return tokens
+
+
+# User tokens by session id, refreshed ahead of expiry in the background
+_TOKENS = build_token_manager(_refresh_tokens)
 
-    session["access_token"] = new_access
-    session["expires_at"] = time.time() + expires_in
 
-    return new_access
+def _session_id():
+    sid = session.get("sid")
+    if sid is None and "access_token" in session:
+        # Cookie from before the server-side store: move its tokens over
+        sid = session["sid"] = new_session_id()
+        _TOKENS.save(
+            sid,
+            session.pop("access_token"),
+            session.pop("refresh_token", None),
+            session.pop("expires_at", 0),
+        )
+    return sid
+
+
+def get_valid_token():
+    """
+    Returns a valid access token for the session, refreshing if needed.
+    """
+    return _TOKENS.get(_session_id())
+
+
+def forget_session_tokens():
+    """Drop this session's server-side tokens (on logout)."""
+    _TOKENS.forget(session.get("sid"))
+
+
+def token_stats():
+    return _TOKENS.stats()
+
+
+# -------------------------------------------
+# 4. App-only token (client credentials flow)
+# -------------------------------------------
+_APP_TOKEN = {"access_token": None, "expires_at": 0}
+_APP_TOKEN_LOCK = threading.Lock()
+
+
+def get_app_token():
+    """
+    Returns an app access token (client credentials flow) for data that is
+    not user-specific, such as search and public playlists. Shared by all
+    requests in the process and refreshed shortly before it expires.
+    """
+    if time.time() < _APP_TOKEN["expires_at"] - 60:
+        return _APP_TOKEN["access_token"]
+
+    with _APP_TOKEN_LOCK:
+        # Another thread may have refreshed while we waited for the lock
+        if time.time() < _APP_TOKEN["expires_at"] - 60:
+            return _APP_TOKEN["access_token"]
+
+        headers = {
+            "Authorization": f"Basic {_encode_client_credentials()}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+
+        try:
+            response = _post_token({"grant_type": "client_credentials"}, headers)
+            tokens = response.json()
+        except (requests.RequestException, ValueError) as e:
+            log.error("app_token_failed", error=str(e))
+            return None
+
+        if "access_token" not in tokens:
+            log.error("app_token_rejected", error=tokens.get("error") if isinstance(tokens, dict) else None)
+            return None
+
+        _APP_TOKEN["access_token"] = tokens["access_token"]
+        _APP_TOKEN["expires_at"] = time.time() + tokens.get("expires_in", 3600)
+        return _APP_TOKEN["access_token"]
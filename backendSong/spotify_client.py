@@ -1,43 +1,253 @@
 # backendSong/spotify_client.py
 
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
 import requests
+from flask import session, has_request_context
+
+from config import (
+    USER_CACHE_SIZE,
+    USER_CACHE_MAX_AGE,
+    ME_CACHE_TTL,
+    TOP_ITEMS_CACHE_TTL,
+    SPOTIFY_RATE_PER_MINUTE,
+    SPOTIFY_RATE_BURST,
+    SPOTIFY_INTERACTIVE_MAX_WAIT,
+    SPOTIFY_BACKGROUND_MAX_WAIT,
+    SPOTIFY_PAGE_CONCURRENCY,
+    SPOTIFY_API_BASE,
+    ARTIST_TRACKS_MARKET,
+)
+import async_http
+from http_session import get_session, timeout
+from preview_cache import MISS, MemoryLRUCache
+from rate_limiter import RateLimiter, INTERACTIVE
+from track import tracks_from_spotify
 from spotify_auth import get_valid_token
+from logs import get_logger
+import metrics
+
+log = get_logger("spotify")
+
+BASE_URL = SPOTIFY_API_BASE.rstrip("/")
+API_HOST = urlsplit(BASE_URL).hostname
+
+# Only what Track records keep, for endpoints that accept `fields=`
+# (the playlist endpoints; /me/top/* and /search do not support it).
+PLAYLIST_TRACK_FIELDS = (
+    "total,next,"
+    "items(track(id,name,preview_url,duration_ms,artists(name),album(images(url)),"
+    "external_urls(spotify),external_ids(isrc)))"
+)
+PLAYLIST_PAGE_SIZE = 100  # Spotify's maximum for playlist tracks
+
+# Fetches later playlist pages in parallel (see iter_playlist_track_pages)
+_PAGE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=SPOTIFY_PAGE_CONCURRENCY,
+    thread_name_prefix="spotify-pages",
+)
+
+# Spotify answers 429 under load; spread our own calls out and let player
+# requests go ahead of background work.
+_SPOTIFY_LIMITER = RateLimiter("spotify", SPOTIFY_RATE_PER_MINUTE, SPOTIFY_RATE_BURST)
+_MAX_WAIT = {INTERACTIVE: SPOTIFY_INTERACTIVE_MAX_WAIT}
+
+# Per-user response cache: spotify_user_id -> {request_key: entry}, where
+# entry = {"data": ..., "etag": ... or None, "fetched_at": ...}.
+# Bounded by number of users; whole users are evicted LRU-first.
+_USER_CACHE = MemoryLRUCache(maxsize=USER_CACHE_SIZE)
+# A user's entries dict is read, changed and written back: one lock per
+# user (striped, so there is no per-user state to clean up) keeps
+# concurrent requests from dropping each other's entries.
+_USER_CACHE_LOCKS = tuple(threading.Lock() for _ in range(64))
+
+
+def _request_key(endpoint, params):
+    items = sorted((params or {}).items())
+    return endpoint.strip("/") + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+
+def _current_user_id():
+    if not has_request_context():
+        return None
+    return session.get("spotify_user_id")
+
+
+def invalidate_user_cache(user_id):
+    """Forget every cached response for this Spotify user (e.g. on logout)."""
+    if user_id:
+        _USER_CACHE.delete(user_id)
+
+
+def user_cache_stats():
+    return _USER_CACHE.stats()
 
-BASE_URL = "https://api.spotify.com/v1"
 
+class _PendingGet:
+    """What spotify_get / spotify_get_async need between request and response."""
 
-def spotify_get(endpoint, params=None):
+    __slots__ = ("endpoint", "url", "params", "headers", "user_call", "cache_ttl",
+                 "user_id", "req_key", "cached", "transform")
+
+    def __init__(self, endpoint, url, params, headers, user_call, cache_ttl, user_id, req_key, cached, transform):
+        self.endpoint = endpoint
+        self.url = url
+        self.params = params
+        self.headers = headers
+        self.user_call = user_call
+        self.cache_ttl = cache_ttl
+        self.user_id = user_id
+        self.req_key = req_key
+        self.cached = cached
+        self.transform = transform
+
+
+def spotify_get(endpoint, params=None, token=None, cache_ttl=None, priority=INTERACTIVE, transform=None):
     """
     Generic helper for GET requests to the Spotify Web API
-    using the logged-in user's access token.
+    using the logged-in user's access token (or `token`, if given,
+    e.g. an app token from get_app_token()).
+
+    With cache_ttl (seconds), successful user responses are cached per
+    Spotify user: within cache_ttl they are served without any request,
+    after that they are revalidated with If-None-Match when Spotify gave
+    us an ETag, so an unchanged payload is not downloaded again.
+
+    `priority` (rate_limiter.INTERACTIVE / BACKGROUND) orders calls when
+    our Spotify rate budget is tight.
+
+    `transform`, if given, is applied to a successful JSON payload before
+    it is cached and returned (e.g. to keep only compact Track records).
 
     Returns EITHER:
       - dict (normal successful JSON response)
-      - (dict, status_code) on errors (auth, parse, non-JSON, etc.)
+      - (dict, status_code) on errors (auth, parse, non-JSON, rate limit, etc.)
+    """
+    result, call = _prepare_get(endpoint, params, token, cache_ttl, transform)
+    if call is None:
+        return result
+
+    if not _SPOTIFY_LIMITER.acquire(priority, _MAX_WAIT.get(priority, SPOTIFY_BACKGROUND_MAX_WAIT)):
+        return _rate_limited(endpoint)
+
+    started = time.perf_counter()
+    try:
+        response = get_session(API_HOST).get(call.url, headers=call.headers, params=params, timeout=timeout(5))
+    except requests.RequestException as e:
+        return _request_failed(endpoint, e, started)
+
+    _observe(endpoint, response.status_code, started)
+
+    return _finish_get(call, response)
+
+
+async def spotify_get_async(endpoint, params=None, token=None, cache_ttl=None, priority=INTERACTIVE, transform=None):
     """
-    token = get_valid_token()
+    spotify_get for coroutines (same arguments, caching and return values),
+    over the shared async connection pool. Needs httpx.
+
+    Call it from the request's own context (e.g. an async Flask view):
+    the session is read and updated here, only the HTTP call itself runs
+    on the shared I/O loop.
+    """
+    result, call = _prepare_get(endpoint, params, token, cache_ttl, transform)
+    if call is None:
+        return result
+
+    if not await _SPOTIFY_LIMITER.acquire_async(priority, _MAX_WAIT.get(priority, SPOTIFY_BACKGROUND_MAX_WAIT)):
+        return _rate_limited(endpoint)
+
+    started = time.perf_counter()
+    try:
+        response = await async_http.get(API_HOST, call.url, params=params, headers=call.headers, read_timeout=5)
+    except async_http.HTTPError as e:
+        return _request_failed(endpoint, e, started)
+
+    _observe(endpoint, response.status_code, started)
+
+    return _finish_get(call, response)
+
+
+# Ids in a path would give every playlist / artist its own metric series
+_ID_SEGMENT_RE = re.compile(r"^(playlists|artists|albums|tracks|users)/[^/]+")
+
+
+def _endpoint_label(endpoint):
+    return _ID_SEGMENT_RE.sub(r"\1/{id}", endpoint.strip("/").split("?")[0])
+
+
+def _observe(endpoint, status, started):
+    metrics.observe_upstream("spotify", _endpoint_label(endpoint), status, time.perf_counter() - started)
+
+
+def _rate_limited(endpoint):
+    log.warning("spotify_rate_budget_exhausted", endpoint=endpoint)
+    metrics.UPSTREAM_SKIPPED.inc(upstream="spotify", reason="rate_limited")
+    return {"error": "rate_limited"}, 429
+
+
+def _request_failed(endpoint, error, started):
+    log.warning("spotify_request_error", endpoint=endpoint, error=str(error))
+    _observe(endpoint, "error", started)
+    return {"error": "spotify_request_failed"}, 500
+
+
+def _prepare_get(endpoint, params, token, cache_ttl, transform):
+    """
+    Front half of spotify_get: token, cache lookup, headers. Returns
+    (result, None) when there is nothing to fetch (cached / not logged in),
+    otherwise (None, _PendingGet).
+    """
+    user_call = token is None
+
+    if token is None:
+        token = get_valid_token()
 
     if not token:
-        return {"error": "not_authenticated"}, 401
+        return ({"error": "not_authenticated"}, 401), None
 
     headers = {"Authorization": f"Bearer {token}"}
     url = f"{BASE_URL}/{endpoint.lstrip('/')}"
 
-    try:
-        response = requests.get(url, headers=headers, params=params, timeout=5)
-    except requests.RequestException as e:
-        print("Spotify request error:", e)
-        return {"error": "spotify_request_failed"}, 500
+    user_id = _current_user_id() if (cache_ttl and user_call) else None
+    req_key = _request_key(endpoint, params)
+    if transform is not None:
+        req_key += "#" + transform.__name__
+    cached = None
+    if user_id:
+        entries = _USER_CACHE.get(user_id)
+        cached = entries.get(req_key) if entries is not MISS else None
+        if cached and time.time() - cached["fetched_at"] < cache_ttl:
+            return cached["data"], None
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+
+    return None, _PendingGet(
+        endpoint, url, params, headers, user_call, cache_ttl, user_id, req_key, cached, transform
+    )
+
+
+def _finish_get(call, response):
+    """
+    Back half of spotify_get: turn a requests / httpx response into the
+    returned data, updating the user cache.
+    """
+    cached = call.cached
+    if response.status_code == 304 and cached:
+        cached["fetched_at"] = time.time()
+        return cached["data"]
 
     # Try JSON; if it fails, report explicitly
     try:
         data = response.json()
     except ValueError:
         body_text = (response.text or "")[:500]
-        print(
-            f"Spotify non-JSON response from {url} "
-            f"status={response.status_code} body={body_text!r}"
-        )
+        log.warning("spotify_non_json_response", url=call.url, status=response.status_code, body=body_text)
         return {
             "error": "spotify_non_json",
             "status": response.status_code,
@@ -45,29 +255,315 @@ def spotify_get(endpoint, params=None):
         }, response.status_code
 
     # If Spotify returns an error JSON (4xx/5xx), bubble it with the status
-    if not response.ok:
-        print(f"Spotify error response from {url}: {data}")
+    if response.status_code >= 400:
+        log.warning("spotify_error_response", url=call.url, status=response.status_code, body=data)
         return data, response.status_code
 
+    user_id = call.user_id
+    if call.user_call and call.cache_ttl and has_request_context():
+        if call.endpoint.strip("/") == "me" and isinstance(data, dict) and data.get("id"):
+            # Learn who this session belongs to, so later calls can be cached
+            user_id = session["spotify_user_id"] = data["id"]
+
+    if call.transform is not None:
+        data = call.transform(data)
+
+    if user_id and data is not None:
+        _store_user_response(user_id, call.req_key, data, response.headers.get("ETag"))
+
     return data
 
 
+def _store_user_response(user_id, req_key, data, etag):
+    with _USER_CACHE_LOCKS[hash(user_id) % len(_USER_CACHE_LOCKS)]:
+        entries = _USER_CACHE.get(user_id)
+        if entries is MISS:
+            entries = {}
+        entries[req_key] = {"data": data, "etag": etag, "fetched_at": time.time()}
+        _USER_CACHE.set(user_id, entries, USER_CACHE_MAX_AGE)
+
+
+def get_current_user():
+    """Wraps GET /me (cached per user)."""
+    return spotify_get("me", cache_ttl=ME_CACHE_TTL)
+
+
 def get_user_top_tracks(limit=20, time_range="long_term"):
-    """Wraps GET /me/top/tracks."""
-    return spotify_get("me/top/tracks", {"limit": limit, "time_range": time_range})
+    """Wraps GET /me/top/tracks (cached per user)."""
+    return spotify_get(
+        "me/top/tracks",
+        {"limit": limit, "time_range": time_range},
+        cache_ttl=TOP_ITEMS_CACHE_TTL,
+    )
+
+
+def get_user_top_track_records(limit=50, time_range="long_term"):
+    """
+    GET /me/top/tracks as a list of Track records (cached per user in
+    that compact form). Errors come back as (body, status) like spotify_get.
+    """
+    return spotify_get(
+        "me/top/tracks",
+        {"limit": limit, "time_range": time_range},
+        cache_ttl=TOP_ITEMS_CACHE_TTL,
+        transform=_items_to_tracks,
+    )
 
 
 def get_user_top_artists(limit=50, time_range="long_term"):
-    """Wraps GET /me/top/artists."""
-    return spotify_get("me/top/artists", {"limit": limit, "time_range": time_range})
+    """Wraps GET /me/top/artists (cached per user)."""
+    return spotify_get(
+        "me/top/artists",
+        {"limit": limit, "time_range": time_range},
+        cache_ttl=TOP_ITEMS_CACHE_TTL,
+    )
+
+
+def get_user_top_artist_ids(limit=50, time_range="long_term"):
+    """GET /me/top/artists as a list of artist ids, most listened first (cached per user)."""
+    return spotify_get(
+        "me/top/artists",
+        {"limit": limit, "time_range": time_range},
+        cache_ttl=TOP_ITEMS_CACHE_TTL,
+        transform=_items_to_ids,
+    )
 
 
-def get_playlist_tracks(playlist_id, limit=100):
+def get_artist_top_track_records(artist_id, token=None, priority=INTERACTIVE, market=ARTIST_TRACKS_MARKET):
+    """GET /artists/{id}/top-tracks as a list of Track records (up to 10)."""
+    return spotify_get(
+        f"artists/{artist_id}/top-tracks",
+        {"market": market},
+        token=token,
+        priority=priority,
+        transform=_top_tracks_to_records,
+    )
+
+
+def get_playlist_tracks(playlist_id, limit=100, token=None, priority=INTERACTIVE):
     """Wraps GET /playlists/{playlist_id}/tracks."""
-    return spotify_get(f"playlists/{playlist_id}/tracks", {"limit": limit})
+    return spotify_get(
+        f"playlists/{playlist_id}/tracks", {"limit": limit}, token=token, priority=priority
+    )
 
 
-def search_playlists(query, limit=5):
+def get_playlist_track_records(playlist_id, limit=100, offset=0, token=None, priority=INTERACTIVE):
+    """
+    One page of GET /playlists/{playlist_id}/tracks as a list of Track
+    records, asking Spotify for only the fields the quiz uses.
+    """
+    return spotify_get(
+        f"playlists/{playlist_id}/tracks",
+        {"limit": limit, "offset": offset, "fields": PLAYLIST_TRACK_FIELDS},
+        token=token,
+        priority=priority,
+        transform=_playlist_items_to_tracks,
+    )
+
+
+def iter_playlist_track_pages(
+    playlist_id,
+    max_tracks=None,
+    concurrency=SPOTIFY_PAGE_CONCURRENCY,
+    token=None,
+    priority=INTERACTIVE,
+):
+    """
+    Generator over the pages of a playlist, in order. Each item is what
+    get_playlist_track_records returns for that page: a list of Track
+    records, or (body, status) on error (after which iteration stops).
+
+    The first page tells us the playlist size; later pages are then
+    fetched in parallel, at most `concurrency` at a time, so a playlist of
+    thousands of tracks costs about one round-trip per `concurrency` pages.
+    """
+    if token is None:
+        # Resolve the user's token here: page fetches run on pool threads
+        # that have no request/session context.
+        token = get_valid_token()
+        if not token:
+            yield {"error": "not_authenticated"}, 401
+            return
+
+    first = spotify_get(
+        f"playlists/{playlist_id}/tracks",
+        {"limit": PLAYLIST_PAGE_SIZE, "offset": 0, "fields": PLAYLIST_TRACK_FIELDS},
+        token=token,
+        priority=priority,
+        transform=_playlist_page,
+    )
+    if isinstance(first, tuple) or first is None:
+        yield first
+        return
+
+    yield first["tracks"]
+
+    total = first["total"]
+    if max_tracks is not None:
+        total = min(total, max_tracks)
+    offsets = list(range(PLAYLIST_PAGE_SIZE, total, PLAYLIST_PAGE_SIZE))
+
+    in_flight = []
+    next_offset = 0
+    while next_offset < len(offsets) or in_flight:
+        # Keep up to `concurrency` pages in flight, but yield strictly in order
+        while next_offset < len(offsets) and len(in_flight) < concurrency:
+            in_flight.append(_PAGE_EXECUTOR.submit(
+                get_playlist_track_records,
+                playlist_id,
+                limit=PLAYLIST_PAGE_SIZE,
+                offset=offsets[next_offset],
+                token=token,
+                priority=priority,
+            ))
+            next_offset += 1
+
+        page = in_flight.pop(0).result()
+        yield page
+        if isinstance(page, tuple) or page is None:
+            for fut in in_flight:
+                fut.cancel()
+            return
+
+
+def get_all_playlist_track_records(playlist_id, max_tracks=None, token=None, priority=INTERACTIVE):
+    """
+    Up to `max_tracks` Track records from a playlist, across pages.
+    Returns (body, status) if even the first page fails; a later failing
+    page just ends the list early.
+    """
+    tracks = []
+    for page in iter_playlist_track_pages(playlist_id, max_tracks, token=token, priority=priority):
+        if isinstance(page, tuple) or page is None:
+            if not tracks:
+                return page
+            log.warning("playlist_pages_truncated", playlist_id=playlist_id, tracks=len(tracks), error=page)
+            break
+        tracks.extend(page)
+    return tracks[:max_tracks] if max_tracks is not None else tracks
+
+
+def search_playlists(query, limit=5, token=None, priority=INTERACTIVE):
     """Wraps GET /search?q=...&type=playlist."""
     params = {"q": query, "type": "playlist", "limit": limit}
-    return spotify_get("search", params)
+    return spotify_get("search", params, token=token, priority=priority)
+
+
+# ---------- async variants (see spotify_get_async) ----------
+
+async def get_user_top_track_records_async(limit=50, time_range="long_term"):
+    """get_user_top_track_records for coroutines."""
+    return await spotify_get_async(
+        "me/top/tracks",
+        {"limit": limit, "time_range": time_range},
+        cache_ttl=TOP_ITEMS_CACHE_TTL,
+        transform=_items_to_tracks,
+    )
+
+
+async def get_playlist_track_records_async(playlist_id, limit=100, offset=0, token=None, priority=INTERACTIVE):
+    """get_playlist_track_records for coroutines."""
+    return await spotify_get_async(
+        f"playlists/{playlist_id}/tracks",
+        {"limit": limit, "offset": offset, "fields": PLAYLIST_TRACK_FIELDS},
+        token=token,
+        priority=priority,
+        transform=_playlist_items_to_tracks,
+    )
+
+
+async def get_all_playlist_track_records_async(
+    playlist_id,
+    max_tracks=None,
+    token=None,
+    priority=INTERACTIVE,
+    concurrency=SPOTIFY_PAGE_CONCURRENCY,
+):
+    """
+    get_all_playlist_track_records for coroutines: the first page gives
+    the size, the rest are fetched concurrently (at most `concurrency` at
+    a time) and joined in order, stopping at the first failed page.
+    """
+    first = await spotify_get_async(
+        f"playlists/{playlist_id}/tracks",
+        {"limit": PLAYLIST_PAGE_SIZE, "offset": 0, "fields": PLAYLIST_TRACK_FIELDS},
+        token=token,
+        priority=priority,
+        transform=_playlist_page,
+    )
+    if isinstance(first, tuple) or first is None:
+        return first
+
+    total = first["total"]
+    if max_tracks is not None:
+        total = min(total, max_tracks)
+
+    if token is None:
+        # Already validated by the first page; saves a session read per page
+        token = get_valid_token()
+
+    limit = asyncio.Semaphore(concurrency)
+
+    async def page(offset):
+        async with limit:
+            return await get_playlist_track_records_async(
+                playlist_id, PLAYLIST_PAGE_SIZE, offset, token=token, priority=priority
+            )
+
+    pages = await asyncio.gather(
+        *(page(offset) for offset in range(PLAYLIST_PAGE_SIZE, total, PLAYLIST_PAGE_SIZE))
+    )
+
+    tracks = list(first["tracks"])
+    for result in pages:
+        if isinstance(result, tuple) or result is None:
+            log.warning("playlist_pages_truncated", playlist_id=playlist_id, tracks=len(tracks), error=result)
+            break
+        tracks.extend(result)
+    return tracks[:max_tracks] if max_tracks is not None else tracks
+
+
+async def search_playlists_async(query, limit=5, token=None, priority=INTERACTIVE):
+    """search_playlists for coroutines."""
+    params = {"q": query, "type": "playlist", "limit": limit}
+    return await spotify_get_async("search", params, token=token, priority=priority)
+
+
+# ---------- payload -> Track records ----------
+
+def _items_to_tracks(data):
+    """{"items": [track, ...]} -> [Track]; None if the payload is not a dict."""
+    if not isinstance(data, dict):
+        return None
+    return tracks_from_spotify(data.get("items") or [])
+
+
+def _items_to_ids(data):
+    """{"items": [{"id": ...}, ...]} -> [id]; None if the payload is not a dict."""
+    if not isinstance(data, dict):
+        return None
+    return [it["id"] for it in (data.get("items") or []) if isinstance(it, dict) and it.get("id")]
+
+
+def _top_tracks_to_records(data):
+    """{"tracks": [track, ...]} (artist top tracks) -> [Track]; None if not a dict."""
+    if not isinstance(data, dict):
+        return None
+    return tracks_from_spotify(data.get("tracks") or [])
+
+
+def _playlist_items_to_tracks(data):
+    """{"items": [{"track": track}, ...]} -> [Track]; None if not a dict."""
+    if not isinstance(data, dict):
+        return None
+    return tracks_from_spotify(
+        it.get("track") for it in (data.get("items") or []) if isinstance(it, dict)
+    )
+
+
+def _playlist_page(data):
+    """Playlist tracks page -> {"tracks": [Track], "total": n}; None if not a dict."""
+    tracks = _playlist_items_to_tracks(data)
+    if tracks is None:
+        return None
+    return {"tracks": tracks, "total": data.get("total") or len(tracks)}
@@ -14,10 +14,30 @@ const FADE_MS = 360;
 let loadingInterval = null;
 let currentStreak = 0;
 
+// Streamed quizzes: questions keep arriving after the round has started
+let streamPending = false;
+let waitingForSong = false;
+let quizAbort = null;
+
 // High scores per mode (local)
 let highScores = {
     top: 0,
-    global: 0
+    artists: 0,
+    global: 0,
+    daily: 0
+};
+
+const MODE_ENDPOINTS = {
+    top: "/api/quiz/top-tracks",
+    artists: "/api/quiz/top-artists",
+    global: "/api/quiz/global-hits",
+    daily: "/api/quiz/daily"
+};
+const MODE_LABELS = {
+    top: "Top Tracks",
+    artists: "Top Artists",
+    global: "Global Hits",
+    daily: "Daily Challenge"
 };
 
 // Leaderboard entries (local only)
@@ -54,7 +74,9 @@ const songArtistEl = document.getElementById("song-artist");
 const optionsContainer = document.getElementById("options-container");
 
 const highscoreTopEl = document.getElementById("highscore-top");
+const highscoreArtistsEl = document.getElementById("highscore-artists");
 const highscoreGlobalEl = document.getElementById("highscore-global");
+const highscoreDailyEl = document.getElementById("highscore-daily");
 const leaderboardListEl = document.getElementById("leaderboard-list");
 const loadingPanel = document.getElementById("loading-panel");
 const loadingProgress = document.getElementById("loading-progress");
@@ -225,9 +247,15 @@ function updateHighscoreDisplay() {
     if (highscoreTopEl) {
         highscoreTopEl.textContent = `Best: ${highScores.top || 0} pts`;
     }
+    if (highscoreArtistsEl) {
+        highscoreArtistsEl.textContent = `Best: ${highScores.artists || 0} pts`;
+    }
     if (highscoreGlobalEl) {
         highscoreGlobalEl.textContent = `Best: ${highScores.global || 0} pts`;
     }
+    if (highscoreDailyEl) {
+        highscoreDailyEl.textContent = `Best: ${highScores.daily || 0} pts`;
+    }
 }
 
 function updateLeaderboardUI() {
@@ -268,7 +296,7 @@ function updateLeaderboardUI() {
 
             const right = document.createElement("span");
             right.className = "leaderboard-mode";
-            const modeLabel = entry.mode === "global" ? "Global Hits" : "Top Tracks";
+            const modeLabel = MODE_LABELS[entry.mode] || "Top Tracks";
             right.textContent = modeLabel;
 
             li.appendChild(left);
@@ -329,19 +357,44 @@ function showLoggedInUI(data) {
     }
 }
 
-async function refreshAuthUI() {
+// GET a JSON endpoint that sends ETags, revalidating the copy from the
+// last 200 with If-None-Match: unchanged data comes back as an empty 304.
+// Resolves to the data, or null on errors.
+async function fetchRevalidated(path) {
+    const key = "trackGuessrEtag:" + path;
+    let cached = null;
     try {
-        const res = await fetch(BACKEND_BASE + "/auth/status", {
-            credentials: "include"
-        });
+        cached = JSON.parse(sessionStorage.getItem(key) || "null");
+    } catch (e) {
+        cached = null;
+    }
 
-        if (!res.ok) {
-            showLoggedOutUI();
-            return;
+    const res = await fetch(BACKEND_BASE + path, {
+        credentials: "include",
+        headers: cached && cached.etag ? { "If-None-Match": cached.etag } : {}
+    });
+
+    if (res.status === 304 && cached) return cached.data;
+    if (!res.ok) return null;
+
+    const data = await res.json();
+    const etag = res.headers.get("ETag");
+    try {
+        if (etag) {
+            sessionStorage.setItem(key, JSON.stringify({ etag, data }));
+        } else {
+            sessionStorage.removeItem(key);
         }
+    } catch (e) {
+        // Storage full or disabled: just revalidate less
+    }
+    return data;
+}
 
-        const data = await res.json();
-        if (!data.logged_in) {
+async function refreshAuthUI() {
+    try {
+        const data = await fetchRevalidated("/auth/status");
+        if (!data || !data.logged_in) {
             showLoggedOutUI();
             return;
         }
@@ -476,54 +529,130 @@ async function startMode(mode) {
     showScreen(gameAreaDiv);
     showLoading();
 
-    const endpoint =
-        mode === "top"
-            ? "/api/quiz/top-tracks"
-            : "/api/quiz/global-hits";
+    const endpoint = MODE_ENDPOINTS[mode] || MODE_ENDPOINTS.global;
+
+    if (quizAbort) quizAbort.abort();
+    quizAbort = window.AbortController ? new AbortController() : null;
 
     try {
-        const response = await fetch(BACKEND_BASE + endpoint, {
-            credentials: "include",
-        });
+        // The daily quiz is one static (cacheable) file: nothing to stream
+        if (mode !== "daily" && window.ReadableStream && window.TextDecoder) {
+            await streamQuiz(endpoint + "/stream");
+        } else {
+            await fetchQuiz(endpoint);
+        }
+    } catch (err) {
+        if (err && err.name === "AbortError") return;
+        console.error("startMode error:", err);
+        streamPending = false;
+        if (currentSong) {
+            // Stream broke mid-round: just play what we already have
+            if (waitingForSong) loadSong();
+            return;
+        }
+        showQuizError("Error contacting backend.");
+    }
+}
 
-        const data = await response.json();
+function showQuizError(message) {
+    hideLoading();
+    if (feedback) {
+        feedback.textContent = message;
+        feedback.style.color = "#e74c3c";
+    }
+}
 
-        if (!response.ok || !data.questions) {
-            hideLoading();
-            if (feedback) {
-                feedback.textContent = "Error contacting backend.";
-                feedback.style.color = "#e74c3c";
+function questionToSong(q, i) {
+    return {
+        id: 1000 + i,
+        title: q.correct,
+        artist: q.artist,
+        // Proxied previews come back as "/api/preview/<id>"
+        audioFile: q.audio_url && q.audio_url.startsWith("/") ? BACKEND_BASE + q.audio_url : q.audio_url,
+        options: Array.isArray(q.options) ? q.options : [q.correct],
+        imageFile: q.image
+    };
+}
+
+// Whole quiz in one JSON response
+async function fetchQuiz(endpoint) {
+    const response = await fetch(BACKEND_BASE + endpoint, {
+        credentials: "include",
+        signal: quizAbort ? quizAbort.signal : undefined
+    });
+
+    const data = await response.json();
+
+    if (!response.ok || !data.questions) {
+        showQuizError("Error contacting backend.");
+        return;
+    }
+
+    const questions = data.questions;
+    if (!Array.isArray(questions) || !questions.length) {
+        showQuizError("No tracks available for this mode.");
+        return;
+    }
+
+    startGameWithSongs(questions.map(questionToSong));
+}
+
+// NDJSON stream: start playing as soon as the first question arrives
+async function streamQuiz(endpoint) {
+    const response = await fetch(BACKEND_BASE + endpoint, {
+        credentials: "include",
+        signal: quizAbort ? quizAbort.signal : undefined
+    });
+
+    if (!response.ok || !response.body) {
+        showQuizError("Error contacting backend.");
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+    let received = 0;
+    streamPending = true;
+
+    const handleEvent = event => {
+        if (event.type === "question" && event.question) {
+            const song = questionToSong(event.question, received);
+            received += 1;
+            if (received === 1) {
+                startGameWithSongs([song]);
+            } else {
+                currentSongList.push(song);
+                if (waitingForSong) loadSong();
             }
-            return;
+        } else if (event.type === "error") {
+            streamPending = false;
+            showQuizError("No tracks available for this mode.");
         }
+    };
 
-        const questions = data.questions;
-        if (!Array.isArray(questions) || !questions.length) {
-            hideLoading();
-            if (feedback) {
-                feedback.textContent = "No tracks available for this mode.";
-                feedback.style.color = "#e74c3c";
+    try {
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+
+            let newline;
+            while ((newline = buffered.indexOf("\n")) >= 0) {
+                const line = buffered.slice(0, newline).trim();
+                buffered = buffered.slice(newline + 1);
+                if (line) handleEvent(JSON.parse(line));
             }
-            return;
         }
+        if (buffered.trim()) handleEvent(JSON.parse(buffered));
+    } finally {
+        streamPending = false;
+    }
 
-        const songs = questions.map((q, i) => ({
-            id: 1000 + i,
-            title: q.correct,
-            artist: q.artist,
-            audioFile: q.audio_url,
-            options: Array.isArray(q.options) ? q.options : [q.correct],
-            imageFile: q.image
-        }));
-
-        startGameWithSongs(songs);
-    } catch (err) {
-        console.error("startMode error:", err);
-        hideLoading();
-        if (feedback) {
-            feedback.textContent = "Error contacting backend.";
-            feedback.style.color = "#e74c3c";
-        }
+    if (!received) {
+        showQuizError("No tracks available for this mode.");
+    } else if (waitingForSong) {
+        loadSong();
     }
 }
 
@@ -543,10 +672,21 @@ function startGameWithSongs(songs) {
 // ===========================================================
 function loadSong() {
     if (!currentSongList || currentSongList.length === 0) {
+        if (streamPending) {
+            // Next question is still on its way from the backend
+            waitingForSong = true;
+            if (feedback) {
+                feedback.textContent = "Loading next track...";
+                feedback.style.color = "";
+            }
+            if (nextSongBtn) nextSongBtn.style.display = "none";
+            return;
+        }
         finalizeRun();
         return;
     }
 
+    waitingForSong = false;
     accumulatedPlayMs = 0;
     playStartTime = null;
 
@@ -673,6 +813,13 @@ function finalizeRun() {
 // RESET TO MENU
 // ===========================================================
 function resetToMenu() {
+    if (quizAbort) {
+        quizAbort.abort();
+        quizAbort = null;
+    }
+    streamPending = false;
+    waitingForSong = false;
+
     audioPlayer.pause();
     audioPlayer.currentTime = 0;
 
@@ -0,0 +1,59 @@
+# backendSong/tests/conftest.py
+#
+# Every test runs against bench/fake_upstreams.py: one fake Spotify /
+# iTunes server is started here, before any app module reads config.py,
+# and the app is pointed at it through the environment.
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(TESTS_DIR)
+sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, "bench")]
+
+from fake_upstreams import FakeServer, Upstreams, generate_catalogue  # noqa: E402
+
+CATALOGUE_SIZE = 200
+
+_FAKE = FakeServer(Upstreams(generate_catalogue(CATALOGUE_SIZE))).start()
+
+os.environ.update(_FAKE.env())
+os.environ.update({
+    "CACHE_DIR": tempfile.mkdtemp(prefix="trackguessr-tests-"),
+    "METRICS_DIR": "",
+    "SPOTIFY_CLIENT_ID": "test",
+    "SPOTIFY_CLIENT_SECRET": "test",
+    "ITUNES_RATE_PER_MINUTE": "1000000",
+    "ITUNES_RATE_BURST": "10000",
+    "SPOTIFY_RATE_PER_MINUTE": "1000000",
+    "SPOTIFY_RATE_BURST": "10000",
+    "LOG_LEVEL": "WARNING",
+})
+
+
+@pytest.fixture
+def fake():
+    """The fake upstream server, with its faults and request counts reset."""
+    faults = (_FAKE.upstreams.spotify_faults, _FAKE.upstreams.itunes_faults)
+    saved = [(f.latency, f.error_rate, f.throttle_rate) for f in faults]
+    _FAKE.upstreams.reset_counts()
+    yield _FAKE
+    for f, (latency, error_rate, throttle_rate) in zip(faults, saved):
+        f.latency, f.error_rate, f.throttle_rate = latency, error_rate, throttle_rate
+
+
+@pytest.fixture
+def catalogue():
+    """The fake's Spotify track objects."""
+    return _FAKE.upstreams.tracks
+
+
+@pytest.fixture
+def tracks(catalogue):
+    """The same catalogue as app Track objects."""
+    from track import tracks_from_spotify
+
+    return tracks_from_spotify(catalogue)
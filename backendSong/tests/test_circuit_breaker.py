@@ -0,0 +1,102 @@
+# backendSong/tests/test_circuit_breaker.py
+
+import time
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def breaker(request):
+    # Named per test so the process-wide registry keeps the app's breakers
+    return CircuitBreaker(f"test-{request.node.name}", failure_threshold=2, recovery_timeout=30)
+
+
+def trip(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def recover(breaker):
+    """Let the open period run out, as if recovery_timeout had passed."""
+    breaker.opened_at = time.time() - breaker.recovery_timeout - 1
+
+
+def test_opens_after_threshold_and_rejects(breaker):
+    assert breaker.allow()
+    trip(breaker)
+
+    assert breaker.is_open()
+    assert breaker.allow() is False
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_lets_one_trial_through(breaker):
+    trip(breaker)
+    recover(breaker)
+
+    trial = breaker.allow()
+    assert trial and breaker.state == HALF_OPEN
+    assert breaker.allow() is False
+    assert breaker.half_open_calls == 1
+
+
+def test_releasing_the_trial_frees_the_slot_once(breaker):
+    trip(breaker)
+    recover(breaker)
+    trial = breaker.allow()
+
+    breaker.release(trial)
+    assert breaker.half_open_calls == 0
+
+    second = breaker.allow()
+    assert second
+    breaker.release(trial)  # already released: must not free `second`'s slot
+    assert breaker.half_open_calls == 1
+    assert breaker.allow() is False
+
+
+def test_closed_permit_does_not_free_the_trial_slot(breaker):
+    early = breaker.allow()  # let through while closed, still in flight
+    trip(breaker)
+    recover(breaker)
+    trial = breaker.allow()
+
+    breaker.release(early)
+
+    assert breaker.half_open_calls == 1
+    assert breaker.allow() is False
+    breaker.release(trial)
+    assert breaker.half_open_calls == 0
+
+
+def test_trial_from_an_earlier_half_open_period_is_ignored(breaker):
+    trip(breaker)
+    recover(breaker)
+    old_trial = breaker.allow()
+    breaker.record_failure()  # the trial failed: open again
+    assert breaker.state == OPEN
+
+    recover(breaker)
+    trial = breaker.allow()
+    breaker.release(old_trial)
+
+    assert breaker.half_open_calls == 1
+    assert breaker.allow() is False
+    breaker.release(trial)
+    assert breaker.half_open_calls == 0
+
+
+def test_trial_success_closes(breaker):
+    trip(breaker)
+    recover(breaker)
+    trial = breaker.allow()
+
+    breaker.record_success()
+    breaker.release(trial)
+
+    assert breaker.state == CLOSED
+    assert breaker.half_open_calls == 0
+    assert breaker.allow()
@@ -0,0 +1,66 @@
+# backendSong/tests/test_distractors.py
+
+import random
+
+import pytest
+
+from distractors import DistractorSampler, _title_words
+
+
+@pytest.fixture
+def sampler(tracks):
+    return DistractorSampler(tracks)
+
+
+def test_samples_distinct_titles_other_than_the_answer(tracks, sampler):
+    rng = random.Random(1)
+    titles = {t.name for t in tracks}
+
+    for track in tracks:
+        options = sampler.sample(track.name, 3, rng=rng)
+        assert len(options) == 3
+        assert len(set(options)) == 3
+        assert track.name not in options
+        assert set(options) <= titles
+
+
+def test_duplicate_titles_are_one_option(tracks):
+    sampler = DistractorSampler(tracks[:3] + [tracks[0]] * 5)
+    assert len(sampler) == 3
+
+    options = sampler.sample(tracks[1].name, 5, rng=random.Random(2))
+    assert sorted(options) == sorted([tracks[0].name, tracks[2].name])
+
+
+def test_small_pool_returns_every_other_title(tracks):
+    sampler = DistractorSampler(tracks[:4])
+    options = sampler.sample(tracks[0].name, 10, rng=random.Random(3))
+    assert sorted(options) == sorted(t.name for t in tracks[1:4])
+
+
+def test_answer_outside_the_pool(sampler):
+    options = sampler.sample("Not In The Catalogue", 3, rng=random.Random(4))
+    assert len(set(options)) == 3
+
+
+def test_hard_mode_prefers_same_artist_or_shared_words(tracks, sampler):
+    rng = random.Random(5)
+
+    checked = 0
+    for track in tracks:
+        related = {
+            t.name for t in tracks
+            if t.name != track.name and (
+                set(t.artists) & set(track.artists)
+                or set(_title_words(t.name)) & set(_title_words(track.name))
+            )
+        }
+        if len(related) < 3:
+            continue
+
+        options = sampler.sample(track.name, 3, rng=rng, hard=True)
+        assert len(set(options)) == 3
+        assert track.name not in options
+        assert set(options) <= related
+        checked += 1
+    assert checked
@@ -0,0 +1,56 @@
+# backendSong/tests/test_global_hits.py
+
+import threading
+import time
+
+import pytest
+
+from config import GLOBAL_HITS_MAX_TRACKS
+from global_hits import GlobalHitsCatalogue
+
+
+@pytest.fixture
+def hits(monkeypatch):
+    """A fresh, empty catalogue without its background refresher."""
+    c = GlobalHitsCatalogue(state_path=None)
+    monkeypatch.setattr(c, "_ensure_refresher", lambda: None)
+    return c
+
+
+def test_cold_get_tracks_loads_the_pool(fake, hits):
+    tracks = hits.get_tracks()
+
+    assert len(tracks) == min(GLOBAL_HITS_MAX_TRACKS, len(fake.upstreams.tracks))
+    assert hits.generation == 1
+    assert hits.last_error is None
+
+
+def test_cold_get_tracks_waits_for_refresh_in_flight(fake, hits):
+    fake.upstreams.spotify_faults.latency = 0.1
+    loader = threading.Thread(target=hits.refresh)
+    loader.start()
+    time.sleep(0.02)  # the background refresh now holds _refresh_lock
+
+    tracks = hits.get_tracks()
+    loader.join()
+
+    assert tracks
+    assert hits.generation == 1  # shared the in-flight load, no second one
+
+
+def test_get_tracks_backs_off_after_failed_refresh(fake, hits):
+    fake.upstreams.spotify_faults.error_rate = 1.0
+    assert hits.refresh() is False
+    assert hits.last_failure > 0
+
+    fake.upstreams.spotify_faults.error_rate = 0.0
+    fake.upstreams.reset_counts()
+
+    assert hits.get_tracks() == []
+    assert fake.upstreams.reset_counts() == {}
+
+
+def test_get_tracks_retries_once_backoff_expired(fake, hits):
+    hits.last_failure = time.time() - 31
+
+    assert hits.get_tracks()
@@ -0,0 +1,96 @@
+# backendSong/tests/test_quiz_pool.py
+
+import threading
+import time
+
+import pytest
+
+from quiz_generator import generate_quiz_from_tracks
+from quiz_pool import QuizPool
+
+CAPACITY = 4
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def pool():
+    return QuizPool(capacity=CAPACITY, low_water=2, concurrency=1, refill_pause=0)
+
+
+@pytest.fixture
+def version():
+    """A data version the test can bump, like the catalogue's generation."""
+    return [1]
+
+
+@pytest.fixture
+def builder(tracks, version):
+    """Builds quizzes from the fake catalogue, tagged with the version read."""
+    def build():
+        quiz = generate_quiz_from_tracks(tracks, num_questions=3, resolve_previews=False)
+        quiz["version"] = version[0]
+        return quiz
+    return build
+
+
+def depth(pool):
+    return pool.stats()["hits"]["depth"]
+
+
+def test_refills_to_capacity_and_serves_pooled(pool, builder, version):
+    pool.register("hits", builder, version=lambda: version[0])
+
+    # Starts the workers; served inline unless one already finished a build
+    assert pool.get("hits")["questions"]
+    wait_for(lambda: depth(pool) == CAPACITY)
+    before = pool.stats()["hits"]
+
+    assert pool.get("hits")["questions"]
+    stats = pool.stats()["hits"]
+    assert stats["served_pooled"] == before["served_pooled"] + 1
+    assert stats["served_inline"] == before["served_inline"]
+    assert stats["last_refill_lag_seconds"] is not None
+
+
+def test_drops_quizzes_from_an_older_version(pool, builder, version):
+    pool.register("hits", builder, version=lambda: version[0])
+    pool.get("hits")
+    wait_for(lambda: depth(pool) == CAPACITY)
+
+    before = pool.stats()["hits"]
+
+    version[0] = 2
+    quiz = pool.get("hits")
+
+    assert quiz["version"] == 2
+    stats = pool.stats()["hits"]
+    assert stats["discarded"] == CAPACITY
+    assert stats["served_inline"] == before["served_inline"] + 1
+
+    # The refill is built from the new version only
+    wait_for(lambda: depth(pool) == CAPACITY)
+    assert all(pool.get("hits")["version"] == 2 for _ in range(CAPACITY))
+
+
+def test_discards_a_build_that_raced_a_version_change(pool, builder, version):
+    started, proceed = threading.Event(), threading.Event()
+
+    def slow_builder():
+        started.set()
+        proceed.wait(5)
+        return builder()
+
+    pool.register("hits", slow_builder, version=lambda: version[0])
+    pool._ensure_workers()
+    assert started.wait(5)
+
+    version[0] = 2  # the catalogue changes while the worker is building
+    proceed.set()
+    wait_for(lambda: pool.stats()["hits"]["discarded"] == 1)
@@ -0,0 +1,65 @@
+# backendSong/tests/test_track_matching.py
+
+import pytest
+
+from config import ITUNES_MATCH_THRESHOLD
+from track_matching import best_match
+
+
+def searches(fake):
+    """(track object, its iTunes results) for every catalogue song on iTunes."""
+    for track in fake.upstreams.tracks:
+        artist = track["artists"][0]["name"]
+        results = fake.upstreams.itunes[f"{track['name']} {artist}"]
+        if results:
+            yield track, artist, results
+
+
+def song(track, results):
+    return next(r for r in results if r["previewUrl"].endswith(f"/{track['id']}.m4a"))
+
+
+def test_picks_the_song_over_live_and_karaoke_decoys(fake):
+    checked = 0
+    for track, artist, results in searches(fake):
+        item, score = best_match(results, track["name"], artist, track["duration_ms"])
+        assert item is song(track, results), track["name"]
+        assert score >= ITUNES_MATCH_THRESHOLD
+        checked += 1
+    assert checked
+
+
+@pytest.mark.parametrize("suffix", ["-live.m4a", "-karaoke.m4a"])
+def test_decoys_alone_are_below_the_threshold(fake, suffix):
+    for track, artist, results in searches(fake):
+        if " - Live" in track["name"] and suffix == "-live.m4a":
+            continue  # a live recording's "(Live)" cut is the same song
+        decoys = [r for r in results if r["previewUrl"].endswith(suffix)]
+        item, score = best_match(decoys, track["name"], artist, track["duration_ms"])
+        assert item is None, track["name"]
+        assert score < ITUNES_MATCH_THRESHOLD
+
+
+def test_other_title_is_rejected(fake):
+    track, artist, results = next(searches(fake))
+    item, score = best_match(results, "Completely Different Song", artist, track["duration_ms"])
+    assert item is None
+    assert score < ITUNES_MATCH_THRESHOLD
+
+
+def test_threshold_argument(fake):
+    track, artist, results = next(searches(fake))
+    item, score = best_match(results, track["name"], artist, track["duration_ms"])
+    assert item is not None
+
+    strict, strict_score = best_match(results, track["name"], artist, track["duration_ms"], threshold=score + 0.01)
+    assert strict is None
+    assert strict_score == pytest.approx(score)
+
+    karaoke = [r for r in results if r["previewUrl"].endswith("-karaoke.m4a")]
+    item, _ = best_match(karaoke, track["name"], artist, track["duration_ms"], threshold=0.3)
+    assert item is karaoke[0]
+
+
+def test_no_results():
+    assert best_match([], "Anything") == (None, 0.0)
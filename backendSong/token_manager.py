@@ -0,0 +1,195 @@
+# backendSong/token_manager.py
+
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    TOKEN_STORE_PATH,
+    TOKEN_STORE_SIZE,
+    TOKEN_STORE_TTL,
+    TOKEN_REFRESH_AHEAD,
+    SINGLEFLIGHT_LEASE_TTL,
+)
+from preview_cache import MISS, MemoryLRUCache, SQLiteCache, TieredCache
+from singleflight import SingleFlight
+from logs import get_logger
+
+log = get_logger("tokens")
+
+# A token this close to expiry (seconds) is treated as expired, so it
+# can't run out while a request using it is in flight.
+_EXPIRY_SLACK = 60
+
+
+def new_session_id():
+    """Opaque id that the session cookie carries instead of the tokens."""
+    return secrets.token_urlsafe(32)
+
+
+class TokenManager:
+    """
+    Spotify user tokens, kept server-side and keyed by an opaque session id.
+
+    get() never refreshes a token that still has life in it: if it is
+    within `refresh_ahead` seconds of expiry, a background refresh is
+    queued and the current token returned. Only an already expired token
+    makes the caller wait, and concurrent refreshes of one session
+    (across threads, and across workers through `lease_backend`) are
+    coalesced into a single POST to Spotify.
+
+    `refresh_fn(refresh_token)` does the actual refresh and returns
+    Spotify's token response dict, or None on failure.
+    """
+
+    def __init__(
+        self,
+        backend,
+        refresh_fn,
+        ttl=TOKEN_STORE_TTL,
+        refresh_ahead=TOKEN_REFRESH_AHEAD,
+        lease_backend=None,
+    ):
+        self.backend = backend
+        # Where other workers' refreshes show up first
+        self.shared = getattr(backend, "shared", backend)
+        self.refresh_fn = refresh_fn
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+
+        self._flight = SingleFlight(lease_backend=lease_backend, lease_ttl=SINGLEFLIGHT_LEASE_TTL)
+        # Threads are started lazily on the first submit
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="token-refresh")
+        self._scheduled = set()
+        self._lock = threading.Lock()
+
+        self.refreshes = 0
+        self.background_refreshes = 0
+        self.refresh_failures = 0
+
+    @staticmethod
+    def _key(sid):
+        return f"token:{sid}"
+
+    def save(self, sid, access_token, refresh_token, expires_at):
+        record = {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "expires_at": expires_at,
+        }
+        self.backend.set(self._key(sid), record, self.ttl)
+        return record
+
+    def forget(self, sid):
+        if sid:
+            self.backend.delete(self._key(sid))
+
+    def get(self, sid):
+        """A usable access token for this session, or None (logged out / refresh failed)."""
+        if not sid:
+            return None
+        record = self.backend.get(self._key(sid))
+        if record is MISS:
+            return None
+
+        remaining = record["expires_at"] - time.time()
+        if remaining > _EXPIRY_SLACK:
+            if remaining < self.refresh_ahead:
+                self._refresh_in_background(sid)
+            return record["access_token"]
+
+        # Expired: this caller has to wait, but shares the refresh
+        return self._refresh(sid)
+
+    def _fresh_token(self, record):
+        if record is MISS:
+            return None
+        if record["expires_at"] - time.time() > self.refresh_ahead:
+            return record["access_token"]
+        return None
+
+    def _refresh(self, sid):
+        key = self._key(sid)
+
+        def peek():
+            token = self._fresh_token(self.shared.get(key))
+            return token if token else MISS
+
+        return self._flight.do(key, self._do_refresh, sid, peek=peek)
+
+    def _do_refresh(self, sid):
+        key = self._key(sid)
+        record = self.shared.get(key)
+        if record is MISS:
+            return None  # logged out meanwhile
+
+        token = self._fresh_token(record)
+        if token:
+            # Another worker refreshed it already; pick that up locally
+            self.backend.set(key, record, self.ttl)
+            return token
+
+        if not record.get("refresh_token"):
+            return None
+
+        tokens = self.refresh_fn(record["refresh_token"])
+        if not tokens:
+            self.refresh_failures += 1
+            return None
+
+        self.refreshes += 1
+        record = self.save(
+            sid,
+            tokens["access_token"],
+            # Spotify may or may not rotate the refresh token
+            tokens.get("refresh_token") or record["refresh_token"],
+            time.time() + tokens.get("expires_in", 3600),
+        )
+        return record["access_token"]
+
+    def _refresh_in_background(self, sid):
+        with self._lock:
+            if sid in self._scheduled:
+                return
+            self._scheduled.add(sid)
+        self._executor.submit(self._background_refresh, sid)
+
+    def _background_refresh(self, sid):
+        try:
+            self.background_refreshes += 1
+            self._refresh(sid)
+        except Exception:
+            log.exception("background_token_refresh_failed")
+        finally:
+            with self._lock:
+                self._scheduled.discard(sid)
+
+    def stats(self):
+        return {
+            "refreshes": self.refreshes,
+            "background_refreshes": self.background_refreshes,
+            "refresh_failures": self.refresh_failures,
+            "singleflight": self._flight.stats(),
+            "store": self.backend.stats(),
+        }
+
+
+def build_token_manager(refresh_fn):
+    """
+    Token manager from config: an in-process LRU, backed by a host-wide
+    SQLite file (readable by this user only) when TOKEN_STORE_PATH is set.
+    """
+    local = MemoryLRUCache(maxsize=TOKEN_STORE_SIZE)
+    if not TOKEN_STORE_PATH:
+        return TokenManager(local, refresh_fn)
+
+    try:
+        # Refresh tokens are stored in plain text: owner-only, WAL included
+        shared = SQLiteCache(TOKEN_STORE_PATH, mode=0o600)
+    except (sqlite3.Error, OSError) as e:
+        log.warning("token_store_sqlite_unavailable", error=str(e))
+        return TokenManager(local, refresh_fn)
+
+    return TokenManager(TieredCache(local, shared), refresh_fn, lease_backend=shared)
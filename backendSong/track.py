@@ -0,0 +1,174 @@
+# backendSong/track.py
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Joined artist credits, as bulk exports and iTunes write them:
+# "A & B", "A, B & C", "A feat. B", "A ft B", "A featuring B"
+_CREDIT_SEPARATOR_RE = re.compile(r"\s*(?:,|&|\b(?:feat|ft)\b\.?|\bfeaturing\b)\s*", re.IGNORECASE)
+
+
+class Track:
+    """
+    Compact record of just the Spotify track fields the quiz uses.
+
+    Spotify track objects carry full album objects, image lists and
+    ~180-entry available_markets arrays; we convert them to these records
+    as soon as they leave spotify_client, so caches and quiz generation
+    only ever hold (and walk) a handful of plain attributes.
+    """
+
+    __slots__ = (
+        "id", "name", "artists", "image", "preview_url", "external_url", "duration_ms", "isrc",
+    )
+
+    def __init__(
+        self,
+        id: Optional[str],
+        name: str,
+        artists: Tuple[str, ...] = (),
+        image: Optional[str] = None,
+        preview_url: Optional[str] = None,
+        external_url: Optional[str] = None,
+        duration_ms: Optional[int] = None,
+        isrc: Optional[str] = None,
+    ):
+        self.id = id
+        self.name = name
+        self.artists = artists
+        self.image = image
+        self.preview_url = preview_url
+        self.external_url = external_url
+        # Used to match iTunes fallback previews (see track_matching)
+        self.duration_ms = duration_ms
+        self.isrc = isrc
+
+    @classmethod
+    def from_spotify(cls, obj: Any) -> Optional["Track"]:
+        """
+        Build a record from a Spotify track object.
+        Returns None for None / malformed entries or tracks without a title.
+        """
+        if isinstance(obj, Track):
+            return obj
+        if not isinstance(obj, dict):
+            return None
+
+        name = obj.get("name")
+        if not isinstance(name, str) or not name.strip():
+            return None
+
+        return cls(
+            id=obj.get("id"),
+            name=name,
+            artists=_artist_names(obj),
+            image=_album_image_url(obj),
+            preview_url=obj.get("preview_url") or None,
+            external_url=(obj.get("external_urls") or {}).get("spotify"),
+            duration_ms=_duration_ms(obj),
+            isrc=_isrc(obj),
+        )
+
+    @property
+    def artist_names(self) -> str:
+        """'Artist 1, Artist 2'"""
+        return ", ".join(self.artists)
+
+    @property
+    def primary_artist(self) -> Optional[str]:
+        return self.artists[0] if self.artists else None
+
+    def with_preview(self, preview_url: Optional[str]) -> "Track":
+        """Copy of this record with a different preview URL."""
+        return Track(
+            self.id, self.name, self.artists, self.image, preview_url, self.external_url,
+            self.duration_ms, self.isrc,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "artists": list(self.artists),
+            "image": self.image,
+            "preview_url": self.preview_url,
+            "external_url": self.external_url,
+            "duration_ms": self.duration_ms,
+            "isrc": self.isrc,
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Track":
+        return cls(
+            id=d.get("id"),
+            name=d["name"],
+            artists=tuple(d.get("artists") or ()),
+            image=d.get("image"),
+            preview_url=d.get("preview_url"),
+            external_url=d.get("external_url"),
+            duration_ms=d.get("duration_ms"),
+            isrc=d.get("isrc"),
+        )
+
+    def to_row(self) -> List[Any]:
+        """Positional form (field order of __slots__): a much smaller JSON payload than to_dict()."""
+        return [
+            self.id, self.name, list(self.artists), self.image, self.preview_url,
+            self.external_url, self.duration_ms, self.isrc,
+        ]
+
+    @classmethod
+    def from_row(cls, row: List[Any]) -> "Track":
+        return cls(row[0], row[1], tuple(row[2]), *row[3:])
+
+    def __repr__(self):
+        return f"Track({self.id!r}, {self.name!r}, {self.artist_names!r})"
+
+
+def tracks_from_spotify(items: Iterable[Any]) -> List[Track]:
+    """Convert Spotify track objects, silently dropping unusable ones."""
+    records = []
+    for obj in items:
+        track = Track.from_spotify(obj)
+        if track is not None:
+            records.append(track)
+    return records
+
+
+def split_artists(credit: Optional[str]) -> Tuple[str, ...]:
+    """
+    A joined credit as separate artists: "A feat. B & C" -> ("A", "B", "C").
+    The first is what Track.primary_artist would be for a Spotify track
+    listing them separately.
+    """
+    return tuple(name for name in _CREDIT_SEPARATOR_RE.split(credit or "") if name)
+
+
+def _artist_names(obj: Dict[str, Any]) -> Tuple[str, ...]:
+    artists = obj.get("artists") or []
+    return tuple(
+        a["name"] for a in artists
+        if isinstance(a, dict) and isinstance(a.get("name"), str) and a["name"]
+    )
+
+
+def _album_image_url(obj: Dict[str, Any]) -> Optional[str]:
+    album = obj.get("album") or {}
+    images = album.get("images") if isinstance(album, dict) else None
+    if images and isinstance(images, list):
+        # Usually largest first
+        first = images[0]
+        if isinstance(first, dict):
+            return first.get("url")
+    return None
+
+
+def _duration_ms(obj: Dict[str, Any]) -> Optional[int]:
+    duration = obj.get("duration_ms")
+    return duration if isinstance(duration, int) and duration > 0 else None
+
+
+def _isrc(obj: Dict[str, Any]) -> Optional[str]:
+    ids = obj.get("external_ids")
+    isrc = ids.get("isrc") if isinstance(ids, dict) else None
+    return isrc.strip().upper() if isinstance(isrc, str) and isrc.strip() else None
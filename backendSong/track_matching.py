@@ -0,0 +1,190 @@
+# backendSong/track_matching.py
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from config import ITUNES_MATCH_THRESHOLD
+
+# Dropped / rewritten before tokenising: apostrophes join words ("don't"
+# -> "dont"), "&" means "and".
+_FOLD = str.maketrans({"'": None, "’": None, "`": None, "&": " and "})
+
+# Everything that is decoration rather than the title itself, in one pass:
+# (...) and [...] groups, " - Remastered 2011" style suffixes and
+# "feat. X" tails.
+_DECORATION_RE = re.compile(
+    r"\([^)]*\)|\[[^\]]*\]|\s[-–—]\s.*$|\b(?:feat|ft|featuring)\b.*$"
+)
+_WORD_RE = re.compile(r"\w+")
+
+# Words that mark a different recording of the same song. A candidate
+# carrying one the Spotify title doesn't is very likely the wrong audio.
+_VERSION_WORDS = frozenset(
+    "live acoustic instrumental karaoke remix cover demo sped slowed reverb".split()
+)
+
+# Weights of the score components (renormalised over the ones we know)
+_TITLE_WEIGHT = 0.6
+_ARTIST_WEIGHT = 0.25
+_DURATION_WEIGHT = 0.15
+
+# Durations this close (ms) count as identical, this far apart as unrelated
+_DURATION_EXACT = 2000
+_DURATION_MAX = 15000
+
+
+def _fold(s: str) -> str:
+    """Lowercase, strip accents ("Beyoncé" -> "beyonce") and apostrophes."""
+    s = unicodedata.normalize("NFKD", s.casefold())
+    if not s.isascii():
+        s = "".join(c for c in s if not unicodedata.combining(c))
+    return s.translate(_FOLD)
+
+
+@lru_cache(maxsize=16384)
+def normalize_title(s: str) -> str:
+    """
+    Normalize song titles so we can compare iTunes results to the
+    expected track name more robustly.
+
+    Examples:
+      "Bound 2 (Album Version)"        -> "bound 2"
+      "Bound 2 - Radio Edit"           -> "bound 2"
+      "Heartless"                      -> "heartless"
+      "Déjà Vu (feat. Someone)"        -> "deja vu"
+    """
+    if not s:
+        return ""
+    folded = _fold(s)
+    words = _WORD_RE.findall(_DECORATION_RE.sub(" ", folded))
+    # A title that is all decoration ("(Intro)") keeps its words
+    return " ".join(words or _WORD_RE.findall(folded))
+
+
+@lru_cache(maxsize=16384)
+def normalize_artist(s: str) -> str:
+    """Artist names as plain words: "Beyoncé & JAY-Z" -> "beyonce and jay z"."""
+    return " ".join(_WORD_RE.findall(_fold(s or "")))
+
+
+@lru_cache(maxsize=16384)
+def _title_tokens(s: str) -> FrozenSet[str]:
+    return frozenset(normalize_title(s).split())
+
+
+@lru_cache(maxsize=16384)
+def _name_tokens(s: str) -> FrozenSet[str]:
+    # Artist names: no decoration to strip, just words
+    return frozenset(_WORD_RE.findall(_fold(s or "")))
+
+
+@lru_cache(maxsize=16384)
+def _version_words(s: str) -> FrozenSet[str]:
+    # Looked for in the *whole* title, decoration included
+    return _VERSION_WORDS.intersection(_WORD_RE.findall(_fold(s or "")))
+
+
+def _overlap(wanted: FrozenSet[str], got: FrozenSet[str]) -> float:
+    """Dice coefficient of two token sets (1.0 = same words)."""
+    if not wanted or not got:
+        return 0.0
+    return 2 * len(wanted & got) / (len(wanted) + len(got))
+
+
+def title_score(wanted: str, got: str) -> float:
+    if normalize_title(wanted) == normalize_title(got):
+        return 1.0
+    return _overlap(_title_tokens(wanted), _title_tokens(got))
+
+
+def artist_score(wanted: str, got: str) -> float:
+    """Share of the wanted artist's words found in the candidate's artist."""
+    wanted_tokens = _name_tokens(wanted)
+    if not wanted_tokens:
+        return 0.0
+    # iTunes lists collaborations as "A & B" / "A, B & C"
+    return len(wanted_tokens & _name_tokens(got)) / len(wanted_tokens)
+
+
+def duration_score(wanted_ms: int, got_ms: int) -> float:
+    diff = abs(wanted_ms - got_ms)
+    if diff <= _DURATION_EXACT:
+        return 1.0
+    if diff >= _DURATION_MAX:
+        return 0.0
+    return 1.0 - (diff - _DURATION_EXACT) / (_DURATION_MAX - _DURATION_EXACT)
+
+
+def score_candidate(
+    item: Dict[str, Any],
+    track: str,
+    artist: Optional[str] = None,
+    duration_ms: Optional[int] = None,
+) -> float:
+    """
+    How well an iTunes search result matches a Spotify track, 0..1.
+
+    Combines title word overlap, artist agreement and duration closeness
+    (components we have no data for are left out). A candidate by an
+    unrelated artist, or with an extra "live" / "remix" / ... in its
+    title, has its score halved. iTunes Search results carry no ISRC, so
+    ISRCs only ever match through the offline index (preview_index).
+    """
+    title = item.get("trackName") or item.get("collectionName")
+    if not title:
+        return 0.0
+
+    t_score = title_score(track, title)
+    if t_score < 0.5:
+        # Different song, whatever else agrees
+        return 0.0
+
+    total = _TITLE_WEIGHT * t_score
+    weight = _TITLE_WEIGHT
+
+    a_score = None
+    if artist and item.get("artistName"):
+        a_score = artist_score(artist, item["artistName"])
+        total += _ARTIST_WEIGHT * a_score
+        weight += _ARTIST_WEIGHT
+
+    got_ms = item.get("trackTimeMillis")
+    if duration_ms and isinstance(got_ms, int) and got_ms > 0:
+        total += _DURATION_WEIGHT * duration_score(duration_ms, got_ms)
+        weight += _DURATION_WEIGHT
+
+    score = total / weight
+    if a_score == 0.0:
+        # Same title by someone else: most likely a cover
+        score *= 0.5
+    if _version_words(title) - _version_words(track):
+        score *= 0.5
+    return score
+
+
+def best_match(
+    results: Iterable[Dict[str, Any]],
+    track: str,
+    artist: Optional[str] = None,
+    duration_ms: Optional[int] = None,
+    threshold: float = ITUNES_MATCH_THRESHOLD,
+) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    The highest-scoring result that has a preview, as (item, score), or
+    (None, best score seen) if none reaches `threshold`.
+    """
+    best, best_score = None, 0.0
+    for item in results:
+        if not isinstance(item, dict) or not item.get("previewUrl"):
+            continue
+        score = score_candidate(item, track, artist, duration_ms)
+        if score > best_score:
+            best, best_score = item, score
+            if score >= 1.0:
+                break
+
+    if best_score < threshold:
+        return None, best_score
+    return best, best_score